@@ -0,0 +1,114 @@
+"""
+Chunker throughput and chunk-size benchmark: the current tokenizer-based chunker
+against the previous NLTK/word-count chunker.
+
+Usage (from the repository root):
+
+    python -m benchmarks.chunker_benchmark --pages 2000 --words-per-page 400 --output chunker.json
+
+Half of the pages are prose with sentence punctuation, the other half look like OCR
+output (long runs without sentence ends). For each chunker the report gives pages and
+characters per second, the number of chunks and how many of them exceed the embedding
+model's sequence length, i.e. would be silently truncated when embedded.
+"""
+import json
+import time
+import random
+import argparse
+
+from benchmarks.synthetic_corpus import make_page_text
+from benchmarks.run_benchmark import git_revision
+
+def legacy_split_text_to_chunks(text, max_tokens=256):
+    """The chunker before the tokenizer-based rewrite: NLTK sentences, tokens counted as words."""
+    from nltk.tokenize import sent_tokenize
+
+    sentences = sent_tokenize(text)
+    chunks = []
+    chunk = []
+    total_tokens = 0
+    for sentence in sentences:
+        sentence_tokens = len(sentence.split())
+        if total_tokens + sentence_tokens > max_tokens:
+            chunks.append(' '.join(chunk))
+            chunk = [sentence]
+            total_tokens = sentence_tokens
+        else:
+            chunk.append(sentence)
+            total_tokens += sentence_tokens
+    if chunk:
+        chunks.append(' '.join(chunk))
+    return chunks
+
+def make_pages(count, words_per_page, seed=0):
+    """Return count page texts, alternating prose and punctuation-free OCR-like text."""
+    rng = random.Random(seed)
+    pages = []
+    for i in range(count):
+        text = make_page_text(rng, words_per_page)
+        if i % 2:
+            text = text.replace('.', '').lower()
+        pages.append(text)
+    return pages
+
+def measure(name, chunk_page, pages, tokenizer, max_tokens):
+    """Chunk every page with chunk_page and report throughput and oversized chunks."""
+    start = time.perf_counter()
+    chunks = [chunk for page in pages for chunk in chunk_page(page)]
+    seconds = time.perf_counter() - start
+    lengths = [len(ids) for ids in tokenizer(chunks, add_special_tokens=True)['input_ids']] if chunks else []
+    characters = sum(len(page) for page in pages)
+    return {
+        'chunker': name,
+        'seconds': round(seconds, 4),
+        'pages_per_second': round(len(pages) / max(seconds, 1e-9), 1),
+        'chars_per_second': round(characters / max(seconds, 1e-9)),
+        'chunks': len(chunks),
+        'empty_chunks': sum(1 for chunk in chunks if not chunk.strip()),
+        'max_chunk_tokens': max(lengths, default=0),
+        'oversized_chunks': sum(1 for length in lengths if length > max_tokens)
+    }
+
+def run(args):
+    """Run both chunkers over the same pages and build the report."""
+    from utils.embedding import get_tokenizer, split_text_to_chunks
+
+    tokenizer = get_tokenizer()
+    pages = make_pages(args.pages, args.words_per_page, args.seed)
+    # Warm up the tokenizer so the first measurement does not pay for its initialisation
+    split_text_to_chunks(pages[0], args.max_tokens, args.overlap_tokens, tokenizer)
+
+    results = [measure('tokenizer', lambda page: split_text_to_chunks(page, args.max_tokens, args.overlap_tokens,
+                                                                      tokenizer),
+                       pages, tokenizer, args.max_tokens)]
+    try:
+        legacy_split_text_to_chunks(pages[0], args.max_tokens)
+        results.append(measure('legacy', lambda page: legacy_split_text_to_chunks(page, args.max_tokens),
+                               pages, tokenizer, args.max_tokens))
+    except (ImportError, LookupError) as e:
+        print(f"Skipping the legacy chunker (NLTK or its punkt data is not installed): {e}")
+    return {'revision': git_revision(), 'params': vars(args), 'results': results}
+
+def parse_args(argv=None):
+    """Parse the chunker benchmark command line arguments."""
+    parser = argparse.ArgumentParser(description="DocQA chunker benchmark")
+    parser.add_argument('--pages', type=int, default=1000)
+    parser.add_argument('--words-per-page', type=int, default=400)
+    parser.add_argument('--max-tokens', type=int, default=256)
+    parser.add_argument('--overlap-tokens', type=int, default=32)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Write the JSON report here instead of stdout.")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    """Run the chunker benchmark and write the JSON report."""
+    args = parse_args(argv)
+    text = json.dumps(run(args), indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
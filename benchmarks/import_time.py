@@ -0,0 +1,87 @@
+"""
+Startup import-time budget for the CLI entry point.
+
+Usage (from the repository root):
+
+    python -m benchmarks.import_time --budget-ms 150 --output import_time.json
+
+`import main` is run in fresh interpreters with `-X importtime`, and the fastest run is
+reported together with the slowest imported modules. Heavy dependencies (torch,
+sentence-transformers, chromadb, OpenCV, pandas, openai, ...) must load on first use,
+not at import time. The exit status is non-zero when the import exceeds the budget or
+pulls in one of them, so the check can run in CI.
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+from benchmarks.run_benchmark import git_revision
+
+HEAVY_MODULES = ('torch', 'sentence_transformers', 'transformers', 'chromadb', 'cv2', 'numpy', 'pandas',
+                 'openai', 'pytesseract', 'pdf2image', 'PyPDF2', 'tqdm', 'PIL')
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def measure_import(module='main'):
+    """
+    Import module in a fresh interpreter and parse its -X importtime output.
+
+    Returns:
+    tuple: The total import time in milliseconds, {module: cumulative ms} for every
+           imported module, and the heavy modules that ended up in sys.modules.
+    """
+    code = (f"import sys, json, {module}; "
+            f"print(json.dumps([m for m in {list(HEAVY_MODULES)!r} if m in sys.modules]))")
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=REPO_ROOT,
+                               capture_output=True, text=True, check=True)
+    cumulative = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_us, name = (field.strip() for field in line[len('import time:'):].split('|'))
+        cumulative[name] = int(cumulative_us) / 1000
+    return cumulative.get(module, 0.0), cumulative, json.loads(completed.stdout.strip().splitlines()[-1])
+
+def run(args):
+    """Measure the import repeatedly and build the report."""
+    runs = [measure_import(args.module) for _ in range(args.repeat)]
+    total_ms, cumulative, heavy = min(runs, key=lambda run: run[0])
+    slowest = sorted(cumulative.items(), key=lambda item: item[1], reverse=True)[:args.top]
+    return {
+        'revision': git_revision(),
+        'module': args.module,
+        'import_ms': round(total_ms, 1),
+        'all_runs_ms': [round(run[0], 1) for run in runs],
+        'budget_ms': args.budget_ms,
+        'heavy_modules_loaded': heavy,
+        'slowest_modules_ms': {name: round(ms, 1) for name, ms in slowest},
+        'within_budget': total_ms <= args.budget_ms and not heavy
+    }
+
+def parse_args(argv=None):
+    """Parse the import-time benchmark command line arguments."""
+    parser = argparse.ArgumentParser(description="DocQA startup import-time budget")
+    parser.add_argument('--module', default='main', help="Module to import.")
+    parser.add_argument('--repeat', type=int, default=5, help="Fresh interpreters to try; the fastest counts.")
+    parser.add_argument('--budget-ms', type=float, default=150.0)
+    parser.add_argument('--top', type=int, default=15, help="Number of slowest modules to list.")
+    parser.add_argument('--output', help="Write the JSON report here instead of stdout.")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    """Run the import-time benchmark, write the JSON report and exit non-zero over budget."""
+    args = parse_args(argv)
+    report = run(args)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if not report['within_budget']:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+OCR preprocessing benchmark: the current region-based pipeline against the previous
+global-threshold, full-page pipeline.
+
+Usage (from the repository root):
+
+    python -m benchmarks.ocr_benchmark --pages 10 --dpi 200 --output ocr.json
+
+Two kinds of pages are rendered. Scanned pages are full pages of text (half of them
+with uneven lighting and speckle); they are OCRed in full. Figure pages are half text,
+half a labelled diagram, standing in for text-layer pages with an embedded figure; the
+current pipeline OCRs only their figure, the previous one had to OCR the whole page.
+For each pipeline and page kind the report gives the preprocessing and total time per
+page, the pixels sent to Tesseract, and the recall of the words (scanned pages) or
+figure labels (figure pages). Without Tesseract only the preprocessing is measured.
+"""
+import re
+import json
+import time
+import random
+import argparse
+
+from benchmarks.synthetic_corpus import make_page_text, render_page
+from benchmarks.run_benchmark import git_revision
+
+WORD_PATTERN = re.compile(r"[a-z0-9-]+")
+
+def legacy_preprocess(image):
+    """The preprocessing before the region-based rewrite: 5x5 blur and a global threshold at 150."""
+    import cv2
+    import numpy as np
+
+    gray = cv2.cvtColor(cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR), cv2.COLOR_BGR2GRAY)
+    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+    _, thresh = cv2.threshold(blurred, 150, 255, cv2.THRESH_BINARY_INV)
+    return thresh
+
+def legacy_ocr(image):
+    """The OCR before the region-based rewrite: the whole preprocessed page with --psm 6."""
+    from utils import metrics
+    from utils.ocr import _pytesseract
+
+    binary = legacy_preprocess(image)
+    metrics.increment('ocr.pixels', int(binary.size))
+    return _pytesseract().image_to_string(binary, config='--oem 1 --psm 6').strip()
+
+def current_preprocess(image):
+    """The preprocessing and region detection of the current pipeline."""
+    import numpy as np
+    from utils.ocr import preprocess_image, detect_regions
+
+    return detect_regions(preprocess_image(np.asarray(image.convert('L'))))
+
+def word_recall(expected, text):
+    """Return the fraction of the expected words that appear in the OCR output."""
+    expected = WORD_PATTERN.findall(expected.lower())
+    found = set(WORD_PATTERN.findall(text.lower()))
+    return sum(1 for word in expected if word in found) / max(len(expected), 1)
+
+def make_pages(args):
+    """Render the scanned and figure pages with their expected text."""
+    rng = random.Random(args.seed)
+    pages = []
+    for i in range(args.pages):
+        text = make_page_text(rng, 250)
+        pages.append({'kind': 'scanned', 'expected': text,
+                      'image': render_page(text, args.dpi, degrade=bool(i % 2), seed=i)})
+    for i in range(args.pages):
+        labels = [f"PN-{rng.randint(10000, 99999)} {rng.randint(10, 90)} Nm" for _ in range(4)]
+        pages.append({'kind': 'figure', 'expected': " ".join(labels),
+                      'image': render_page(make_page_text(rng, 150), args.dpi, figure_labels=labels, seed=i)})
+    return pages
+
+def measure(name, preprocess, ocr, pages, kind):
+    """Preprocess and, if ocr is given, OCR every page of one kind with one pipeline."""
+    from utils import metrics
+
+    pages = [page for page in pages if page['kind'] == kind]
+    start = time.perf_counter()
+    for page in pages:
+        preprocess(page['image'])
+    preprocess_seconds = time.perf_counter() - start
+    result = {'pipeline': name, 'pages': kind, 'preprocess_ms': round(1000 * preprocess_seconds / len(pages), 2)}
+    if ocr is None:
+        return result
+
+    metrics.reset()
+    start = time.perf_counter()
+    texts = [ocr(page['image']) for page in pages]
+    seconds = time.perf_counter() - start
+    result.update({
+        'page_ms': round(1000 * seconds / len(pages), 1),
+        'megapixels_ocred': round(metrics.snapshot()['counters'].get('ocr.pixels', 0) / 1e6, 2),
+        'recall': round(sum(word_recall(page['expected'], text) for page, text in zip(pages, texts)) / len(pages), 4)
+    })
+    return result
+
+def tesseract_available():
+    """Return True if pytesseract and the Tesseract executable can be used."""
+    try:
+        from utils.ocr import _pytesseract
+        _pytesseract().get_tesseract_version()
+        return True
+    except Exception:
+        return False
+
+def run(args):
+    """Run both pipelines over the same pages and build the report."""
+    from utils import metrics
+    from utils.ocr import ocr_page_image
+
+    metrics.enable_metrics(True)
+    pages = make_pages(args)
+    with_ocr = tesseract_available()
+    if not with_ocr:
+        print("Tesseract is not installed; measuring preprocessing only.")
+    results = []
+    for kind in ('scanned', 'figure'):
+        figures_only = kind == 'figure'
+        results.append(measure('legacy', legacy_preprocess, legacy_ocr if with_ocr else None, pages, kind))
+        results.append(measure('regions', current_preprocess,
+                               (lambda image: ocr_page_image(image, figures_only)) if with_ocr else None, pages, kind))
+    return {'revision': git_revision(), 'params': vars(args), 'tesseract': with_ocr, 'results': results}
+
+def parse_args(argv=None):
+    """Parse the OCR benchmark command line arguments."""
+    parser = argparse.ArgumentParser(description="DocQA OCR preprocessing benchmark")
+    parser.add_argument('--pages', type=int, default=6, help="Pages of each kind.")
+    parser.add_argument('--dpi', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Write the JSON report here instead of stdout.")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    """Run the OCR benchmark and write the JSON report."""
+    args = parse_args(argv)
+    text = json.dumps(run(args), indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""
+End-to-end DocQA benchmark on a synthetic corpus with a stub LLM.
+
+Usage (from the repository root):
+
+    python -m benchmarks.run_benchmark --text-docs 20 --scanned-docs 2 --pages 10 --output bench.json
+
+The corpus is ingested with ingest_documents and the questions are answered with
+answer_queries, the same entry points main.py and batch mode use, so a change to any
+part of them shows up in the numbers. The result is written as JSON: the wall-clock
+time of the cold and warm ingestion runs and of the query path, the per-stage
+histograms recorded by utils.metrics, retrieval/answer accuracy against the known
+facts of the corpus, and peak memory.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+from contextlib import contextmanager
+
+from benchmarks.synthetic_corpus import generate_corpus
+from benchmarks.stub_llm import start_stub_server
+
+class StageTimer:
+    """Accumulates wall-clock time and call counts per named stage."""
+
+    def __init__(self):
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name, count=1):
+        """Time the enclosed block and add count items to the stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            entry = self.stages.setdefault(name, {'seconds': 0.0, 'count': 0})
+            entry['seconds'] += time.perf_counter() - start
+            entry['count'] += count
+
+    def report(self):
+        """Return total seconds, item count and mean milliseconds per item for every stage."""
+        return {name: {'seconds': round(entry['seconds'], 4), 'count': entry['count'],
+                       'mean_ms': round(1000 * entry['seconds'] / max(entry['count'], 1), 3)}
+                for name, entry in self.stages.items()}
+
+def peak_memory_mb():
+    """Return the peak resident set size of this process and its children, in MiB."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return {
+        'self': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2 ** 20, 1),
+        'children': round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale / 2 ** 20, 1)
+    }
+
+def directory_size_mb(path):
+    """Return the total size of the files under path, in MiB."""
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return round(total / 2 ** 20, 2)
+
+def git_revision():
+    """Return the short hash of the checked-out commit, or None outside a git checkout."""
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+def run(args):
+    """
+    Generate the corpus, ingest it and answer its questions through the production entry
+    points, and build the report.
+
+    Args:
+    args (argparse.Namespace): The parsed command line arguments.
+
+    Returns:
+    dict: The benchmark report.
+    """
+    from utils.llm import configure_openai
+    from utils import metrics
+    from utils.ingest import ingest_documents
+    from utils.embedding import get_embedding_model
+    from utils.search import hybrid_search, batch_hybrid_search
+    from utils.query_engine import answer_queries
+
+    timer = StageTimer()
+    metrics.enable_metrics(True)
+    workdir = args.workdir or tempfile.mkdtemp(prefix='docqa_bench_')
+    corpus_dir = os.path.join(workdir, 'documents')
+    index_dir = os.path.join(workdir, 'vector_store')
+    document_store_path = os.path.join(workdir, 'processed_documents.sqlite')
+    shutil.rmtree(index_dir, ignore_errors=True)
+    if os.path.exists(document_store_path):
+        os.remove(document_store_path)
+
+    with timer.stage('generate_corpus'):
+        facts = generate_corpus(corpus_dir, args.text_docs, args.scanned_docs, args.pages,
+                                args.words_per_page, args.facts_per_doc, args.seed)
+
+    stub_server, api_base = start_stub_server()
+    config = {
+        'openai_api_key': 'stub',
+        'openai_api_base': api_base,
+        'document_store_path': document_store_path,
+        # Never import a processed_documents.json from the working directory
+        'processed_documents_path': os.path.join(workdir, 'processed_documents.json'),
+        'vector_store_path': index_dir,
+        'vector_backend': args.vector_backend,
+        'vector_quantization': args.vector_quantization,
+        'embedding_batch_size': args.batch_size,
+        'chunk_max_tokens': args.chunk_max_tokens,
+        'chunk_overlap_tokens': args.chunk_overlap_tokens,
+        'ocr_dpi': args.ocr_dpi,
+        'ocr_min_text_chars': args.ocr_min_text_chars,
+        'ocr_figures': args.ocr_figures,
+        'gpt_model': 'stub',
+        'rerank_mode': args.rerank_mode,
+        'rerank_top_k': args.rerank_top_k,
+        'context_max_tokens': args.context_max_tokens,
+        'max_concurrency': args.max_concurrency
+    }
+    configure_openai(config)
+
+    with timer.stage('load_embedding_model'):
+        embedding_model = get_embedding_model()
+
+    # Ingestion as main.py runs it: a cold run over the new corpus, then a warm run with nothing to do
+    with timer.stage('ingest'):
+        document_store, vector_store = ingest_documents(corpus_dir, config, embedding_model)
+    if vector_store is None:
+        raise RuntimeError("Ingestion failed.")
+    ingest_metrics = metrics.snapshot()
+    document_store.close()
+    with timer.stage('ingest_warm'):
+        document_store, vector_store = ingest_documents(corpus_dir, config, embedding_model)
+
+    # Query path
+    queries = facts[:args.queries]
+    questions = [fact['question'] for fact in queries]
+    retrieval_hits = answer_hits = page_hits = batch_mismatches = 0
+    with timer.stage('search_batch', count=len(queries)):
+        batch_searches = batch_hybrid_search(questions, vector_store, embedding_model)
+    for fact, batch_search in zip(queries, batch_searches):
+        with timer.stage('search'):
+            _, _, ids = hybrid_search(fact['question'], vector_store, embedding_model)
+        batch_mismatches += batch_search[2] != ids
+        retrieval_hits += any(fact['part'] in result for result in batch_search[0])
+    # Concurrent rerank, context assembly and answers, as batch mode runs them
+    with timer.stage('answer_queries', count=len(queries)):
+        results = answer_queries(questions, vector_store, embedding_model, config)
+    for fact, result in zip(queries, results):
+        answer_hits += str(fact['torque']) in result['answer']
+        page_hits += result['source_file'] == fact['file_name'] and result['page_number'] == fact['page_number']
+    context_tokens = [result.get('context_tokens', 0) for result in results]
+    prompt_tokens = [result.get('prompt_tokens', 0) for result in results]
+
+    stub_server.shutdown()
+    counters = ingest_metrics['counters']
+    report = {
+        'revision': git_revision(),
+        'params': vars(args),
+        'corpus': {'documents': len(document_store),
+                   'pages': sum(len(doc['pages']) for doc in document_store.iter_documents()),
+                   'chunks': counters.get('chunk.count', 0),
+                   'duplicate_chunks': counters.get('dedup.duplicates', 0),
+                   'queries': len(queries)},
+        'stages': timer.report(),
+        'tokens': {
+            'mean_context_tokens': round(sum(context_tokens) / max(len(context_tokens), 1), 1),
+            'max_context_tokens': max(context_tokens, default=0),
+            'mean_prompt_tokens': round(sum(prompt_tokens) / max(len(prompt_tokens), 1), 1)
+        },
+        'accuracy': {
+            'retrieval_recall': round(retrieval_hits / max(len(queries), 1), 4),
+            'answer_accuracy': round(answer_hits / max(len(queries), 1), 4),
+            'page_accuracy': round(page_hits / max(len(queries), 1), 4),
+            'batch_search_mismatches': batch_mismatches
+        },
+        'index_size_mb': directory_size_mb(index_dir),
+        'peak_memory_mb': peak_memory_mb(),
+        # Per-stage histograms recorded by the instrumented code, ingestion workers included
+        'ingest_metrics': ingest_metrics,
+        'metrics': metrics.snapshot()
+    }
+    document_store.close()
+    if not args.workdir:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return report
+
+def parse_args(argv=None):
+    """Parse the benchmark command line arguments."""
+    parser = argparse.ArgumentParser(description="DocQA end-to-end benchmark")
+    parser.add_argument('--text-docs', type=int, default=10, help="PDFs with a text layer.")
+    parser.add_argument('--scanned-docs', type=int, default=2, help="Image-only PDFs (exercise OCR).")
+    parser.add_argument('--pages', type=int, default=10, help="Pages per PDF.")
+    parser.add_argument('--words-per-page', type=int, default=300)
+    parser.add_argument('--facts-per-doc', type=int, default=5)
+    parser.add_argument('--queries', type=int, default=50, help="Number of questions to ask.")
+    parser.add_argument('--chunk-max-tokens', type=int, default=256)
+    parser.add_argument('--chunk-overlap-tokens', type=int, default=32)
+    parser.add_argument('--batch-size', type=int, default=128, help="Embedding/upsert batch size.")
+    parser.add_argument('--vector-backend', default='chroma', choices=['chroma', 'numpy'])
+    parser.add_argument('--vector-quantization', default='int8', choices=['float32', 'float16', 'int8'],
+                        help="Embedding storage type of the numpy backend.")
+    parser.add_argument('--rerank-mode', default='llm', choices=['llm', 'cross-encoder'])
+    parser.add_argument('--rerank-top-k', type=int, default=3)
+    parser.add_argument('--max-concurrency', type=int, default=8, help="Queries answered at the same time.")
+    parser.add_argument('--context-max-tokens', type=int, default=2000, help="Token budget of the answer context.")
+    parser.add_argument('--ocr-dpi', type=int, default=200)
+    parser.add_argument('--ocr-min-text-chars', type=int, default=200)
+    parser.add_argument('--no-ocr-figures', dest='ocr_figures', action='store_false',
+                        help="Do not OCR the figures of pages that have a text layer.")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', help="Keep the corpus and index here instead of a temporary directory.")
+    parser.add_argument('--output', help="Write the JSON report here instead of stdout.")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    """Run the benchmark and write the JSON report."""
+    args = parse_args(argv)
+    report = run(args)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
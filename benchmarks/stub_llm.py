@@ -0,0 +1,124 @@
+import re
+import json
+import time
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+def _terms(text):
+    """Return the set of lowercase words and codes in text."""
+    return set(re.findall(r"[a-z0-9]+(?:-[a-z0-9]+)*", text.lower()))
+
+def _rerank_reply(prompt):
+    """Score each numbered document by the share of query terms it contains (0-10)."""
+    query = re.search(r"Query: (.*)", prompt).group(1)
+    query_terms = _terms(query)
+    documents = re.split(r"\n\n\[\d+\] ", "\n\n" + prompt.split("Documents:\n", 1)[1].rsplit("\n\nReply with", 1)[0])[1:]
+    scores = [round(10 * len(query_terms & _terms(doc)) / max(len(query_terms), 1)) for doc in documents]
+    return ", ".join(str(score) for score in scores)
+
+def _answer_reply(prompt):
+    """Return the document sentence sharing the most terms with the question."""
+    question = re.search(r"Question: (.*)", prompt).group(1)
+    document = prompt.split("Document: ", 1)[1].rsplit("\nAnswer:", 1)[0]
+    question_terms = _terms(question)
+    sentences = re.split(r"(?<=[.!?])\s+", document)
+    return max(sentences, key=lambda sentence: len(question_terms & _terms(sentence)), default="Not available.")
+
+def stub_completion(messages):
+    """
+    Produce a deterministic chat completion for the prompts DocQA sends.
+
+    Args:
+    messages (list): The chat messages of the request.
+
+    Returns:
+    str: The completion text.
+    """
+    prompt = messages[-1]['content']
+    if prompt.startswith("Rate the relevance"):
+        return _rerank_reply(prompt)
+    if "Question: " in prompt:
+        return _answer_reply(prompt)
+    return "OK"
+
+def _send_rate_limit(handler, retry_after):
+    """Reply like the OpenAI API does when a rate limit is hit."""
+    body = json.dumps({'error': {'message': "Rate limit reached (stub).", 'type': 'requests',
+                                 'param': None, 'code': 'rate_limit_exceeded'}}).encode('utf-8')
+    handler.send_response(429)
+    handler.send_header('Content-Type', 'application/json')
+    handler.send_header('Retry-After', str(retry_after))
+    handler.send_header('Content-Length', str(len(body)))
+    handler.end_headers()
+    handler.wfile.write(body)
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Minimal OpenAI-compatible /chat/completions endpoint.
+
+    With rate limiting enabled on the server (see start_stub_server), the first attempts
+    of every distinct prompt are answered with 429 and a Retry-After header, and replies
+    are delayed by a prompt-dependent amount so concurrent requests finish out of order.
+    """
+
+    def log_message(self, format, *args):
+        """Keep benchmark output free of request logs."""
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        server = self.server
+        key = hashlib.sha1(json.dumps(request['messages']).encode('utf-8')).hexdigest()
+        with server.lock:
+            server.stats['requests'] += 1
+            attempt = server.attempts[key] = server.attempts.get(key, 0) + 1
+            rate_limited = attempt <= server.rate_limit_attempts
+            if rate_limited:
+                server.stats['rate_limited'] += 1
+        if rate_limited:
+            _send_rate_limit(self, server.retry_after)
+            return
+        if server.max_delay:
+            time.sleep(server.max_delay * int(key[:4], 16) / 0xffff)
+        content = stub_completion(request['messages'])
+        prompt_tokens = sum(len(message['content'].split()) for message in request['messages'])
+        completion_tokens = len(content.split())
+        body = json.dumps({
+            'id': 'stub', 'object': 'chat.completion', 'model': request.get('model', 'stub'),
+            'choices': [{'index': 0, 'finish_reason': 'stop',
+                         'message': {'role': 'assistant', 'content': content}}],
+            'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                      'total_tokens': prompt_tokens + completion_tokens}
+        }).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def start_stub_server(host='127.0.0.1', port=0, rate_limit_attempts=0, retry_after=1, max_delay=0.0):
+    """
+    Start the stub OpenAI server in a background thread.
+
+    Args:
+    host (str): Interface to listen on. Defaults to '127.0.0.1'.
+    port (int): Port to listen on; 0 picks a free port. Defaults to 0.
+    rate_limit_attempts (int): Number of attempts of every distinct request that are
+                               rejected with 429 before it is answered. Defaults to 0.
+    retry_after (float): Seconds sent in the Retry-After header of a 429. Defaults to 1.
+    max_delay (float): Upper bound of the prompt-dependent delay of each reply, in seconds.
+                       Defaults to 0.
+
+    Returns:
+    tuple: The server and its base URL, suitable for the 'openai_api_base' setting. The
+           server's 'stats' count the 'requests' received and those 'rate_limited'.
+    """
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.rate_limit_attempts = rate_limit_attempts
+    server.retry_after = retry_after
+    server.max_delay = max_delay
+    server.lock = threading.Lock()
+    server.attempts = {}
+    server.stats = {'requests': 0, 'rate_limited': 0}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
@@ -0,0 +1,207 @@
+import os
+import random
+
+WORDS = ("the a procedure inspect verify tighten bolt valve pump housing seal gasket operator "
+         "shift maintenance record torque pressure temperature filter assembly bearing motor "
+         "shaft coupling alignment lubricate replace check report supervisor safety lockout "
+         "tagout isolate drain flush clean calibrate gauge sensor limit switch panel cable").split()
+
+def make_facts(count, seed=0):
+    """
+    Create deterministic (part number, torque) facts and matching questions.
+
+    Args:
+    count (int): Number of facts.
+    seed (int): Random seed. Defaults to 0.
+
+    Returns:
+    list: Dictionaries with the 'part', 'torque', 'sentence' stating the fact and the 'question'.
+    """
+    rng = random.Random(seed)
+    facts = []
+    for i in range(count):
+        part = f"PN-{10000 + i}"
+        torque = rng.randint(10, 90)
+        facts.append({
+            'part': part,
+            'torque': torque,
+            'sentence': f"The torque specification for part {part} is {torque} Nm.",
+            'question': f"What is the torque specification for part {part}?"
+        })
+    return facts
+
+def make_page_text(rng, words_per_page, facts=()):
+    """Return filler sentences with the given fact sentences mixed in."""
+    sentences = []
+    word_count = 0
+    while word_count < words_per_page:
+        length = rng.randint(8, 18)
+        sentence = " ".join(rng.choice(WORDS) for _ in range(length)).capitalize() + "."
+        sentences.append(sentence)
+        word_count += length
+    for fact in facts:
+        sentences.insert(rng.randint(0, len(sentences)), fact)
+    return " ".join(sentences)
+
+def _escape_pdf_text(text):
+    """Escape the characters that are special inside a PDF string literal."""
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def _wrap(text, width):
+    """Wrap text into lines of at most width characters."""
+    lines, line = [], ""
+    for word in text.split():
+        if line and len(line) + len(word) + 1 > width:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}" if line else word
+    if line:
+        lines.append(line)
+    return lines
+
+def write_text_pdf(path, page_texts):
+    """
+    Write a PDF with a real text layer (Helvetica, US Letter), one string per page.
+
+    Args:
+    path (str): Output path.
+    page_texts (list): The text of each page.
+    """
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None,
+               "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for text in page_texts:
+        lines = _wrap(text, 95)[:60]
+        stream = "BT /F1 10 Tf 12 TL 50 750 Td " + " ".join(f"({_escape_pdf_text(line)}) '" for line in lines) + " ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        content_id = len(objects)
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>")
+        page_ids.append(len(objects))
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{i} 0 R' for i in page_ids)}] /Count {len(page_ids)} >>"
+
+    data = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(data))
+        data += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(data)
+    data += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    for offset in offsets:
+        data += f"{offset:010d} 00000 n \n".encode("latin-1")
+    data += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+    with open(path, "wb") as f:
+        f.write(data)
+
+def _load_font(size):
+    """Load a TrueType font if one is installed, else Pillow's built-in bitmap font."""
+    from PIL import ImageFont
+    for name in ("DejaVuSans.ttf", "Arial.ttf", "LiberationSans-Regular.ttf"):
+        try:
+            return ImageFont.truetype(name, size)
+        except OSError:
+            continue
+    return ImageFont.load_default()
+
+def render_page(text, dpi=150, figure_labels=(), degrade=False, seed=0):
+    """
+    Render a page of text to a bitmap, like a scanned page.
+
+    Args:
+    text (str): The text of the page.
+    dpi (int): Resolution of the rendered page. Defaults to 150.
+    figure_labels (list): If given, the lower half of the page is a framed diagram with
+                          these labels instead of text. Optional.
+    degrade (bool): Add uneven lighting and scanner speckle. Defaults to False.
+    seed (int): Random seed of the degradation. Defaults to 0.
+
+    Returns:
+    PIL.Image.Image: The rendered page in RGB.
+    """
+    from PIL import Image, ImageDraw
+    width, height = int(8.5 * dpi), int(11 * dpi)
+    font = _load_font(int(dpi / 7))
+    line_height = int(dpi / 5)
+    bottom = height // 2 if figure_labels else height - dpi // 2
+    image = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(image)
+    y = dpi // 2
+    for line in _wrap(text, 80):
+        if y > bottom:
+            break
+        draw.text((dpi // 2, y), line, fill="black", font=font)
+        y += line_height
+    if figure_labels:
+        # A framed schematic: boxes joined by lines, each with a label
+        top = height // 2 + dpi // 2
+        draw.rectangle((dpi // 2, top, width - dpi // 2, height - dpi // 2), outline="black", width=max(dpi // 50, 2))
+        columns = 2
+        box_width, box_height = (width - 2 * dpi) // columns, dpi
+        for i, label in enumerate(figure_labels):
+            x0 = dpi + (i % columns) * box_width
+            y0 = top + dpi // 2 + (i // columns) * (box_height + dpi // 2)
+            draw.rectangle((x0, y0, x0 + box_width - dpi // 2, y0 + box_height // 2), outline="black", width=2)
+            draw.line((x0 + box_width // 3, y0 + box_height // 2, x0 + box_width // 3, y0 + box_height),
+                      fill="black", width=2)
+            draw.text((x0 + dpi // 10, y0 + box_height // 2 + dpi // 10), label, fill="black", font=font)
+    if degrade:
+        import numpy as np
+        rng = np.random.default_rng(seed)
+        pixels = np.asarray(image.convert("L"), dtype=np.float32)
+        # Darker towards one corner, as under a scanner lid that was not closed
+        shading = 70 * np.linspace(0, 1, width)[None, :] * np.linspace(0.3, 1, height)[:, None]
+        pixels = pixels - shading - rng.normal(0, 12, pixels.shape)
+        speckle = rng.random(pixels.shape) < 0.002
+        pixels[speckle] = 0
+        image = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).convert("RGB")
+    return image
+
+def write_scanned_pdf(path, page_texts, dpi=150):
+    """
+    Write an image-only PDF (no text layer) by rendering each page's text to a bitmap.
+
+    Args:
+    path (str): Output path.
+    page_texts (list): The text of each page.
+    dpi (int): Resolution of the rendered pages. Defaults to 150.
+    """
+    images = [render_page(text, dpi) for text in page_texts]
+    images[0].save(path, save_all=True, append_images=images[1:], resolution=dpi)
+
+def generate_corpus(output_dir, text_docs=10, scanned_docs=2, pages_per_doc=10, words_per_page=300,
+                    facts_per_doc=5, seed=0):
+    """
+    Generate a synthetic corpus of text and scanned PDFs with known facts.
+
+    Args:
+    output_dir (str): Directory for the generated PDFs.
+    text_docs (int): Number of PDFs with a text layer. Defaults to 10.
+    scanned_docs (int): Number of image-only PDFs. Defaults to 2.
+    pages_per_doc (int): Pages per PDF. Defaults to 10.
+    words_per_page (int): Filler words per page. Defaults to 300.
+    facts_per_doc (int): Fact sentences per PDF. Defaults to 5.
+    seed (int): Random seed. Defaults to 0.
+
+    Returns:
+    list: The facts, each with the 'file_name' and 'page_number' it was written to.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    rng = random.Random(seed)
+    total_docs = text_docs + scanned_docs
+    facts = make_facts(total_docs * facts_per_doc, seed)
+    for doc_index in range(total_docs):
+        scanned = doc_index >= text_docs
+        file_name = f"{'scanned' if scanned else 'text'}_{doc_index:04d}.pdf"
+        doc_facts = facts[doc_index * facts_per_doc:(doc_index + 1) * facts_per_doc]
+        pages = [[] for _ in range(pages_per_doc)]
+        for fact in doc_facts:
+            page_index = rng.randrange(pages_per_doc)
+            fact.update(file_name=file_name, page_number=page_index + 1)
+            pages[page_index].append(fact['sentence'])
+        page_texts = [make_page_text(rng, words_per_page, page_facts) for page_facts in pages]
+        if scanned:
+            write_scanned_pdf(os.path.join(output_dir, file_name), page_texts)
+        else:
+            write_text_pdf(os.path.join(output_dir, file_name), page_texts)
+    return facts
@@ -0,0 +1,96 @@
+"""
+Size, latency and recall of the NumPy vector index per quantization.
+
+Usage (from the repository root):
+
+    python -m benchmarks.vector_index_benchmark --rows 200000 --queries 200 --output vector_index.json
+
+Random unit vectors with the dimension of all-MiniLM-L6-v2 are indexed as float32,
+float16 and int8. For each quantization the report gives the size of the matrix on
+disk, the build time, the per-query latency of single and batched queries, and the
+recall@k of the top-k against exact float32 search.
+"""
+import os
+import json
+import time
+import shutil
+import argparse
+import tempfile
+
+from benchmarks.run_benchmark import git_revision, directory_size_mb
+
+def run(args):
+    """Build one index per quantization over the same vectors and build the report."""
+    import numpy as np
+    from utils.vector_index import NumpyVectorIndex, QUANTIZATIONS
+
+    rng = np.random.default_rng(args.seed)
+    vectors = rng.standard_normal((args.rows, args.dimension), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    # Queries close to known rows, like questions close to the chunk that answers them
+    targets = rng.choice(args.rows, args.queries, replace=False)
+    queries = vectors[targets] + 0.5 * rng.standard_normal((args.queries, args.dimension), dtype=np.float32) / np.sqrt(args.dimension)
+    exact = np.argsort(-(queries @ vectors.T), axis=1)[:, :args.top_k]
+    ids = [f"chunk_{i}" for i in range(args.rows)]
+
+    workdir = tempfile.mkdtemp(prefix='docqa_vector_bench_')
+    results = []
+    try:
+        for quantization in QUANTIZATIONS:
+            path = os.path.join(workdir, quantization)
+            index = NumpyVectorIndex(path, {'quantization': quantization})
+            start = time.perf_counter()
+            for offset in range(0, args.rows, args.batch_size):
+                end = offset + args.batch_size
+                index.upsert(ids[offset:end], vectors[offset:end], [''] * len(ids[offset:end]),
+                             [{'doc_hash': 'bench'}] * len(ids[offset:end]))
+            build_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            single = [index.query(query[None, :], args.top_k)['ids'][0] for query in queries]
+            single_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            batched = index.query(queries, args.top_k)['ids']
+            batch_seconds = time.perf_counter() - start
+
+            found = [[int(chunk_id.rsplit('_', 1)[1]) for chunk_id in hits] for hits in batched]
+            recall = np.mean([len(set(hits) & set(truth.tolist())) / args.top_k for hits, truth in zip(found, exact)])
+            results.append({
+                'quantization': quantization,
+                'matrix_mb': round(index._vectors.nbytes / 2 ** 20, 2),
+                'index_size_mb': directory_size_mb(path),
+                'build_seconds': round(build_seconds, 3),
+                'single_query_ms': round(1000 * single_seconds / len(queries), 3),
+                'batched_query_ms': round(1000 * batch_seconds / len(queries), 3),
+                f'recall_at_{args.top_k}': round(float(recall), 4),
+                'consistent': single == batched
+            })
+            index.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {'revision': git_revision(), 'params': vars(args), 'results': results}
+
+def parse_args(argv=None):
+    """Parse the vector index benchmark command line arguments."""
+    parser = argparse.ArgumentParser(description="DocQA vector index benchmark")
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--dimension', type=int, default=384)
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--batch-size', type=int, default=4096, help="Rows per upsert.")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Write the JSON report here instead of stdout.")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    """Run the vector index benchmark and write the JSON report."""
+    args = parse_args(argv)
+    text = json.dumps(run(args), indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,72 @@
-from utils.config import load_config, setup_tesseract
-from utils.document_processing import process_documents
-from utils.embedding import create_vector_store
-from utils.search import hybrid_search, re_rank_documents
-from utils.qa import get_answer_from_documents, find_page_number
+from utils.config import load_config, setup_tesseract, setup_metrics
+from utils.ingest import ingest_documents
+from utils.embedding import get_embedding_model
+from utils.query_engine import answer_queries
+from utils.llm import configure_openai
+from utils.answer_cache import open_answer_cache
 from utils.excel import save_to_excel
-from sentence_transformers import SentenceTransformer
+from utils.metrics import metrics_enabled, export_metrics
 import os
-import openai
+import argparse
 
-def main():
+def parse_args():
+    """Parse command line arguments; without --questions the interactive mode is used."""
+    parser = argparse.ArgumentParser(description="DocQA System")
+    parser.add_argument('--config', default='config.json', help="Path to the JSON configuration file.")
+    parser.add_argument('--questions', help="CSV or Excel file with questions; runs in non-interactive batch mode.")
+    parser.add_argument('--docs', help="Directory containing the PDF documents (defaults to documents_path).")
+    parser.add_argument('--output', default='./query_answers.csv',
+                        help="Batch output file, .csv or .jsonl. Existing output is resumed.")
+    parser.add_argument('--serve', action='store_true', help="Run a resident HTTP query server.")
+    parser.add_argument('--host', default='127.0.0.1', help="Server host (with --serve).")
+    parser.add_argument('--port', type=int, default=8000, help="Server port (with --serve).")
+    return parser.parse_args()
+
+def export_run_metrics(config):
+    """Write the metrics collected during this run to metrics_path, if metrics are enabled."""
+    if metrics_enabled():
+        export_metrics(config.get('metrics_path', './metrics.json'))
+
+def run_batch_mode(args):
+    """Answer the questions file given on the command line without prompting."""
+    try:
+        config = load_config(args.config)
+        configure_openai(config)
+        setup_metrics(config)
+        setup_tesseract(config)
+        from utils.batch import run_batch
+        documents_path = args.docs or config.get('documents_path', './documents/')
+        run_batch(args.questions, documents_path, args.output, config)
+        export_run_metrics(config)
+    except Exception as e:
+        print(f"An error occurred in batch mode: {e}")
+
+def run_server_mode(args):
+    """Load the model and index once and serve queries over HTTP."""
+    try:
+        config = load_config(args.config)
+        configure_openai(config)
+        setup_metrics(config)
+        setup_tesseract(config)
+        from utils.server import serve
+        serve(config, args.docs or config.get('documents_path', './documents/'), args.host, args.port)
+    except Exception as e:
+        print(f"An error occurred in server mode: {e}")
+
+def main(config_file='config.json'):
     """The main function."""
     try:
         print("Welcome to DocQA System\n")
-        config = load_config()
-        openai.api_key = config.get('openai_api_key')
+        config = load_config(config_file)
+        configure_openai(config)
+        setup_metrics(config)
         setup_tesseract(config)
 
         documents_path = input(f"Enter the path to the documents (default: {config.get('documents_path', './documents/')}): ").strip()
         if not documents_path:
             documents_path = config.get('documents_path', './documents/')
         print("\n")
-        processed_documents_file = config.get('processed_documents_path', './processed_documents.json')
-        documents = process_documents(documents_path, processed_documents_file)
-
-        embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-        collection = create_vector_store(documents, embedding_model)
+        _, vector_store = ingest_documents(documents_path, config)
 
         qa_data = []
         queries = []
@@ -36,26 +78,24 @@ def main():
             queries.append(query)
 
         print("\nProcessing queries...\n")
+        embedding_model = get_embedding_model()
+        answer_cache = open_answer_cache(config)
+        results = answer_queries(queries, vector_store, embedding_model, config, answer_cache=answer_cache)
+        if answer_cache is not None:
+            stats = answer_cache.stats()
+            print(f"Answer cache: {stats['hits']} hits, {stats['misses']} misses, {stats['entries']} entries.\n")
+            answer_cache.close()
 
-        for i, query in enumerate(queries):
-            combined_results, combined_metadatas, combined_ids = hybrid_search(query, collection, embedding_model)
-            most_relevant_document = re_rank_documents(query, combined_results, config.get('gpt_model', 'gpt-4'))
-            if isinstance(most_relevant_document, list):
-                most_relevant_document = ' '.join(most_relevant_document)
-            answer = get_answer_from_documents(query, most_relevant_document, config.get('gpt_model', 'gpt-4'))
-            if any(phrase.lower() in answer.lower() for phrase in ["the document does not provide information", "no information found", "not available"]):
-                source_file = "None"
-                page_number = "None"
-            else:
-                source_file = combined_metadatas[0][0]['file_name']
-                page_number = find_page_number(query, next((doc['page_texts'] for doc in documents if doc['file_name'] == source_file), []))
-            qa_data.append([i + 1, query, answer, source_file, page_number])
+        for i, result in enumerate(results):
+            qa_data.append([i + 1, result['query'], result['answer'], result['source_file'], result['page_number']])
 
             # Display the results on the CLI
-            print(f"Query: {query}")
-            print(f"Answer: {answer}")
-            print(f"Source file: {source_file}")
-            print(f"Page number: {page_number}")
+            print(f"Query: {result['query']}")
+            print(f"Answer: {result['answer']}")
+            print(f"Source file: {result['source_file']}")
+            print(f"Page number: {result['page_number']}")
+            print(f"Tokens: {result.get('prompt_tokens', 0)} prompt ({result.get('context_tokens', 0)} context), "
+                  f"{result.get('completion_tokens', 0)} completion")
             print("\n" + "-"*50 + "\n")
 
         output_folder_path = input(f"\nEnter the folder path for the output Excel file (default: {os.path.dirname(config.get('output_excel_path', './query_answers.xlsx'))}): ").strip()
@@ -67,9 +107,16 @@ def main():
         
         save_to_excel(qa_data, output_excel_path)
         print(f"\nResults have been saved to {output_excel_path}")
+        export_run_metrics(config)
 
     except Exception as e:
         print(f"An error occurred in the main function: {e}")
 
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    if args.serve:
+        run_server_mode(args)
+    elif args.questions:
+        run_batch_mode(args)
+    else:
+        main(args.config)
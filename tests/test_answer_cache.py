@@ -0,0 +1,59 @@
+"""
+The persistent answer cache.
+
+Run from the repository root with:
+
+    python -m unittest discover -s tests -t .
+"""
+import os
+import shutil
+import tempfile
+import unittest
+import importlib.util
+
+HAVE_DEPENDENCIES = importlib.util.find_spec('numpy') is not None
+
+CONFIG = {'gpt_model': 'gpt-3.5-turbo', 'rerank_mode': 'llm', 'rerank_top_k': 3, 'context_max_tokens': 2000}
+
+@unittest.skipUnless(HAVE_DEPENDENCIES, "numpy is required")
+class AnswerCacheSettingsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix='docqa_test_')
+        self.config = dict(CONFIG, answer_cache_path=os.path.join(self.workdir, 'answer_cache.sqlite'))
+        self.embedding = [1.0, 0.0, 0.0]
+        self.chunk_ids = ['doc0_chunk_0', 'doc1_chunk_3']
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def cached_answer(self, **changes):
+        """Reopen the cache with the given settings changed and look the question up."""
+        from utils.answer_cache import open_answer_cache
+
+        cache = open_answer_cache(dict(self.config, **changes))
+        try:
+            result = cache.lookup("What torque?", self.embedding, self.chunk_ids[::-1])
+        finally:
+            cache.close()
+        return result and result['answer']
+
+    def test_answers_are_only_reused_under_the_same_answer_settings(self):
+        from utils.answer_cache import open_answer_cache
+
+        cache = open_answer_cache(self.config)
+        cache.store("What torque?", self.embedding, self.chunk_ids, {'answer': '25 Nm'})
+        cache.close()
+
+        self.assertEqual(self.cached_answer(), '25 Nm')
+        # Settings that do not change answers share the entries
+        self.assertEqual(self.cached_answer(max_concurrency=2), '25 Nm')
+        self.assertIsNone(self.cached_answer(gpt_model='gpt-4'))
+        self.assertIsNone(self.cached_answer(rerank_mode='cross-encoder'))
+        self.assertIsNone(self.cached_answer(context_max_tokens=500))
+        # A setting left out counts as its default, 3 for rerank_top_k
+        del self.config['rerank_top_k']
+        self.assertEqual(self.cached_answer(), '25 Nm')
+
+if __name__ == '__main__':
+    unittest.main()
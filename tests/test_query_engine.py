@@ -0,0 +1,145 @@
+"""
+The concurrent query pipeline against the local stub OpenAI server.
+
+Run from the repository root with:
+
+    python -m unittest discover -s tests -t .
+
+The stub rejects the first attempts of every request with 429 and a Retry-After header
+and delays its replies by a prompt-dependent amount, so requests finish out of order.
+"""
+import re
+import time
+import shutil
+import tempfile
+import unittest
+import importlib.util
+
+HAVE_DEPENDENCIES = all(importlib.util.find_spec(name) for name in ('numpy', 'openai', 'aiohttp'))
+
+PARTS = 12
+
+class HashingEmbeddingModel:
+    """Stand-in for the SentenceTransformer model: hashed bag-of-words vectors."""
+
+    dimension = 256
+
+    def encode(self, texts, batch_size=32, convert_to_numpy=True):
+        import numpy as np
+
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for term in re.findall(r"[a-z0-9]+(?:-[a-z0-9]+)*", text.lower()):
+                vectors[row, hash(term) % self.dimension] += 1.0
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+def build_vector_store(path, embedding_model):
+    """Index one chunk per part, each from its own document."""
+    from utils.vector_index import NumpyVectorIndex
+    from utils.bm25 import create_bm25_index, add_to_bm25_index
+    from utils.dedup import create_dedup_index
+
+    collection = NumpyVectorIndex(path, {'quantization': 'float32'})
+    bm25_index = create_bm25_index()
+    ids, chunks, metadatas = [], [], []
+    for i in range(PARTS):
+        doc_hash = f"doc{i}"
+        ids.append(f"{doc_hash}_chunk_0")
+        chunks.append(f"Part PN-{1000 + i} is tightened to {20 + i} Nm. Check the seal before assembly.")
+        metadatas.append({'file_name': f"sop_{i}.pdf", 'doc_hash': doc_hash, 'chunk_index': 0, 'page_number': 1})
+        add_to_bm25_index(bm25_index, ids[-1], chunks[-1], doc_hash)
+    collection.upsert(ids, embedding_model.encode(chunks), chunks, metadatas)
+    return {'chunks': collection, 'bm25': bm25_index, 'dedup': create_dedup_index()}
+
+@unittest.skipUnless(HAVE_DEPENDENCIES, "numpy, openai<1.0 and aiohttp are required")
+class AnswerQueriesRetryTest(unittest.TestCase):
+
+    def setUp(self):
+        from utils import llm, metrics
+
+        self.saved_retry_settings = dict(llm._retry_settings)
+        self.saved_client_settings = dict(llm._client_settings)
+        self.workdir = tempfile.mkdtemp(prefix='docqa_test_')
+        self.embedding_model = HashingEmbeddingModel()
+        self.vector_store = build_vector_store(self.workdir, self.embedding_model)
+        self.config = {'gpt_model': 'gpt-3.5-turbo', 'rerank_mode': 'llm', 'rerank_top_k': 1,
+                       'max_concurrency': 4, 'retrieval_batch_size': 5}
+        # Parts asked in a scrambled order
+        self.parts = [(7 * i) % PARTS for i in range(PARTS)]
+        self.queries = [f"What torque is part PN-{1000 + i} tightened to?" for i in self.parts]
+        metrics.enable_metrics(True)
+        metrics.reset()
+
+    def tearDown(self):
+        from utils import llm, metrics
+
+        self.server.shutdown()
+        self.server.server_close()
+        self.vector_store['chunks'].close()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+        llm._retry_settings.clear()
+        llm._retry_settings.update(self.saved_retry_settings)
+        llm._client_settings.clear()
+        llm._client_settings.update(self.saved_client_settings)
+        metrics.reset()
+        metrics.enable_metrics(False)
+
+    def start_stub(self, rate_limit_attempts, max_retries):
+        from benchmarks.stub_llm import start_stub_server
+        from utils.llm import configure_openai
+
+        self.server, api_base = start_stub_server(rate_limit_attempts=rate_limit_attempts, retry_after=0.01,
+                                                  max_delay=0.05)
+        # A backoff this long would time the test out: only Retry-After keeps it fast
+        configure_openai({'openai_api_key': 'stub', 'openai_api_base': api_base, 'max_retries': max_retries,
+                          'initial_backoff': 60.0, 'max_backoff': 60.0})
+
+    def answer(self):
+        from utils.query_engine import answer_queries
+
+        finished = []
+        results = answer_queries(self.queries, self.vector_store, self.embedding_model, self.config,
+                                 on_result=lambda index, result: finished.append((index, result['query'])))
+        return results, finished
+
+    def test_rate_limited_requests_are_retried_and_results_keep_input_order(self):
+        from utils import metrics
+        from utils.qa import ERROR_ANSWER
+
+        self.start_stub(rate_limit_attempts=2, max_retries=3)
+        start = time.perf_counter()
+        results, finished = self.answer()
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual([result['query'] for result in results], self.queries)
+        for part, result in zip(self.parts, results):
+            self.assertNotEqual(result['answer'], ERROR_ANSWER)
+            self.assertIn(f"{20 + part} Nm", result['answer'])
+            self.assertEqual(result['source_file'], f"sop_{part}.pdf")
+        # on_result reports each query under its input index, whatever order they finish in
+        self.assertEqual(sorted(finished), sorted(enumerate(self.queries)))
+
+        counters = metrics.snapshot()['counters']
+        stats = self.server.stats
+        # One rerank and one answer call per query, each rejected twice before it succeeds
+        self.assertEqual(stats['rate_limited'], 2 * 2 * len(self.queries))
+        self.assertEqual(stats['requests'], 3 * 2 * len(self.queries))
+        self.assertEqual(counters.get('openai.retries'), stats['rate_limited'])
+        self.assertNotIn('openai.errors', counters)
+        self.assertLess(elapsed, 30)
+
+    def test_exhausted_retries_return_error_answers_in_input_order(self):
+        from utils import metrics
+        from utils.qa import ERROR_ANSWER
+
+        self.start_stub(rate_limit_attempts=2, max_retries=1)
+        results, _ = self.answer()
+
+        self.assertEqual([result['query'] for result in results], self.queries)
+        self.assertTrue(all(result['answer'] == ERROR_ANSWER for result in results))
+        counters = metrics.snapshot()['counters']
+        self.assertEqual(counters.get('openai.retries'), self.server.stats['rate_limited'] // 2)
+        self.assertGreater(counters.get('openai.errors', 0), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,166 @@
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from utils import metrics
+
+# Settings that change the answer to a question, with their defaults
+ANSWER_SETTINGS = (('gpt_model', 'gpt-4'), ('rerank_mode', 'llm'), ('rerank_top_k', 3),
+                   ('context_max_tokens', 2000), ('answer_max_tokens', 150))
+
+def normalize_query(query):
+    """Lowercase a query, collapse whitespace and drop trailing punctuation."""
+    return re.sub(r"\s+", " ", query.lower()).strip().rstrip("?!. ")
+
+def answer_settings_fingerprint(config):
+    """Return a short hash of the settings in config that change the answers."""
+    settings = [config.get(key, default) for key, default in ANSWER_SETTINGS]
+    return hashlib.sha1(json.dumps(settings).encode('utf-8')).hexdigest()[:16]
+
+class AnswerCache:
+    """
+    Persistent cache of answers, looked up by query similarity and retrieved chunks.
+
+    An entry is reused when the query embedding is at least `threshold` cosine-similar
+    to a cached query and hybrid_search returned exactly the same chunk ids, so answers
+    are only reused while the underlying documents are unchanged. Entries are also keyed
+    by a `fingerprint` of the answer settings, so answers generated with another model,
+    rerank mode or context size are not reused. Entries older than
+    `ttl_seconds` expire, and the least recently used entries are evicted beyond
+    `max_entries`.
+    """
+
+    def __init__(self, path, threshold=0.95, max_entries=10000, ttl_seconds=7 * 24 * 3600, fingerprint=''):
+        self.threshold = threshold
+        self.fingerprint = fingerprint
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            "id INTEGER PRIMARY KEY, query TEXT, embedding BLOB, chunk_key TEXT, "
+            "result TEXT, created_at REAL, last_used_at REAL)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS answers_chunk_key ON answers (chunk_key)")
+        self._connection.commit()
+        self._expire()
+
+    def _chunk_key(self, chunk_ids):
+        """Return an order-independent key for a set of chunk ids under the current answer settings."""
+        return f"{self.fingerprint}:{json.dumps(sorted(chunk_ids))}"
+
+    def _expire(self):
+        """Delete entries older than the TTL."""
+        if self.ttl_seconds:
+            self._connection.execute("DELETE FROM answers WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+            self._connection.commit()
+
+    def lookup(self, query, query_embedding, chunk_ids):
+        """
+        Find a cached result for a query.
+
+        Args:
+        query (str): The question.
+        query_embedding (list): The embedding of the question.
+        chunk_ids (list): The chunk ids returned by hybrid_search for the question.
+
+        Returns:
+        dict: The cached result, or None on a miss.
+        """
+        with self._lock:
+            oldest = time.time() - self.ttl_seconds if self.ttl_seconds else 0
+            rows = self._connection.execute(
+                "SELECT id, query, embedding, result FROM answers WHERE chunk_key = ? AND created_at >= ?",
+                (self._chunk_key(chunk_ids), oldest)).fetchall()
+            best_id, best_result, best_score = None, None, self.threshold
+            if rows:
+                import numpy as np
+                normalized = normalize_query(query)
+                vector = np.asarray(query_embedding, dtype=np.float32)
+                vector /= np.linalg.norm(vector) or 1.0
+                for entry_id, cached_query, embedding, result in rows:
+                    if cached_query == normalized:
+                        score = 1.0
+                    else:
+                        cached = np.frombuffer(embedding, dtype=np.float32)
+                        score = float(np.dot(vector, cached))
+                    if score >= best_score:
+                        best_id, best_result, best_score = entry_id, result, score
+            if best_id is None:
+                self.misses += 1
+                metrics.increment('answer_cache.misses')
+                return None
+            self.hits += 1
+            metrics.increment('answer_cache.hits')
+            self._connection.execute("UPDATE answers SET last_used_at = ? WHERE id = ?", (time.time(), best_id))
+            self._connection.commit()
+            return json.loads(best_result)
+
+    def store(self, query, query_embedding, chunk_ids, result):
+        """
+        Add a result to the cache, evicting the least recently used entries if it is full.
+
+        Args:
+        query (str): The question.
+        query_embedding (list): The embedding of the question.
+        chunk_ids (list): The chunk ids returned by hybrid_search for the question.
+        result (dict): The JSON-serializable result to cache.
+        """
+        import numpy as np
+
+        vector = np.asarray(query_embedding, dtype=np.float32)
+        vector = vector / (np.linalg.norm(vector) or 1.0)
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT INTO answers (query, embedding, chunk_key, result, created_at, last_used_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (normalize_query(query), vector.tobytes(), self._chunk_key(chunk_ids), json.dumps(result), now, now))
+            self._connection.execute(
+                "DELETE FROM answers WHERE id IN (SELECT id FROM answers ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,))
+            self._connection.commit()
+
+    def stats(self):
+        """
+        Return the cache counters.
+
+        Returns:
+        dict: The number of 'hits', 'misses' and cached 'entries'.
+        """
+        with self._lock:
+            entries = self._connection.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        return {'hits': self.hits, 'misses': self.misses, 'entries': entries}
+
+    def close(self):
+        """Close the underlying database."""
+        with self._lock:
+            self._connection.close()
+
+def open_answer_cache(config):
+    """
+    Open the answer cache described by the configuration.
+
+    Args:
+    config (dict): A dictionary containing configuration settings.
+
+    Returns:
+    AnswerCache: The cache, or None if 'answer_cache_enabled' is false or it cannot be opened.
+    """
+    if not config.get('answer_cache_enabled', True):
+        return None
+    try:
+        return AnswerCache(
+            config.get('answer_cache_path', './answer_cache.sqlite'),
+            threshold=config.get('answer_cache_threshold', 0.95),
+            max_entries=config.get('answer_cache_max_entries', 10000),
+            ttl_seconds=config.get('answer_cache_ttl_hours', 168) * 3600,
+            fingerprint=answer_settings_fingerprint(config)
+        )
+    except Exception as e:
+        print(f"Error opening answer cache: {e}")
+        return None
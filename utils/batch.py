@@ -0,0 +1,192 @@
+import os
+import csv
+import json
+from utils.ingest import ingest_documents
+from utils.embedding import get_embedding_model
+from utils.query_engine import answer_queries
+from utils.answer_cache import open_answer_cache
+from utils.qa import ERROR_ANSWER
+
+# Same columns as the Excel output written by save_to_excel
+COLUMNS = ['Serial Number', 'Question', 'Answer', 'Source', 'Page Number']
+# Extra fields of JSON lines output: the token usage of every answer
+USAGE_FIELDS = {'Context Tokens': 'context_tokens', 'Prompt Tokens': 'prompt_tokens',
+                'Completion Tokens': 'completion_tokens'}
+# Header names recognised in a questions file without a configured column
+QUESTION_HEADERS = ('question', 'questions', 'query', 'queries')
+
+def read_questions(questions_path, column=None):
+    """
+    Read questions from a CSV or Excel file.
+
+    The first row is a header only if it names the question column: the given column, or
+    else 'Question', 'Questions', 'Query' or 'Queries' (case-insensitive). Otherwise the
+    file has no header and the questions are taken from the first column. Empty cells are
+    skipped.
+
+    Args:
+    questions_path (str): Path to a .csv, .xlsx or .xls file.
+    column (str): Name of the column holding the questions. Optional.
+
+    Returns:
+    list: The questions, in file order.
+    """
+    if questions_path.lower().endswith(('.xlsx', '.xls')):
+        import pandas as pd
+        rows = pd.read_excel(questions_path, dtype=str, header=None).fillna('').values.tolist()
+    else:
+        with open(questions_path, newline='', encoding='utf-8-sig') as f:
+            rows = list(csv.reader(f))
+
+    names = [column.strip().lower()] if column else QUESTION_HEADERS
+    header = [str(name).strip().lower() for name in rows[0]] if rows else []
+    index = next((header.index(name) for name in names if name in header), None)
+    if index is None:
+        index = 0
+    else:
+        rows = rows[1:]
+    return [str(row[index]).strip() for row in rows if len(row) > index and str(row[index]).strip()]
+
+def _is_jsonl(output_path):
+    """Return True if results are written as JSON lines rather than CSV."""
+    return output_path.lower().endswith(('.jsonl', '.json'))
+
+def load_completed_rows(output_path):
+    """
+    Load the rows already written to a partially completed output file.
+
+    A row cut off by a crash is dropped, and so is a row whose answer failed (e.g. during an
+    API outage), so that its question is asked again. The file is rewritten without them
+    so that new rows can be appended safely.
+
+    Args:
+    output_path (str): Path to the .csv or .jsonl output file.
+
+    Returns:
+    dict: Completed rows keyed by serial number.
+    """
+    if not os.path.exists(output_path):
+        return {}
+
+    rows = {}
+    with open(output_path, newline='', encoding='utf-8') as f:
+        if _is_jsonl(output_path):
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if row.get('Answer') != ERROR_ANSWER:
+                    rows[int(row['Serial Number'])] = row
+        else:
+            for row in csv.DictReader(f):
+                if (all(row.get(name) is not None for name in COLUMNS) and None not in row
+                        and row['Answer'] != ERROR_ANSWER):
+                    rows[int(row['Serial Number'])] = row
+
+    # Rewrite the file with complete rows only, dropping any truncated tail
+    tmp_path = output_path + '.tmp'
+    with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+        _write_rows(f, output_path, [rows[serial] for serial in sorted(rows)], header=True)
+    os.replace(tmp_path, output_path)
+    return rows
+
+def check_completed_rows(completed, questions, output_path):
+    """
+    Make sure completed rows answer the questions they are resumed for.
+
+    Rows are matched to questions by serial number. If the questions file was edited or
+    reordered since the output was written, a question would silently inherit another
+    question's answer, so every completed row must carry the question of its serial number.
+
+    Args:
+    completed (dict): Completed rows keyed by serial number, from load_completed_rows.
+    questions (list): The questions, in file order.
+    output_path (str): Path to the output file, for the error message.
+
+    Raises:
+    ValueError: If a completed row does not match the questions file.
+    """
+    mismatched = [serial for serial, row in sorted(completed.items())
+                  if serial > len(questions) or row['Question'] != questions[serial - 1]]
+    if mismatched:
+        raise ValueError(f"'{output_path}' does not belong to this questions file: {len(mismatched)} answered "
+                         f"rows (first: serial number {mismatched[0]}) hold other questions. Use a new output file "
+                         f"or remove the old one.")
+
+def _write_rows(f, output_path, rows, header=False):
+    """Write rows to an open output file in the format given by its extension."""
+    if _is_jsonl(output_path):
+        for row in rows:
+            f.write(json.dumps(row) + '\n')
+    else:
+        writer = csv.DictWriter(f, fieldnames=COLUMNS, extrasaction='ignore')
+        if header:
+            writer.writeheader()
+        writer.writerows(rows)
+
+def run_batch(questions_path, documents_path, output_path, config):
+    """
+    Answer every question in a file and stream the results to CSV or JSONL.
+
+    Each row is written and flushed to disk as soon as its answer is ready; JSON lines
+    rows also carry the token usage of the answer. Rerunning
+    with the same output file skips the questions that were already answered, so an
+    interrupted run resumes where it stopped; questions whose answer failed are asked again.
+    An output file written for other questions is refused, see check_completed_rows.
+
+    Args:
+    questions_path (str): Path to a CSV or Excel file with the questions.
+    documents_path (str): Path to the directory containing PDF files.
+    output_path (str): Path to the output file; .jsonl writes JSON lines, anything else CSV.
+    config (dict): A dictionary containing configuration settings.
+
+    Returns:
+    int: The number of questions answered in this run.
+    """
+    questions = read_questions(questions_path, config.get('questions_column'))
+    completed = load_completed_rows(output_path)
+    check_completed_rows(completed, questions, output_path)
+    pending = [(serial, question) for serial, question in enumerate(questions, start=1) if serial not in completed]
+    print(f"Found {len(questions)} questions, {len(completed)} already answered, {len(pending)} to go.")
+    if not pending:
+        return 0
+
+    _, vector_store = ingest_documents(documents_path, config)
+    embedding_model = get_embedding_model()
+
+    output_dir = os.path.dirname(output_path)
+    if output_dir and not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    write_header = not os.path.exists(output_path) or os.path.getsize(output_path) == 0
+
+    failed = []
+    with open(output_path, 'a', newline='', encoding='utf-8') as f:
+        if write_header and not _is_jsonl(output_path):
+            _write_rows(f, output_path, [], header=True)
+
+        def write_result(index, result):
+            serial = pending[index][0]
+            row = dict(zip(COLUMNS, [serial, result['query'], result['answer'],
+                                     result['source_file'], result['page_number']]))
+            row.update((field, result.get(key)) for field, key in USAGE_FIELDS.items())
+            _write_rows(f, output_path, [row])
+            # Make the row durable before moving on so a crash never loses a paid-for answer
+            f.flush()
+            os.fsync(f.fileno())
+            if result['answer'] == ERROR_ANSWER:
+                failed.append(serial)
+            print(f"[{serial}/{len(questions)}] {result['query']}")
+
+        answer_cache = open_answer_cache(config)
+        answer_queries([question for _, question in pending], vector_store, embedding_model, config,
+                       on_result=write_result, answer_cache=answer_cache)
+        if answer_cache is not None:
+            stats = answer_cache.stats()
+            print(f"Answer cache: {stats['hits']} hits, {stats['misses']} misses, {stats['entries']} entries.")
+            answer_cache.close()
+
+    if failed:
+        print(f"\n{len(failed)} questions could not be answered; rerun with the same output file to retry them.")
+    print(f"\nResults have been saved to {output_path}")
+    return len(pending)
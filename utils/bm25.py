@@ -0,0 +1,205 @@
+import os
+import re
+import json
+import math
+import heapq
+from collections import Counter
+
+# Words, numbers and codes such as "SOP-0042", "A4.2" or "M8x1.25" are kept whole
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+
+def tokenize(text):
+    """
+    Split text into lowercase terms for lexical search.
+
+    Compound codes (part numbers, SOP codes) are emitted both as a whole and as their
+    individual parts, so "SOP-0042" matches queries for "SOP-0042" as well as "0042".
+
+    Args:
+    text (str): The text to tokenize.
+
+    Returns:
+    list: The list of terms.
+    """
+    terms = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        terms.append(token)
+        if not token.isalnum():
+            terms.extend(part for part in re.split(r"[-_./]", token) if part)
+    return terms
+
+def create_bm25_index():
+    """
+    Create an empty BM25 inverted index.
+
+    Returns:
+    dict: An index with postings (term -> {chunk id: term frequency}), chunk lengths,
+          the chunk ids of every document hash, the document hash and distinct terms of
+          every chunk (so a chunk is removed without visiting the whole vocabulary) and
+          the total length of all chunks.
+    """
+    return {'postings': {}, 'lengths': {}, 'documents': {}, 'chunks': {}, 'total_length': 0}
+
+def add_to_bm25_index(index, chunk_id, text, doc_hash):
+    """
+    Add a chunk to a BM25 index.
+
+    Args:
+    index (dict): The BM25 index.
+    chunk_id (str): The id of the chunk (same as in the vector store).
+    text (str): The chunk text.
+    doc_hash (str): Hash of the document the chunk belongs to.
+    """
+    if chunk_id in index['lengths']:
+        remove_chunks_from_bm25_index(index, [chunk_id])
+    terms = tokenize(text)
+    frequencies = Counter(terms)
+    for term, frequency in frequencies.items():
+        index['postings'].setdefault(term, {})[chunk_id] = frequency
+    index['chunks'][chunk_id] = [doc_hash, list(frequencies)]
+    index['lengths'][chunk_id] = len(terms)
+    index['total_length'] += len(terms)
+    index['documents'].setdefault(doc_hash, []).append(chunk_id)
+
+def remove_chunks_from_bm25_index(index, chunk_ids):
+    """
+    Remove chunks from a BM25 index.
+
+    Only the postings of the chunks' own terms and the chunk lists of their documents are
+    visited, so the cost does not grow with the vocabulary or the number of documents.
+
+    Args:
+    index (dict): The BM25 index.
+    chunk_ids (list): Ids of the chunks to remove.
+    """
+    removed = {}
+    for chunk_id in set(chunk_ids):
+        entry = index['chunks'].pop(chunk_id, None)
+        if entry is None:
+            continue
+        doc_hash, terms = entry
+        for term in terms:
+            postings = index['postings'].get(term)
+            if postings is not None:
+                postings.pop(chunk_id, None)
+                if not postings:
+                    del index['postings'][term]
+        index['total_length'] -= index['lengths'].pop(chunk_id)
+        removed.setdefault(doc_hash, set()).add(chunk_id)
+    for doc_hash, doc_chunk_ids in removed.items():
+        remaining = [chunk_id for chunk_id in index['documents'].get(doc_hash, []) if chunk_id not in doc_chunk_ids]
+        if remaining:
+            index['documents'][doc_hash] = remaining
+        else:
+            index['documents'].pop(doc_hash, None)
+
+def remove_document_from_bm25_index(index, doc_hash):
+    """
+    Remove every chunk of a document from a BM25 index.
+
+    Args:
+    index (dict): The BM25 index.
+    doc_hash (str): Hash of the document to remove.
+    """
+    remove_chunks_from_bm25_index(index, index['documents'].get(doc_hash, []))
+
+def move_chunk_in_bm25_index(index, chunk_id, old_hash, new_hash):
+    """
+    Record that a chunk now belongs to another document; its postings are kept.
+
+    Args:
+    index (dict): The BM25 index.
+    chunk_id (str): The id of the chunk.
+    old_hash (str): Hash of the document the chunk belonged to.
+    new_hash (str): Hash of the document it belongs to now.
+    """
+    chunk_ids = index['documents'].get(old_hash, [])
+    if chunk_id not in chunk_ids:
+        return
+    chunk_ids.remove(chunk_id)
+    if not chunk_ids:
+        del index['documents'][old_hash]
+    index['documents'].setdefault(new_hash, []).append(chunk_id)
+    index['chunks'][chunk_id][0] = new_hash
+
+def bm25_search(index, query, n_results=10, k1=1.5, b=0.75):
+    """
+    Score chunks against a query with Okapi BM25.
+
+    Only the postings of the query terms are visited, so the cost depends on how
+    common the query terms are rather than on the size of the corpus.
+
+    Args:
+    index (dict): The BM25 index.
+    query (str): The search query.
+    n_results (int): Number of results to return. Defaults to 10.
+    k1 (float): Term frequency saturation parameter. Defaults to 1.5.
+    b (float): Length normalization parameter. Defaults to 0.75.
+
+    Returns:
+    list: (chunk id, score) tuples sorted by descending score.
+    """
+    chunk_count = len(index['lengths'])
+    if not chunk_count:
+        return []
+    average_length = index['total_length'] / chunk_count
+    scores = {}
+    for term in set(tokenize(query)):
+        postings = index['postings'].get(term)
+        if not postings:
+            continue
+        idf = math.log(1 + (chunk_count - len(postings) + 0.5) / (len(postings) + 0.5))
+        for chunk_id, frequency in postings.items():
+            length_norm = k1 * (1 - b + b * index['lengths'][chunk_id] / average_length)
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * frequency * (k1 + 1) / (frequency + length_norm)
+    return heapq.nlargest(n_results, scores.items(), key=lambda item: item[1])
+
+def save_bm25_index(index, index_file):
+    """
+    Save a BM25 index to a JSON file.
+
+    Args:
+    index (dict): The BM25 index.
+    index_file (str): Path to the output JSON file.
+    """
+    try:
+        tmp_file = index_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp_file, index_file)
+    except Exception as e:
+        print(f"Error saving BM25 index to '{index_file}': {e}")
+
+def _rebuild_chunk_entries(index):
+    """Derive the document hash and terms of every chunk from the postings of an older index file."""
+    chunks = {chunk_id: [None, []] for chunk_id in index['lengths']}
+    for doc_hash, chunk_ids in index['documents'].items():
+        for chunk_id in chunk_ids:
+            if chunk_id in chunks:
+                chunks[chunk_id][0] = doc_hash
+    for term, postings in index['postings'].items():
+        for chunk_id in postings:
+            chunks[chunk_id][1].append(term)
+    index['chunks'] = chunks
+
+def load_bm25_index(index_file):
+    """
+    Load a BM25 index from a JSON file.
+
+    Args:
+    index_file (str): Path to the JSON file.
+
+    Returns:
+    dict: The BM25 index, or an empty index if the file does not exist or cannot be read.
+    """
+    try:
+        if os.path.exists(index_file):
+            with open(index_file, 'r') as f:
+                index = json.load(f)
+            if 'chunks' not in index:
+                # Written before the terms of every chunk were recorded
+                _rebuild_chunk_entries(index)
+            return index
+    except Exception as e:
+        print(f"Error loading BM25 index from '{index_file}': {e}")
+    return create_bm25_index()
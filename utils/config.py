@@ -40,8 +40,74 @@ def setup_tesseract(config):
     Returns:
     None
     """
-    import pytesseract
+    from utils.ocr import set_tesseract_cmd
     
     # Set the Tesseract executable path from the config
-    # If 'tesseract_path' is not in config, this will implicitly use the default path
-    pytesseract.pytesseract.tesseract_cmd = config.get('tesseract_path')
+    # If 'tesseract_path' is not in config, the default 'tesseract' on the PATH is used
+    # pytesseract itself is only imported when a page is actually OCRed
+    if config.get('tesseract_path'):
+        set_tesseract_cmd(config['tesseract_path'])
+
+def setup_metrics(config):
+    """
+    Turn on per-stage metrics collection if the configuration asks for it.
+
+    Args:
+    config (dict): A dictionary containing configuration settings.
+                   'metrics_enabled' (default False) switches collection on.
+
+    Returns:
+    None
+    """
+    from utils.metrics import enable_metrics
+    enable_metrics(config.get('metrics_enabled', False))
+
+def get_ocr_options(config):
+    """
+    Collect the OCR settings from the configuration.
+
+    Args:
+    config (dict): A dictionary containing configuration settings.
+
+    Returns:
+    dict: The rasterization 'dpi' (default 200), 'min_text_chars' (default 200), the
+          text-layer length above which a page is not OCRed in full, and 'figures' (default
+          True), whether the figures embedded in such pages are OCRed.
+    """
+    return {
+        'dpi': config.get('ocr_dpi', 200),
+        'min_text_chars': config.get('ocr_min_text_chars', 200),
+        'figures': config.get('ocr_figures', True)
+    }
+
+def get_chunk_options(config):
+    """
+    Collect the chunking settings from the configuration.
+
+    Args:
+    config (dict): A dictionary containing configuration settings.
+
+    Returns:
+    dict: 'max_tokens' (default 256), the chunk size in embedding-model tokens, and
+          'overlap_tokens' (default 32), the number of tokens shared by consecutive chunks.
+    """
+    return {
+        'max_tokens': config.get('chunk_max_tokens', 256),
+        'overlap_tokens': config.get('chunk_overlap_tokens', 32)
+    }
+
+def get_vector_index_options(config):
+    """
+    Collect the vector index settings from the configuration.
+
+    Args:
+    config (dict): A dictionary containing configuration settings.
+
+    Returns:
+    dict: The 'backend' ('chroma', the default, or 'numpy') and the 'quantization' of the
+          embeddings in the numpy backend ('float32', 'float16' or 'int8', the default).
+    """
+    return {
+        'backend': config.get('vector_backend', 'chroma'),
+        'quantization': config.get('vector_quantization', 'int8')
+    }
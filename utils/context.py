@@ -0,0 +1,115 @@
+import re
+import hashlib
+from functools import lru_cache
+from utils import metrics
+
+# Encoding used for models tiktoken does not know, e.g. a local OpenAI-compatible server
+DEFAULT_ENCODING = 'cl100k_base'
+# Every chat message costs a few tokens of framing besides its content, and the reply is primed
+TOKENS_PER_MESSAGE = 4
+TOKENS_PER_REPLY = 3
+CHUNK_SEPARATOR = "\n\n"
+
+class _ApproximateEncoding:
+    """Stand-in for a tiktoken encoding when tiktoken or its BPE files are unavailable: 4 characters per token."""
+
+    def encode(self, text, disallowed_special=()):
+        return [text[i:i + 4] for i in range(0, len(text), 4)]
+
+    def decode(self, tokens):
+        return "".join(tokens)
+
+@lru_cache(maxsize=None)
+def get_token_encoding(model_name):
+    """
+    Load the tiktoken encoding of a GPT model once and reuse it for the rest of the process.
+
+    Models tiktoken does not know use cl100k_base. If tiktoken cannot be loaded (it is not
+    installed, or its encoding files cannot be downloaded), tokens are estimated as four
+    characters each.
+
+    Args:
+    model_name (str): The name of the GPT model.
+
+    Returns:
+    An object with the encode() and decode() methods of a tiktoken encoding.
+    """
+    try:
+        import tiktoken
+        try:
+            return tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            return tiktoken.get_encoding(DEFAULT_ENCODING)
+    except Exception as e:
+        print(f"Warning: cannot load a tokenizer for '{model_name}', estimating token counts: {e}")
+        return _ApproximateEncoding()
+
+def count_tokens(text, model_name):
+    """Return the number of tokens of text for the given GPT model."""
+    return len(get_token_encoding(model_name).encode(text, disallowed_special=()))
+
+def count_message_tokens(messages, model_name):
+    """Return the number of prompt tokens a list of chat messages costs, framing included."""
+    return sum(TOKENS_PER_MESSAGE + count_tokens(message['content'], model_name) for message in messages) + TOKENS_PER_REPLY
+
+def _text_key(text):
+    """Return a key that is equal for chunks differing only in case and whitespace."""
+    return hashlib.sha1(" ".join(text.lower().split()).encode('utf-8')).hexdigest()
+
+def _source_order(chunk):
+    """Sort key placing chunks in reading order: by file, page and position on the page."""
+    metadata = chunk.get('metadata') or {}
+    return (str(metadata.get('file_name', '')), metadata.get('page_number') or 0, metadata.get('chunk_index') or 0)
+
+def build_context(chunks, model_name, max_tokens=2000):
+    """
+    Assemble the document context of an answer prompt within a token budget.
+
+    Chunks are taken best first while they fit into max_tokens, measured with the GPT
+    model's tokenizer; a chunk that does not fit is skipped so that smaller, lower ranked
+    chunks can still use the rest of the budget. Exact duplicates and chunks contained in
+    an already selected chunk are dropped. The selected chunks are then put in reading
+    order (file, page, position), which keeps neighbouring chunks of a page together. If
+    not even the best chunk fits, it is truncated to the budget.
+
+    Args:
+    chunks (list): Dictionaries with the chunk 'document' and its 'metadata', best first.
+    model_name (str): The name of the GPT model the prompt is for.
+    max_tokens (int): Maximum number of context tokens. Defaults to 2000.
+
+    Returns:
+    dict: The context 'text', the selected 'chunks' in context order and the number of
+          context 'tokens'.
+    """
+    with metrics.timed('context.build'):
+        encoding = get_token_encoding(model_name)
+        separator_tokens = len(encoding.encode(CHUNK_SEPARATOR, disallowed_special=()))
+        selected = []
+        seen = set()
+        used = 0
+        for chunk in chunks:
+            text = re.sub(r"\s+", " ", chunk['document']).strip()
+            key = _text_key(text)
+            if not text or key in seen or any(text in other['text'] for other in selected):
+                metrics.increment('context.duplicate_chunks')
+                continue
+            seen.add(key)
+            tokens = len(encoding.encode(text, disallowed_special=())) + (separator_tokens if selected else 0)
+            if used + tokens > max_tokens:
+                metrics.increment('context.dropped_chunks')
+                continue
+            selected.append(dict(chunk, text=text))
+            used += tokens
+
+        best = next((chunk for chunk in chunks if chunk['document'].strip()), None)
+        if not selected and best is not None:
+            tokens = encoding.encode(re.sub(r"\s+", " ", best['document']).strip(), disallowed_special=())[:max_tokens]
+            selected.append(dict(best, text=encoding.decode(tokens)))
+            used = len(tokens)
+            metrics.increment('context.truncated_chunks')
+
+        selected.sort(key=_source_order)
+        metrics.increment('context.tokens', used)
+        return {'text': CHUNK_SEPARATOR.join(chunk['text'] for chunk in selected),
+                'chunks': [{key: value for key, value in chunk.items() if key != 'text'} for chunk in selected],
+                'tokens': used}
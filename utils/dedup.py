@@ -0,0 +1,270 @@
+import os
+import re
+import json
+import random
+import hashlib
+
+# Word shingles hashed into the MinHash signature
+SHINGLE_SIZE = 3
+# The signature holds NUM_PERMUTATIONS 32-bit minimums, split into BANDS bands of
+# ROWS_PER_BAND rows. Chunks sharing a band exactly are compared; with these settings a
+# pair with Jaccard similarity 0.85 shares a band with probability above 99%.
+NUM_PERMUTATIONS = 32
+ROWS_PER_BAND = 4
+BANDS = NUM_PERMUTATIONS // ROWS_PER_BAND
+# Estimated Jaccard similarity of shingles above which two chunks are near-duplicates
+NEAR_DUPLICATE_THRESHOLD = 0.85
+
+WORD_PATTERN = re.compile(r"\w+")
+NUMBER_PATTERN = re.compile(r"\d+(?:[.,]\d+)*")
+
+# Largest prime below 2**32, the modulus of the universal hash permutations
+_PRIME = 4294967291
+_random = random.Random(0)
+_PERMUTATIONS = [(_random.randrange(1, _PRIME), _random.randrange(0, _PRIME)) for _ in range(NUM_PERMUTATIONS)]
+
+def _hash32(value):
+    """Return a stable 32-bit hash of a string."""
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=4).digest(), 'big')
+
+def chunk_signature(text):
+    """
+    Compute the fingerprints used to detect duplicate chunks.
+
+    Case, punctuation and whitespace are ignored. The numbers of a chunk are fingerprinted
+    separately and must match exactly, so two copies of a procedure that only differ in a
+    torque value or a part number are never merged.
+
+    Args:
+    text (str): The chunk text.
+
+    Returns:
+    tuple: The exact content hash (str), the MinHash signature of the word shingles
+           (hex str) and the hash of the numbers in the chunk (str).
+    """
+    import numpy as np
+
+    words = WORD_PATTERN.findall(text.lower())
+    content_hash = hashlib.sha1(" ".join(words).encode('utf-8')).hexdigest()
+    numbers_key = hashlib.sha1(" ".join(NUMBER_PATTERN.findall(text)).encode('utf-8')).hexdigest()[:16]
+
+    shingles = {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(max(1, len(words) - SHINGLE_SIZE + 1))}
+    hashes = np.array([_hash32(shingle) for shingle in shingles], dtype=np.uint64)
+    a, b = (np.array(column, dtype=np.uint64) for column in zip(*_PERMUTATIONS))
+    # (a * h + b) stays below 2**64 because a, b and h are all below 2**32
+    minimums = ((hashes[:, None] * a + b) % np.uint64(_PRIME)).min(axis=0)
+    return content_hash, minimums.astype('>u4').tobytes().hex(), numbers_key
+
+def _similarity(minhash, other):
+    """Estimate the Jaccard similarity of two chunks from their MinHash signatures."""
+    rows = range(0, 8 * NUM_PERMUTATIONS, 8)
+    return sum(minhash[i:i + 8] == other[i:i + 8] for i in rows) / NUM_PERMUTATIONS
+
+def _band_keys(minhash, numbers_key):
+    """Return the lookup keys of the bands of a signature."""
+    width = 8 * ROWS_PER_BAND
+    return [f"{band}:{minhash[band * width:(band + 1) * width]}:{numbers_key}" for band in range(BANDS)]
+
+def _near_duplicates(signature, other):
+    """Return True if two stored signatures are exact or near-duplicates."""
+    return other[2] == signature[2] and (other[0] == signature[0]
+                                         or _similarity(signature[1], other[1]) >= NEAR_DUPLICATE_THRESHOLD)
+
+def create_dedup_index():
+    """
+    Create an empty duplicate-chunk index.
+
+    Returns:
+    dict: An index with the chunk id of every exact content 'hash', the 'signatures' of
+          the stored chunks, the 'bands' used to find near-duplicates (rebuilt from the
+          signatures when needed, never saved), the extra 'sources'
+          ([doc hash, file name, page number]) of every stored chunk that was seen again,
+          and per document hash the 'chunks' it stored and the chunks it 'duplicates'.
+    """
+    return {'hashes': {}, 'signatures': {}, 'bands': {}, 'sources': {}, 'documents': {}}
+
+def _document_entry(index, doc_hash):
+    """Return the bookkeeping entry of a document, creating it if needed."""
+    return index['documents'].setdefault(doc_hash, {'chunks': [], 'duplicates': []})
+
+def _bands(index):
+    """Return the band lookup table, rebuilding it from the signatures after a load."""
+    bands = index.get('bands')
+    if bands is None:
+        bands = index['bands'] = {}
+        for chunk_id, (_, minhash, numbers_key) in index['signatures'].items():
+            for key in _band_keys(minhash, numbers_key):
+                bands.setdefault(key, []).append(chunk_id)
+    return bands
+
+def find_duplicate(index, signature):
+    """
+    Look up a stored chunk that the signature duplicates exactly or nearly.
+
+    Args:
+    index (dict): The duplicate-chunk index.
+    signature (tuple): The signature from chunk_signature.
+
+    Returns:
+    str: The id of the stored chunk, or None.
+    """
+    content_hash, minhash, numbers_key = signature
+    if content_hash in index['hashes']:
+        return index['hashes'][content_hash]
+    bands = _bands(index)
+    for key in _band_keys(minhash, numbers_key):
+        for chunk_id in bands.get(key, ()):
+            if _near_duplicates(signature, index['signatures'][chunk_id]):
+                return chunk_id
+    return None
+
+def register_chunk(index, chunk_id, signature, doc_hash):
+    """
+    Record a chunk that is stored in the vector store.
+
+    Args:
+    index (dict): The duplicate-chunk index.
+    chunk_id (str): The id of the chunk (same as in the vector store).
+    signature (tuple): The signature from chunk_signature.
+    doc_hash (str): Hash of the document the chunk belongs to.
+    """
+    content_hash, minhash, numbers_key = signature
+    bands = _bands(index)
+    index['hashes'].setdefault(content_hash, chunk_id)
+    index['signatures'][chunk_id] = [content_hash, minhash, numbers_key]
+    for key in _band_keys(minhash, numbers_key):
+        bands.setdefault(key, []).append(chunk_id)
+    _document_entry(index, doc_hash)['chunks'].append(chunk_id)
+
+def add_duplicate_source(index, chunk_id, doc_hash, file_name, page_number):
+    """
+    Record that a document contains a duplicate of a stored chunk.
+
+    Args:
+    index (dict): The duplicate-chunk index.
+    chunk_id (str): The id of the stored chunk.
+    doc_hash (str): Hash of the document containing the duplicate.
+    file_name (str): Name of that document.
+    page_number (int): Page of the duplicate, or None.
+    """
+    index['sources'].setdefault(chunk_id, []).append([doc_hash, file_name, page_number])
+    duplicates = _document_entry(index, doc_hash)['duplicates']
+    if chunk_id not in duplicates:
+        duplicates.append(chunk_id)
+
+def remove_document_from_dedup_index(index, doc_hash):
+    """
+    Remove a document's chunks and duplicate sources from the index.
+
+    A stored chunk that other documents contain as well stays in the index: it is handed
+    over to the first of its remaining sources, which becomes its owner.
+
+    Args:
+    index (dict): The duplicate-chunk index.
+    doc_hash (str): Hash of the document to remove.
+
+    Returns:
+    list: (chunk id, doc hash, file name, page number) of every chunk handed over to
+          another document. The caller moves the stored chunk to that document.
+    """
+    entry = index['documents'].pop(doc_hash, None)
+    if entry is None:
+        return []
+    for chunk_id in entry['duplicates']:
+        remaining = [source for source in index['sources'].get(chunk_id, []) if source[0] != doc_hash]
+        if remaining:
+            index['sources'][chunk_id] = remaining
+        else:
+            index['sources'].pop(chunk_id, None)
+    handed_over = []
+    # Bands that were not rebuilt since the load need no upkeep
+    bands = index.get('bands')
+    for chunk_id in entry['chunks']:
+        sources = index['sources'].pop(chunk_id, [])
+        if sources:
+            owner_hash, file_name, page_number = sources[0]
+            if len(sources) > 1:
+                index['sources'][chunk_id] = sources[1:]
+            owner = _document_entry(index, owner_hash)
+            owner['chunks'].append(chunk_id)
+            if chunk_id in owner['duplicates'] and not any(source[0] == owner_hash for source in sources[1:]):
+                owner['duplicates'].remove(chunk_id)
+            handed_over.append((chunk_id, owner_hash, file_name, page_number))
+            continue
+        content_hash, minhash, numbers_key = index['signatures'].pop(chunk_id, (None, '', ''))
+        if index['hashes'].get(content_hash) == chunk_id:
+            del index['hashes'][content_hash]
+        for key in _band_keys(minhash, numbers_key) if bands is not None else ():
+            band = bands.get(key, [])
+            if chunk_id in band:
+                band.remove(chunk_id)
+                if not band:
+                    del bands[key]
+    return handed_over
+
+def collapse_duplicates(index, chunk_ids):
+    """
+    Drop ranked chunks that nearly duplicate a better ranked one.
+
+    Only chunks registered in the index are compared; unknown ids are always kept.
+
+    Args:
+    index (dict): The duplicate-chunk index.
+    chunk_ids (list): Chunk ids, best match first.
+
+    Returns:
+    dict: The kept chunk ids, in order, mapped to the ids collapsed into each of them.
+    """
+    kept = {}
+    for chunk_id in chunk_ids:
+        signature = index['signatures'].get(chunk_id)
+        target = None
+        if signature is not None:
+            for kept_id in kept:
+                kept_signature = index['signatures'].get(kept_id)
+                if kept_signature is not None and _near_duplicates(signature, kept_signature):
+                    target = kept_id
+                    break
+        if target is None:
+            kept[chunk_id] = []
+        else:
+            kept[target].append(chunk_id)
+    return kept
+
+def save_dedup_index(index, index_file):
+    """
+    Save a duplicate-chunk index to a JSON file. The bands are left out: they are
+    derived from the signatures and only needed while indexing.
+
+    Args:
+    index (dict): The duplicate-chunk index.
+    index_file (str): Path to the output JSON file.
+    """
+    try:
+        tmp_file = index_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump({key: value for key, value in index.items() if key != 'bands'}, f)
+        os.replace(tmp_file, index_file)
+    except Exception as e:
+        print(f"Error saving dedup index to '{index_file}': {e}")
+
+def load_dedup_index(index_file):
+    """
+    Load a duplicate-chunk index from a JSON file.
+
+    Args:
+    index_file (str): Path to the JSON file.
+
+    Returns:
+    dict: The duplicate-chunk index, or an empty index if the file does not exist or cannot be read.
+    """
+    try:
+        if os.path.exists(index_file):
+            with open(index_file, 'r') as f:
+                index = json.load(f)
+            # Files written by earlier versions still contain the bands
+            index.pop('bands', None)
+            return index
+    except Exception as e:
+        print(f"Error loading dedup index from '{index_file}': {e}")
+    return create_dedup_index()
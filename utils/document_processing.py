@@ -1,109 +1,375 @@
 import os
 import json
-import time
+import hashlib
+import collections
+import multiprocessing
+import concurrent.futures
 from concurrent.futures import ProcessPoolExecutor
-from tqdm import tqdm
-from utils.pdf_processing import extract_text_from_pdf
+from utils.pdf_preprocessing import extract_text_layer, find_image_pages, build_page_records
+from utils.document_store import DocumentStore
+from utils import metrics
+from utils.ocr import init_ocr_worker, get_tesseract_cmd, pages_needing_ocr, figure_pages_to_ocr, ocr_pages
 
-def process_single_document(file_name, documents_path):
+def compute_file_hash(file_path, block_size=1 << 20):
     """
-    Process a single PDF document.
+    Compute the SHA-256 hash of a file's contents.
+
+    Args:
+    file_path (str): Path to the file to hash.
+    block_size (int): Number of bytes read per iteration. Defaults to 1 MiB.
+
+    Returns:
+    str: The hexadecimal SHA-256 digest of the file.
+    """
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+def extract_document_text_layer(file_name, documents_path, find_figures=True):
+    """
+    Extract the text layer of a single PDF document.
 
     Args:
     file_name (str): Name of the PDF file to process.
     documents_path (str): Path to the directory containing the PDF files.
+    find_figures (bool): Also list the pages that embed images. Defaults to True.
 
     Returns:
-    dict: A dictionary containing extracted text and metadata, or None if processing fails.
+    dict: A dictionary containing the text layer, the pages with images and metadata,
+          or None if processing fails.
     """
     try:
         # Construct the full path to the PDF file
         pdf_path = os.path.join(documents_path, file_name)
-        # Extract text and images from the PDF
-        text, images_text, page_texts = extract_text_from_pdf(pdf_path)
-        # Return a dictionary with the extracted information
+        page_texts, page_count = extract_text_layer(pdf_path)
         return {
             'file_name': file_name,
-            'text': text,
-            'images_text': images_text,
-            'page_texts': page_texts
+            'page_texts': page_texts,
+            'page_count': page_count,
+            'image_pages': find_image_pages(pdf_path) if find_figures else []
         }
     except Exception as e:
         print(f"Error processing document '{file_name}': {e}")
         return None
 
-def save_processed_documents(documents, output_file):
+def ocr_document_pages(file_name, documents_path, page_numbers, dpi=200, figure_pages=()):
     """
-    Save processed documents to a JSON file.
+    OCR a range of pages of a single PDF document; one unit of work for the process pool.
 
     Args:
-    documents (list): List of processed document dictionaries.
-    output_file (str): Path to the output JSON file.
+    file_name (str): Name of the PDF file.
+    documents_path (str): Path to the directory containing the PDF files.
+    page_numbers (list): The 1-based page numbers to OCR.
+    dpi (int): Rasterization resolution. Defaults to 200.
+    figure_pages (list): Pages among page_numbers of which only the figures are OCRed.
+
+    Returns:
+    list: (page_number, text) tuples.
     """
-    try:
-        with open(output_file, 'w') as f:
-            json.dump(documents, f)
-    except Exception as e:
-        print(f"Error saving processed documents to '{output_file}': {e}")
+    return ocr_pages(os.path.join(documents_path, file_name), page_numbers, dpi, figure_pages)
+
+def _split_into_units(page_numbers, pages_per_unit):
+    """Split a list of page numbers into consecutive ranges of at most pages_per_unit pages."""
+    return [page_numbers[i:i + pages_per_unit] for i in range(0, len(page_numbers), pages_per_unit)]
+
+def _extract_documents(file_names, documents_path, ocr_options=None, pages_per_unit=4, max_in_flight=None):
+    """
+    Extract text from PDF documents, spreading OCR across processes page range by page range.
+
+    Files are opened one after another: the text layer of a file is read first, then the
+    pages that still need OCR are split into units of at most pages_per_unit pages, so one
+    long scanned manual is shared by all workers instead of occupying a single one. Pages
+    with a text layer that embed images are OCRed too, but only their figure regions. OCR
+    results are reassembled in page order per file.
+
+    At most max_in_flight tasks are queued in the pool, and OCR units of open files go
+    before new files. Memory therefore does not grow with the number of files, and when
+    the caller stops consuming documents no new work is started.
+
+    Args:
+    file_names (list): Names of the PDF files to process.
+    documents_path (str): Path to the directory containing the PDF files.
+    ocr_options (dict): 'dpi', 'min_text_chars' and 'figures' OCR settings. Optional.
+    pages_per_unit (int): Maximum number of pages per OCR work unit. Defaults to 4.
+    max_in_flight (int): Maximum number of queued tasks. Defaults to twice the CPU count.
+
+    Yields:
+    tuple: (file name, document dictionary or None) as each document is completed.
+    """
+    from tqdm import tqdm
+
+    ocr_options = ocr_options or {}
+    dpi = ocr_options.get('dpi', 200)
+    min_text_chars = ocr_options.get('min_text_chars', 200)
+    figures = ocr_options.get('figures', True)
+    max_in_flight = max_in_flight or 2 * (os.cpu_count() or 1)
+
+    # Workers limit Tesseract to one thread each in init_ocr_worker. They are spawned, not
+    # forked: the server ingests from a background thread while other threads hold locks.
+    with ProcessPoolExecutor(mp_context=multiprocessing.get_context('spawn'), initializer=init_ocr_worker,
+                             initargs=(get_tesseract_cmd(), metrics.metrics_enabled())) as executor, \
+            tqdm(total=len(file_names), desc="Extracting Documents") as progress:
+        remaining_files = iter(file_names)
+        ocr_units = collections.deque()
+        futures = {}
+        text_layers = {}
+        ocr_results = {}
+        remaining_units = {}
+        while True:
+            # Fill the pool: OCR units of open files first, so documents complete early
+            while len(futures) < max_in_flight:
+                if ocr_units:
+                    file_name, unit, unit_figure_pages = ocr_units.popleft()
+                    futures[executor.submit(metrics.run_with_metrics, ocr_document_pages, file_name, documents_path,
+                                            unit, dpi, unit_figure_pages)] = ('ocr', file_name)
+                    continue
+                file_name = next(remaining_files, None)
+                if file_name is None:
+                    break
+                futures[executor.submit(metrics.run_with_metrics, extract_document_text_layer, file_name,
+                                        documents_path, figures)] = ('text', file_name)
+            if not futures:
+                break
+
+            done, _ = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                kind, file_name = futures.pop(future)
+                if kind == 'text':
+                    try:
+                        layer, worker_metrics = future.result()
+                        metrics.merge(worker_metrics)
+                    except Exception as e:
+                        print(f"Error processing {file_name}: {e}")
+                        layer = None
+                    if layer is None:
+                        progress.update()
+                        yield file_name, None
+                        continue
+                    # Queue the pages without a usable text layer and the figures of the others
+                    page_numbers = pages_needing_ocr(layer['page_texts'], layer['page_count'], min_text_chars)
+                    figure_pages = figure_pages_to_ocr(layer['image_pages'], page_numbers)
+                    units = _split_into_units(sorted(page_numbers + figure_pages), pages_per_unit)
+                    if not units:
+                        # Files that need no OCR are complete already
+                        progress.update()
+                        yield file_name, _assemble_document(layer, [])
+                        continue
+                    text_layers[file_name] = layer
+                    ocr_results[file_name] = []
+                    remaining_units[file_name] = len(units)
+                    ocr_units.extend((file_name, unit, [page_number for page_number in unit if page_number in figure_pages])
+                                     for unit in units)
+                else:
+                    try:
+                        page_results, worker_metrics = future.result()
+                        ocr_results[file_name].extend(page_results)
+                        metrics.merge(worker_metrics)
+                    except Exception as e:
+                        print(f"Error running OCR on {file_name}: {e}")
+                    remaining_units[file_name] -= 1
+                    if remaining_units[file_name] == 0:
+                        del remaining_units[file_name]
+                        progress.update()
+                        yield file_name, _assemble_document(text_layers.pop(file_name), ocr_results.pop(file_name))
+
+def _assemble_document(layer, page_results):
+    """Merge a file's text layer with its OCR output into per-page records."""
+    return {
+        'file_name': layer['file_name'],
+        'pages': build_page_records(layer['page_texts'], page_results, layer['page_count'])
+    }
+
+def _upgrade_document(document):
+    """
+    Convert a document cached by an older version into per-page records.
+
+    Older caches kept the OCR text of the whole file in a single 'images_text' string.
+    It is kept as a record without a page number rather than re-running OCR.
+    """
+    if 'pages' in document:
+        return document
+    pages = [{'page_number': page_number, 'text': text, 'ocr_text': ''}
+             for page_number, text in document.get('page_texts', [])]
+    if document.get('images_text', '').strip():
+        pages.append({'page_number': None, 'text': '', 'ocr_text': document['images_text']})
+    return {'file_name': document['file_name'], 'pages': pages}
 
 def load_processed_documents(output_file):
     """
-    Load processed documents from a JSON file.
+    Load processed documents from the JSON cache written by older versions.
+
+    Only used to migrate that cache into the document store. The oldest format is a plain
+    list of documents, which is returned as a list so the caller can attach file metadata.
 
     Args:
     output_file (str): Path to the JSON file containing processed documents.
 
     Returns:
-    list: List of processed document dictionaries, or None if loading fails.
+    dict or list: The manifest (file name -> entry), a legacy list of documents, or None if loading fails.
     """
     try:
         if os.path.exists(output_file):
             with open(output_file, 'r') as f:
-                return json.load(f)
+                data = json.load(f)
+            if isinstance(data, dict) and 'files' in data:
+                files = data.get('files', {})
+                for entry in files.values():
+                    entry['document'] = _upgrade_document(entry['document'])
+                return files
+            if isinstance(data, list):
+                return data
+            print(f"Unrecognized format in '{output_file}', ignoring it.")
     except Exception as e:
         print(f"Error loading processed documents from '{output_file}': {e}")
     return None
 
-def process_documents(documents_path, output_file):
+def _file_stat(file_path):
+    """Return the (size, mtime_ns) pair used to detect changed files without hashing them."""
+    stat = os.stat(file_path)
+    return stat.st_size, stat.st_mtime_ns
+
+def _migrate_legacy_documents(legacy_documents, documents_path):
+    """
+    Convert a legacy list of processed documents into a manifest.
+
+    The legacy cache carries no file metadata, so documents whose file still exists are
+    adopted with the file's current size, mtime and hash.
+
+    Args:
+    legacy_documents (list): List of processed document dictionaries.
+    documents_path (str): Path to the directory containing the PDF files.
+
+    Returns:
+    dict: A manifest mapping file name to its entry.
+    """
+    manifest = {}
+    for doc in legacy_documents:
+        file_path = os.path.join(documents_path, doc.get('file_name', ''))
+        if not os.path.isfile(file_path):
+            continue
+        size, mtime_ns = _file_stat(file_path)
+        manifest[doc['file_name']] = {
+            'size': size,
+            'mtime_ns': mtime_ns,
+            'hash': compute_file_hash(file_path),
+            'document': _upgrade_document(doc)
+        }
+    print(f"Migrated {len(manifest)} documents from the legacy cache format.")
+    return manifest
+
+def _migrate_json_cache(store, legacy_file, documents_path):
     """
-    Process multiple PDF documents in parallel.
+    Import the JSON cache written by older versions into the document store.
+
+    The JSON file is renamed to '<name>.migrated' afterwards so it is only imported once.
+
+    Args:
+    store (DocumentStore): The (empty) document store.
+    legacy_file (str): Path to the old processed_documents.json.
+    documents_path (str): Path to the directory containing the PDF files.
+    """
+    manifest = load_processed_documents(legacy_file)
+    if manifest is None:
+        return
+    if isinstance(manifest, list):
+        manifest = _migrate_legacy_documents(manifest, documents_path)
+    for file_name, entry in manifest.items():
+        store.put_document(file_name, entry['size'], entry['mtime_ns'], entry['hash'], entry['document']['pages'])
+    os.replace(legacy_file, legacy_file + '.migrated')
+    print(f"Imported {len(manifest)} documents from '{legacy_file}' into the document store.")
+
+def _entry_is_current(entry, file_path, size, mtime_ns):
+    """
+    Check whether a manifest entry still describes the file on disk.
+
+    Size and mtime are compared first; the content hash is only computed when they differ,
+    so touched-but-unchanged files are still treated as hits.
+
+    Returns:
+    bool: True if the stored document can be reused.
+    """
+    if entry.get('size') == size and entry.get('mtime_ns') == mtime_ns:
+        return True
+    if entry.get('size') != size:
+        return False
+    return compute_file_hash(file_path) == entry.get('hash')
+
+def open_document_store(documents_path, store_path, legacy_cache_file=None):
+    """
+    Open the document store and work out which PDFs have to be (re)processed.
+
+    Stored documents whose file no longer exists are evicted right away. Files whose size,
+    mtime or content changed, and new files, are returned as pending; only they are hashed.
 
     Args:
     documents_path (str): Path to the directory containing PDF files.
-    output_file (str): Path to the output JSON file for saving processed documents.
+    store_path (str): Path to the SQLite document store.
+    legacy_cache_file (str): processed_documents.json from older versions, imported into an
+                             empty store. Optional.
 
     Returns:
-    list: List of processed document dictionaries.
+    tuple: The DocumentStore, the pending files (file name -> {'size', 'mtime_ns', 'hash'}),
+           the number of cache hits and the number of evicted documents.
     """
-    # Try to load previously processed documents
-    documents = load_processed_documents(output_file)
-    if documents is not None:
-        print("Loaded processed documents from file.")
-        return documents
+    store = DocumentStore(store_path)
+    if legacy_cache_file and len(store) == 0 and os.path.exists(legacy_cache_file):
+        _migrate_json_cache(store, legacy_cache_file, documents_path)
+    manifest = store.manifest()
 
-    documents = []
     # Get a list of all PDF files in the specified directory
-    pdf_files = [file_name for file_name in os.listdir(documents_path) if file_name.endswith('.pdf')]
-    print(f"Found {len(pdf_files)} PDF documents to process.")
-    start_time = time.time()
-
-    # Use ProcessPoolExecutor for parallel processing
-    with ProcessPoolExecutor() as executor:
-        # Submit all tasks to the executor
-        futures = {executor.submit(process_single_document, file_name, documents_path): file_name for file_name in pdf_files}
-        # Process completed tasks with a progress bar
-        for future in tqdm(concurrent.futures.as_completed(futures), total=len(futures), desc="Processing Documents"):
-            file_name = futures[future]
-            try:
-                result = future.result()
-                if result:
-                    documents.append(result)
-                    print(f"Successfully processed: {file_name}")
-            except Exception as e:
-                print(f"Error processing {file_name}: {e}")
-
-    elapsed_time = time.time() - start_time
-    print(f"Processing completed in {elapsed_time:.2f} seconds.")
-    # Save the processed documents to a file
-    save_processed_documents(documents, output_file)
-    return documents
+    pdf_files = sorted(file_name for file_name in os.listdir(documents_path) if file_name.endswith('.pdf'))
+    print(f"Found {len(pdf_files)} PDF documents.")
+
+    # Evict documents whose files were removed
+    evicted = [file_name for file_name in manifest if file_name not in pdf_files]
+    for file_name in evicted:
+        store.delete_document(file_name)
+
+    # Split the remaining files into cache hits and files that need (re)processing
+    hits = 0
+    pending = {}
+    for file_name in pdf_files:
+        file_path = os.path.join(documents_path, file_name)
+        size, mtime_ns = _file_stat(file_path)
+        entry = manifest.get(file_name)
+        if entry is not None and _entry_is_current(entry, file_path, size, mtime_ns):
+            hits += 1
+            if entry['mtime_ns'] != mtime_ns:
+                # Content is unchanged, refresh the mtime so the next run takes the fast path
+                store.touch(file_name, mtime_ns)
+        else:
+            pending[file_name] = {'size': size, 'mtime_ns': mtime_ns, 'hash': compute_file_hash(file_path)}
+
+    metrics.increment('document_cache.hits', hits)
+    metrics.increment('document_cache.misses', len(pending))
+    metrics.increment('document_cache.evictions', len(evicted))
+    return store, pending, hits, len(evicted)
+
+def store_documents(store, pending, documents_path, ocr_options=None, pages_per_unit=4):
+    """
+    Extract the pending PDFs and commit each document to the store as soon as it is complete.
+
+    Args:
+    store (DocumentStore): The document store.
+    pending (dict): The pending files returned by open_document_store.
+    documents_path (str): Path to the directory containing PDF files.
+    ocr_options (dict): 'dpi', 'min_text_chars' and 'figures' OCR settings. Optional.
+    pages_per_unit (int): Maximum number of pages per OCR work unit. Defaults to 4.
+
+    Yields:
+    dict: The 'file_name', 'file_hash' and 'pages' of every stored document, in completion order.
+    """
+    if not pending:
+        return
+    # Only new or changed files are extracted
+    for file_name, result in _extract_documents(list(pending), documents_path, ocr_options, pages_per_unit):
+        if result:
+            info = pending[file_name]
+            store.put_document(file_name, info['size'], info['mtime_ns'], info['hash'], result['pages'])
+            print(f"Successfully processed: {file_name}")
+            yield {'file_name': file_name, 'file_hash': info['hash'], 'pages': result['pages']}
+        else:
+            # Drop any stale entry so the file is retried on the next run
+            store.delete_document(file_name)
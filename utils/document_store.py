@@ -0,0 +1,126 @@
+import sqlite3
+import threading
+
+class DocumentStore:
+    """
+    SQLite-backed store of processed documents with one row per page.
+
+    The documents table is the ingestion manifest (size, mtime and content hash per
+    file); the pages table holds the text layer and OCR text of every page. Documents
+    are read lazily one at a time, so the corpus never has to be loaded into memory.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "file_name TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, hash TEXT)")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "file_name TEXT, position INTEGER, page_number INTEGER, text TEXT, ocr_text TEXT, "
+            "PRIMARY KEY (file_name, position))")
+        self._connection.commit()
+
+    def manifest(self):
+        """
+        Return the manifest entry of every stored document, without any page text.
+
+        Returns:
+        dict: File name -> {'size', 'mtime_ns', 'hash'}.
+        """
+        with self._lock:
+            rows = self._connection.execute("SELECT file_name, size, mtime_ns, hash FROM documents").fetchall()
+        return {file_name: {'size': size, 'mtime_ns': mtime_ns, 'hash': file_hash}
+                for file_name, size, mtime_ns, file_hash in rows}
+
+    def put_document(self, file_name, size, mtime_ns, file_hash, pages):
+        """
+        Insert or replace a document and its pages in a single transaction.
+
+        Args:
+        file_name (str): Name of the PDF file.
+        size (int): File size in bytes.
+        mtime_ns (int): File modification time in nanoseconds.
+        file_hash (str): SHA-256 of the file contents.
+        pages (list): Page records with 'page_number', 'text' and 'ocr_text'.
+        """
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM pages WHERE file_name = ?", (file_name,))
+            self._connection.execute(
+                "INSERT OR REPLACE INTO documents (file_name, size, mtime_ns, hash) VALUES (?, ?, ?, ?)",
+                (file_name, size, mtime_ns, file_hash))
+            self._connection.executemany(
+                "INSERT INTO pages (file_name, position, page_number, text, ocr_text) VALUES (?, ?, ?, ?, ?)",
+                [(file_name, position, page['page_number'], page['text'], page['ocr_text'])
+                 for position, page in enumerate(pages)])
+
+    def touch(self, file_name, mtime_ns):
+        """Record a new modification time for a file whose content did not change."""
+        with self._lock, self._connection:
+            self._connection.execute("UPDATE documents SET mtime_ns = ? WHERE file_name = ?", (mtime_ns, file_name))
+
+    def delete_document(self, file_name):
+        """Remove a document and its pages."""
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM pages WHERE file_name = ?", (file_name,))
+            self._connection.execute("DELETE FROM documents WHERE file_name = ?", (file_name,))
+
+    def get_pages(self, file_name):
+        """
+        Load the pages of one document.
+
+        Args:
+        file_name (str): Name of the PDF file.
+
+        Returns:
+        list: Page records with 'page_number', 'text' and 'ocr_text', in page order.
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT page_number, text, ocr_text FROM pages WHERE file_name = ? ORDER BY position",
+                (file_name,)).fetchall()
+        return [{'page_number': page_number, 'text': text, 'ocr_text': ocr_text}
+                for page_number, text, ocr_text in rows]
+
+    def get_document(self, file_name):
+        """
+        Load one document with its pages.
+
+        Args:
+        file_name (str): Name of the PDF file.
+
+        Returns:
+        dict: The 'file_name', 'file_hash' and 'pages' of the document, or None if it is not stored.
+        """
+        with self._lock:
+            row = self._connection.execute("SELECT hash FROM documents WHERE file_name = ?", (file_name,)).fetchone()
+        if row is None:
+            return None
+        return {'file_name': file_name, 'file_hash': row[0], 'pages': self.get_pages(file_name)}
+
+    def iter_documents(self, file_names=None):
+        """
+        Yield stored documents one at a time.
+
+        Args:
+        file_names (iterable): Names of the documents to load. Defaults to all stored documents.
+
+        Yields:
+        dict: The 'file_name', 'file_hash' and 'pages' of each document.
+        """
+        for file_name in sorted(self.manifest()) if file_names is None else file_names:
+            document = self.get_document(file_name)
+            if document is not None:
+                yield document
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def close(self):
+        """Close the underlying database."""
+        with self._lock:
+            self._connection.close()
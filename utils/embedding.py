@@ -1,87 +1,565 @@
-from sentence_transformers import SentenceTransformer, util
-import chromadb
+import json
+import os
+import re
+import time
+import threading
+from functools import lru_cache
+from utils.bm25 import (load_bm25_index, save_bm25_index, add_to_bm25_index,
+                        remove_document_from_bm25_index, move_chunk_in_bm25_index)
+from utils.dedup import (load_dedup_index, save_dedup_index, chunk_signature, find_duplicate, register_chunk,
+                         add_duplicate_source, remove_document_from_dedup_index)
+from utils.pipeline import run_pipeline
+from utils import metrics
 
-def split_text_to_chunks(text, max_tokens=256):
+DEFAULT_EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
+
+# Bumped whenever the chunking or the chunk metadata layout changes
+INDEX_VERSION = 3
+
+@lru_cache(maxsize=None)
+def get_embedding_model(model_name=DEFAULT_EMBEDDING_MODEL):
     """
-    Split text into chunks based on a maximum token count.
+    Load a SentenceTransformer model once and reuse it for the rest of the process.
 
     Args:
-    text (str): The input text to be split.
-    max_tokens (int): The maximum number of tokens per chunk. Defaults to 256.
+    model_name (str): Name of the SentenceTransformer model. Defaults to 'all-MiniLM-L6-v2'.
 
     Returns:
-    list: A list of text chunks, each containing no more than max_tokens.
+    SentenceTransformer: The loaded embedding model.
+    """
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name)
+
+# Sentence ends followed by the start of a new sentence, or a blank line (paragraph break)
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+(?=["\'(\[]?[A-Z0-9])|\n\s*\n')
+
+def get_tokenizer(model_name=DEFAULT_EMBEDDING_MODEL):
     """
-    from nltk.tokenize import sent_tokenize
-    
-    # Split the text into sentences
-    sentences = sent_tokenize(text)
-    chunks = []
+    Return the tokenizer of the embedding model, so chunk sizes are counted in the same
+    wordpieces the model truncates on.
+
+    Args:
+    model_name (str): Name of the SentenceTransformer model. Defaults to 'all-MiniLM-L6-v2'.
+
+    Returns:
+    PreTrainedTokenizerFast: The model's tokenizer.
+    """
+    return get_embedding_model(model_name).tokenizer
+
+def _split_sentences(text):
+    """Split text into stripped, non-empty sentences."""
+    return [sentence.strip() for sentence in SENTENCE_BOUNDARY.split(text) if sentence and sentence.strip()]
+
+def _iter_sentence_pieces(text, tokenizer, budget):
+    """
+    Yield (text, token_count) for every sentence of text.
+
+    All sentences are tokenized in one batched call. A sentence longer than budget tokens
+    (typically OCR output without punctuation) is cut into budget-sized pieces along the
+    tokenizer's character offsets, so no piece is ever truncated by the model.
+    """
+    sentences = _split_sentences(text)
+    if not sentences:
+        return
+    encodings = tokenizer(sentences, add_special_tokens=False, return_offsets_mapping=True)
+    for sentence, input_ids, offsets in zip(sentences, encodings['input_ids'], encodings['offset_mapping']):
+        if not input_ids:
+            continue
+        if len(input_ids) <= budget:
+            yield sentence, len(input_ids)
+            continue
+        for start in range(0, len(offsets), budget):
+            window = offsets[start:start + budget]
+            yield sentence[window[0][0]:window[-1][1]], len(window)
+
+def iter_text_chunks(segments, max_tokens=256, overlap_tokens=0, tokenizer=None):
+    """
+    Stream chunks of at most max_tokens model tokens out of a sequence of text segments.
+
+    Segments (e.g. the text layer and the OCR text of a page) are consumed one at a time
+    and sentences are packed greedily into chunks. When a chunk is full, its trailing
+    sentences totalling at most overlap_tokens are carried over into the next chunk.
+
+    Args:
+    segments (iterable): Text segments to chunk, in order.
+    max_tokens (int): The maximum number of tokens per chunk, including the model's special
+                      tokens. Defaults to 256, the sequence length of all-MiniLM-L6-v2.
+    overlap_tokens (int): Number of tokens repeated between consecutive chunks. Defaults to 0.
+    tokenizer: A fast Hugging Face tokenizer. Defaults to the embedding model's tokenizer.
+
+    Yields:
+    str: The chunks, none of them empty.
+    """
+    if tokenizer is None:
+        tokenizer = get_tokenizer()
+    budget = max(1, max_tokens - tokenizer.num_special_tokens_to_add(pair=False))
+    overlap_tokens = min(max(0, overlap_tokens), budget // 2)
     chunk = []
     total_tokens = 0
-    
-    for sentence in sentences:
-        # Count tokens in the current sentence (approximated by word count)
-        sentence_tokens = len(sentence.split())
-        
-        # If adding this sentence exceeds the max_tokens, start a new chunk
-        if total_tokens + sentence_tokens > max_tokens:
-            chunks.append(' '.join(chunk))
-            chunk = [sentence]
-            total_tokens = sentence_tokens
-        else:
-            chunk.append(sentence)
+    for segment in segments:
+        if not segment:
+            continue
+        for sentence, sentence_tokens in _iter_sentence_pieces(segment, tokenizer, budget):
+            if chunk and total_tokens + sentence_tokens > budget:
+                yield ' '.join(text for text, _ in chunk)
+                # Carry the tail of the finished chunk over as overlap, if it leaves room
+                carried = []
+                carried_tokens = 0
+                for text, tokens in reversed(chunk):
+                    if (carried_tokens + tokens > overlap_tokens
+                            or carried_tokens + tokens + sentence_tokens > budget):
+                        break
+                    carried.append((text, tokens))
+                    carried_tokens += tokens
+                chunk = carried[::-1]
+                total_tokens = carried_tokens
+            chunk.append((sentence, sentence_tokens))
             total_tokens += sentence_tokens
-    
-    # Add the last chunk if it's not empty
     if chunk:
-        chunks.append(' '.join(chunk))
-    
-    return chunks
+        yield ' '.join(text for text, _ in chunk)
+
+def split_text_to_chunks(text, max_tokens=256, overlap_tokens=0, tokenizer=None):
+    """
+    Split text into chunks based on a maximum token count.
+
+    Args:
+    text (str): The input text to be split.
+    max_tokens (int): The maximum number of model tokens per chunk. Defaults to 256.
+    overlap_tokens (int): Number of tokens repeated between consecutive chunks. Defaults to 0.
+    tokenizer: A fast Hugging Face tokenizer. Defaults to the embedding model's tokenizer.
+
+    Returns:
+    list: A list of text chunks, each containing no more than max_tokens.
+    """
+    return list(iter_text_chunks([text], max_tokens, overlap_tokens, tokenizer))
+
+def open_collection(persist_path, name="documents", chunk_options=None, index_options=None):
+    """
+    Open (or create) a persistent chunk collection on disk.
+
+    The collection is a ChromaDB collection, or with index_options['backend'] set to
+    'numpy' a NumpyVectorIndex with the same interface. A collection written with another
+    INDEX_VERSION (an older chunking or metadata layout), chunked with other chunk_options
+    or quantized differently, is dropped together with the lexical and duplicate-chunk
+    indexes so it can be rebuilt.
+
+    Args:
+    persist_path (str): Directory where the collection stores its data.
+    name (str): Name of the collection. Defaults to "documents".
+    chunk_options (dict): The chunking settings the collection must have been built with.
+    index_options (dict): 'backend' ('chroma' or 'numpy', default 'chroma') and, for the
+                          numpy backend, the 'quantization' ('float32', 'float16' or 'int8',
+                          default 'int8').
+
+    Returns:
+    The persistent collection.
+    """
+    index_options = index_options or {}
+    backend = index_options.get('backend', 'chroma')
+    metadata = {"hnsw:space": "cosine", "index_version": INDEX_VERSION}
+    if chunk_options:
+        metadata["chunking"] = json.dumps(chunk_options, sort_keys=True)
+
+    if backend == 'chroma':
+        import chromadb
+
+        client = chromadb.PersistentClient(path=persist_path)
+        collection = client.get_or_create_collection(name, metadata=metadata)
+    elif backend == 'numpy':
+        from utils.vector_index import NumpyVectorIndex
+
+        metadata["quantization"] = index_options.get('quantization', 'int8')
+        collection = NumpyVectorIndex(os.path.join(persist_path, f"numpy_{name}"), metadata)
+    else:
+        from utils.vector_index import VECTOR_BACKENDS
+        raise ValueError(f"Unknown vector backend '{backend}', expected one of {VECTOR_BACKENDS}.")
+
+    existing = collection.metadata or {}
+    rebuild = any(existing.get(key, metadata[key] if key == "chunking" else None) != metadata[key]
+                  for key in metadata if key != "hnsw:space")
+    if rebuild:
+        print(f"Vector store at '{persist_path}' uses an older layout, rebuilding it.")
+        if backend == 'chroma':
+            for existing_collection in client.list_collections():
+                client.delete_collection(getattr(existing_collection, 'name', existing_collection))
+            collection = client.create_collection(name, metadata=metadata)
+        else:
+            collection.reset(metadata)
+    if rebuild or collection.count() == 0:
+        # The lexical and duplicate-chunk indexes describe chunks of another collection
+        for index_file in _index_files(persist_path):
+            if os.path.exists(index_file):
+                os.remove(index_file)
+    return collection
+
+def _indexed_document_hashes(collection):
+    """Return the set of document hashes that have chunks in the collection, scanning every chunk."""
+    existing = collection.get(include=['metadatas'])
+    return {metadata['doc_hash'] for metadata in existing['metadatas'] if metadata and 'doc_hash' in metadata}
+
+def iter_document_chunks(documents, chunk_options=None, tokenizer=None):
+    """
+    Yield (id, chunk, metadata) for every chunk of the given documents.
+
+    Each page (text layer plus OCR text) is chunked on its own, so chunks never straddle
+    pages and every chunk records the page it comes from in its metadata.
 
-def create_vector_store(documents, embedding_model):
+    Args:
+    documents (list): Documents to chunk.
+    chunk_options (dict): 'max_tokens' and 'overlap_tokens' for iter_text_chunks.
+    tokenizer: The tokenizer used to count tokens. Defaults to the embedding model's tokenizer.
+
+    Yields:
+    tuple: The chunk id, the chunk text and its metadata dictionary.
     """
-    Create a vector store from a list of documents using ChromaDB.
+    chunk_options = chunk_options or {}
+    if tokenizer is None:
+        tokenizer = get_tokenizer()
+    for doc in documents:
+        chunk_index = 0
+        for page in doc['pages']:
+            with metrics.timed('chunk.page'):
+                page_chunks = list(iter_text_chunks((page.get('text'), page.get('ocr_text')),
+                                                    tokenizer=tokenizer, **chunk_options))
+            metrics.increment('chunk.count', len(page_chunks))
+            for chunk in page_chunks:
+                metadata = {'file_name': doc['file_name'], 'doc_hash': doc['file_hash'], 'chunk_index': chunk_index}
+                if page['page_number'] is not None:
+                    metadata['page_number'] = page['page_number']
+                yield f"{doc['file_hash']}_chunk_{chunk_index}", chunk, metadata
+                chunk_index += 1
+        if chunk_index == 0:
+            print(f"Warning: Document '{doc['file_name']}' is empty or contains only stop words. Skipping.")
+
+def _index_lexically(chunk_records, bm25_index):
+    """Add chunk records to the BM25 index as they stream past on their way to the embedder."""
+    for chunk_id, chunk, metadata in chunk_records:
+        add_to_bm25_index(bm25_index, chunk_id, chunk, metadata['doc_hash'])
+        yield chunk_id, chunk, metadata
+
+def deduplicate_chunks(chunk_records, dedup_index):
+    """
+    Drop chunks that duplicate an indexed chunk exactly or nearly.
+
+    The file and page of a dropped chunk are recorded as an extra source of the indexed
+    chunk, and every chunk that is kept is registered in the duplicate-chunk index.
 
     Args:
-    documents (list): A list of dictionaries, each containing document text and metadata.
-    embedding_model: A SentenceTransformer model for creating embeddings.
+    chunk_records (iterable): (id, chunk, metadata) tuples.
+    dedup_index (dict): The duplicate-chunk index.
+
+    Yields:
+    tuple: The (id, chunk, metadata) tuples of the chunks to index.
+    """
+    for chunk_id, chunk, metadata in chunk_records:
+        with metrics.timed('dedup.chunk'):
+            signature = chunk_signature(chunk)
+            duplicate_of = find_duplicate(dedup_index, signature)
+        if duplicate_of is not None:
+            add_duplicate_source(dedup_index, duplicate_of, metadata['doc_hash'], metadata['file_name'],
+                                 metadata.get('page_number'))
+            metrics.increment('dedup.duplicates')
+            continue
+        register_chunk(dedup_index, chunk_id, signature, metadata['doc_hash'])
+        yield chunk_id, chunk, metadata
+
+def _backfill_dedup_index(collection, dedup_index, doc_hashes):
+    """Register the chunks of documents indexed before duplicate detection existed."""
+    for doc_hash in doc_hashes:
+        existing = collection.get(where={'doc_hash': doc_hash}, include=['documents'])
+        for chunk_id, chunk in zip(existing['ids'], existing['documents']):
+            register_chunk(dedup_index, chunk_id, chunk_signature(chunk), doc_hash)
+
+def _backfill_bm25_index(collection, bm25_index, doc_hashes):
+    """Rebuild BM25 entries for documents that are in the collection but missing from the index."""
+    for doc_hash in doc_hashes:
+        existing = collection.get(where={'doc_hash': doc_hash}, include=['documents'])
+        for chunk_id, chunk in zip(existing['ids'], existing['documents']):
+            add_to_bm25_index(bm25_index, chunk_id, chunk, doc_hash)
+
+def _hand_over_chunks(collection, bm25_index, doc_hash, handed_over):
+    """Move stored chunks of a removed document to the documents that contain them as well."""
+    if not handed_over:
+        return
+    ids = [chunk_id for chunk_id, _, _, _ in handed_over]
+    existing = collection.get(ids=ids, include=['metadatas'])
+    stored_metadatas = dict(zip(existing['ids'], existing['metadatas']))
+    metadatas = []
+    for chunk_id, owner_hash, file_name, page_number in handed_over:
+        metadata = dict(stored_metadatas.get(chunk_id) or {}, doc_hash=owner_hash, file_name=file_name)
+        metadata.pop('page_number', None)
+        if page_number is not None:
+            metadata['page_number'] = page_number
+        metadatas.append(metadata)
+        move_chunk_in_bm25_index(bm25_index, chunk_id, doc_hash, owner_hash)
+    collection.update(ids=ids, metadatas=metadatas)
+    metrics.increment('dedup.handed_over', len(ids))
+
+def _attribute_document(collection, dedup_index, doc_hash, file_names):
+    """
+    Make the chunks of a document cite one of the files that still hold it.
+
+    Byte-identical files share one set of chunks, which cite the file they were indexed
+    from. When that file is removed or renamed, the chunks and the duplicate sources of
+    the document are moved to a remaining file.
 
     Returns:
-    chromadb.Collection: A ChromaDB collection containing the vectorized documents, or None if an error occurs.
+    str: The file name the document's chunks cite now.
+    """
+    existing = collection.get(where={'doc_hash': doc_hash}, include=['metadatas'])
+    cited = {metadata.get('file_name') for metadata in existing['metadatas'] if metadata}
+    file_name = next((name for name in sorted(file_names) if name in cited), min(file_names))
+    stale = [(chunk_id, dict(metadata, file_name=file_name))
+             for chunk_id, metadata in zip(existing['ids'], existing['metadatas'])
+             if metadata and metadata.get('file_name') != file_name]
+    if stale:
+        collection.update(ids=[chunk_id for chunk_id, _ in stale], metadatas=[metadata for _, metadata in stale])
+    for chunk_id in dedup_index['documents'].get(doc_hash, {}).get('duplicates', []):
+        for source in dedup_index['sources'].get(chunk_id, []):
+            if source[0] == doc_hash:
+                source[1] = file_name
+    metrics.increment('index.reattributed', len(stale))
+    return file_name
+
+def _upsert_batch(collection, records, embeddings):
+    """Bulk-insert a batch of embedded (id, chunk, metadata) records with a single collection call."""
+    ids, chunks, metadatas = (list(column) for column in zip(*records))
+    with metrics.timed('chroma.upsert'):
+        collection.upsert(
+            documents=chunks,
+            metadatas=metadatas,
+            ids=ids,
+            # ChromaDB wants lists, the NumPy backend takes the array as it is
+            embeddings=embeddings if getattr(collection, 'accepts_arrays', False) else embeddings.tolist()
+        )
+    metrics.increment('embed.chunks', len(records))
+
+def _load_index_state(state_file):
+    """
+    Return the index state recorded at the last checkpoint, or None if there is none.
+
+    The state holds the hashes of the fully indexed documents ('complete'), of the
+    documents an indexing run started on but had not finished ('pending'), and the file
+    name the chunks of every document cite ('files').
     """
     try:
-        # Initialize ChromaDB client
-        client = chromadb.Client()
-        collection = client.create_collection("documents")
-        
-        for doc in documents:
-            # Combine main text and text from images
-            combined_text = doc['text'] + " " + doc['images_text']
-            
-            if combined_text.strip():
-                # Split the combined text into chunks
-                chunks = split_text_to_chunks(combined_text)
-                embeddings = []
-                ids = []
-                
-                # Create embeddings for each chunk
-                for i, chunk in enumerate(chunks):
-                    embedding = embedding_model.encode(chunk).tolist()  # Convert numpy array to list
-                    embeddings.append(embedding)
-                    ids.append(f"{doc['file_name']}_chunk_{i}")
-                
-                # Add chunks, embeddings, and metadata to the collection
-                collection.add(
-                    documents=[chunk for chunk in chunks],
-                    metadatas=[{'file_name': doc['file_name']}] * len(chunks),
-                    ids=ids,
-                    embeddings=embeddings
-                )
-            else:
-                print(f"Warning: Document '{doc['file_name']}' is empty or contains only stop words. Skipping.")
-        
-        return collection
+        if os.path.exists(state_file):
+            with open(state_file, 'r') as f:
+                state = json.load(f)
+            return {'complete': set(state['complete']), 'pending': set(state.get('pending', [])),
+                    'files': state.get('files', {})}
     except Exception as e:
-        print(f"Error creating vector store: {e}")
-        return None
+        print(f"Error loading index state from '{state_file}': {e}")
+    return None
+
+def _save_index_state(complete, state_file, pending=(), files=None):
+    """Record the hashes of the fully indexed documents and of those still being indexed, and the files they cite."""
+    try:
+        tmp_file = state_file + '.tmp'
+        kept = set(complete) | set(pending)
+        with open(tmp_file, 'w') as f:
+            json.dump({'complete': sorted(complete), 'pending': sorted(set(pending) - set(complete)),
+                       'files': {doc_hash: file_name for doc_hash, file_name in sorted((files or {}).items())
+                                 if doc_hash in kept}}, f)
+        os.replace(tmp_file, state_file)
+    except Exception as e:
+        print(f"Error saving index state to '{state_file}': {e}")
+
+def _index_files(persist_path):
+    """Return the paths of the BM25 index, the duplicate-chunk index and the index state."""
+    return tuple(os.path.join(persist_path, name) for name in ('bm25_index.json', 'dedup_index.json', 'index_state.json'))
+
+def open_vector_store(persist_path, current_files, chunk_options=None, index_options=None):
+    """
+    Open the vector store and remove what no longer belongs in it, without indexing anything.
+
+    Chunks of documents that changed or no longer exist are deleted, and so are the chunks
+    of documents an interrupted run did not finish (see index_documents). A deleted chunk
+    that other documents contain as well is handed over to one of them instead. Documents
+    whose chunks cite a file that is gone while an identical file remains are attributed
+    to that file.
+
+    Args:
+    persist_path (str): Directory where the index is stored.
+    current_files (dict): The names of the files holding every document hash that should
+                          be in the index.
+    chunk_options (dict): 'max_tokens' and 'overlap_tokens' for the chunker. Changing them
+                          rebuilds the index.
+    index_options (dict): The vector 'backend' and its 'quantization', see open_collection.
+
+    Returns:
+    tuple: The vector store with the 'chunks' collection, the 'bm25' index and the 'dedup'
+           duplicate-chunk index, and the set of hashes of the fully indexed documents.
+    """
+    collection = open_collection(persist_path, chunk_options=chunk_options, index_options=index_options)
+    bm25_file, dedup_file, state_file = _index_files(persist_path)
+    bm25_index = load_bm25_index(bm25_file)
+    dedup_index = load_dedup_index(dedup_file)
+    state = _load_index_state(state_file)
+    if state is None:
+        # Indexes written before the state file existed are scanned once: whatever is
+        # stored counts as complete. A document made only of duplicates has no chunks of
+        # its own but is indexed all the same.
+        stored_hashes = _indexed_document_hashes(collection)
+        complete, pending, files = stored_hashes | set(dedup_index['documents']), set(), {}
+    else:
+        # The state knows every document with chunks in the collection, no scan needed
+        stored_hashes = set()
+        complete, pending, files = state['complete'], state['pending'], state['files']
+
+    # Remove chunks belonging to documents that changed, no longer exist or were left
+    # half-indexed. Chunks other documents contain as well are handed over to one of
+    # them instead, so those documents are not indexed again.
+    known_hashes = complete | pending | stored_hashes | set(bm25_index['documents']) | set(dedup_index['documents'])
+    stale_hashes = known_hashes - set(current_files)
+    incomplete_hashes = known_hashes - complete - stale_hashes
+    removed = stale_hashes | incomplete_hashes
+    for doc_hash in sorted(removed):
+        _hand_over_chunks(collection, bm25_index, doc_hash, remove_document_from_dedup_index(dedup_index, doc_hash))
+        collection.delete(where={'doc_hash': doc_hash})
+        remove_document_from_bm25_index(bm25_index, doc_hash)
+    stored_hashes -= removed
+    complete -= removed
+    if incomplete_hashes:
+        print(f"Vector store: {len(incomplete_hashes)} documents left unfinished by an interrupted run will be indexed again.")
+    if stale_hashes:
+        print(f"Vector store: {len(stale_hashes)} changed or removed documents removed.")
+
+    # Indexes written before the lexical or duplicate index existed are backfilled without re-embedding
+    missing_lexical = stored_hashes - set(bm25_index['documents'])
+    _backfill_bm25_index(collection, bm25_index, missing_lexical)
+    missing_dedup = stored_hashes - set(dedup_index['documents'])
+    _backfill_dedup_index(collection, dedup_index, missing_dedup)
+
+    # Identical files share their chunks: if the file they cite is gone, cite one that remains.
+    # Documents indexed before the cited files were recorded are checked once.
+    reattributed = False
+    for doc_hash in sorted(complete):
+        if files.get(doc_hash) not in current_files[doc_hash]:
+            files[doc_hash] = _attribute_document(collection, dedup_index, doc_hash, current_files[doc_hash])
+            reattributed = True
+
+    if removed or missing_lexical or missing_dedup or state is None or pending or reattributed:
+        save_bm25_index(bm25_index, bm25_file)
+        save_dedup_index(dedup_index, dedup_file)
+        _save_index_state(complete, state_file, files=files)
+    return {'chunks': collection, 'bm25': bm25_index, 'dedup': dedup_index}, complete
+
+def close_vector_store(vector_store):
+    """Release the files held by a vector store; ChromaDB collections need no closing."""
+    close = getattr(vector_store['chunks'], 'close', None)
+    if close is not None:
+        close()
+
+def index_documents(vector_store, documents, persist_path, complete, embedding_model=None, batch_size=128,
+                    chunk_options=None, queue_size=4, checkpoint_seconds=60, doc_hashes=()):
+    """
+    Chunk, embed and upsert documents as a streamed pipeline.
+
+    Chunking (with duplicate detection and BM25 indexing), embedding and upserting run in
+    their own threads, connected by queues of at most queue_size batches, while the
+    documents are produced in the calling thread; documents can therefore be extracted
+    while earlier ones are being embedded. Batches of batch_size chunks mix documents.
+
+    A document is complete once its last chunk is upserted. At most every
+    checkpoint_seconds the BM25 index, the duplicate-chunk index and the set of complete
+    documents are saved, and once more at the end, also when the run fails or is
+    interrupted. Documents are recorded as pending before their first chunk is upserted,
+    so a later run finds whatever an unfinished document left behind without scanning
+    the collection, removes it and indexes the document again.
+
+    Args:
+    vector_store (dict): The vector store returned by open_vector_store.
+    documents (iterable): Documents ('file_name', 'file_hash' and 'pages') to index.
+    persist_path (str): Directory where the index is stored.
+    complete (set): Hashes of the fully indexed documents; updated in place.
+    embedding_model: A SentenceTransformer model for creating embeddings. Loaded on demand if None.
+    batch_size (int): Number of chunks embedded and upserted per batch. Defaults to 128.
+    chunk_options (dict): 'max_tokens' and 'overlap_tokens' for the chunker.
+    queue_size (int): Maximum number of items waiting in front of each stage. Defaults to 4.
+    checkpoint_seconds (float): Minimum time between checkpoints. Defaults to 60.
+    doc_hashes (iterable): Hashes of the documents about to be indexed, recorded as pending
+                           in one go. Others are recorded as the chunker reaches them.
+
+    Returns:
+    int: The number of chunks embedded.
+    """
+    if embedding_model is None:
+        embedding_model = get_embedding_model()
+    collection, bm25_index, dedup_index = vector_store['chunks'], vector_store['bm25'], vector_store['dedup']
+    bm25_file, dedup_file, state_file = _index_files(persist_path)
+    # Held while the chunker updates the BM25 and duplicate-chunk indexes and while they are saved
+    index_lock = threading.Lock()
+    totals = {'chunks': 0, 'documents': 0}
+    pending = set(doc_hashes) - complete
+    # The file the chunks of every document cite, see open_vector_store
+    files = (_load_index_state(state_file) or {}).get('files', {})
+    _save_index_state(complete, state_file, pending, files)
+
+    def checkpoint():
+        with index_lock:
+            save_bm25_index(bm25_index, bm25_file)
+            save_dedup_index(dedup_index, dedup_file)
+            _save_index_state(complete, state_file, pending, files)
+        metrics.increment('index.checkpoints')
+
+    def chunk_stage(documents):
+        batch = []
+        # Hashes of the chunked documents not yet handed on, with the batch length at their last chunk
+        finished = []
+        for doc in documents:
+            with index_lock:
+                files[doc['file_hash']] = doc['file_name']
+                if doc['file_hash'] not in pending:
+                    # Recorded before any of its chunks can reach the collection
+                    pending.add(doc['file_hash'])
+                    _save_index_state(complete, state_file, pending, files)
+                # Drop partial lexical entries left behind by an interrupted run
+                remove_document_from_bm25_index(bm25_index, doc['file_hash'])
+                chunks = iter_document_chunks([doc], chunk_options, embedding_model.tokenizer)
+                batch.extend(_index_lexically(deduplicate_chunks(chunks, dedup_index), bm25_index))
+            finished.append((doc['file_hash'], len(batch)))
+            while len(batch) >= batch_size:
+                yield batch[:batch_size], [doc_hash for doc_hash, end in finished if end <= batch_size]
+                finished = [(doc_hash, end - batch_size) for doc_hash, end in finished if end > batch_size]
+                batch = batch[batch_size:]
+        if batch or finished:
+            yield batch, [doc_hash for doc_hash, _ in finished]
+
+    def embed_stage(batches):
+        for records, done in batches:
+            embeddings = None
+            if records:
+                with metrics.timed('embed.batch'):
+                    embeddings = embedding_model.encode([chunk for _, chunk, _ in records], batch_size=batch_size)
+            yield records, embeddings, done
+
+    def upsert_stage(batches):
+        last_checkpoint = time.time()
+        for records, embeddings, done in batches:
+            if records:
+                _upsert_batch(collection, records, embeddings)
+                totals['chunks'] += len(records)
+            with index_lock:
+                complete.update(done)
+            totals['documents'] += len(done)
+            if done and time.time() - last_checkpoint >= checkpoint_seconds:
+                checkpoint()
+                last_checkpoint = time.time()
+            yield len(records)
+
+    start_time = time.time()
+    duplicates_before = sum(len(sources) for sources in dedup_index['sources'].values())
+    try:
+        with metrics.timed('index.pipeline'):
+            run_pipeline(documents, [chunk_stage, embed_stage, upsert_stage], queue_size)
+    finally:
+        checkpoint()
+    elapsed_time = time.time() - start_time
+    if totals['chunks']:
+        print(f"Indexed {totals['documents']} documents, {totals['chunks']} chunks in {elapsed_time:.2f} seconds "
+              f"({totals['chunks'] / max(elapsed_time, 1e-9):.1f} chunks/s).")
+    duplicates = sum(len(sources) for sources in dedup_index['sources'].values()) - duplicates_before
+    if duplicates:
+        print(f"Skipped {duplicates} duplicate chunks already in the index.")
+    return totals['chunks']
@@ -1,5 +1,3 @@
-import pandas as pd
-
 def save_to_excel(data, file_path):
     """
     Save data to an Excel file using pandas.
@@ -16,6 +14,8 @@ def save_to_excel(data, file_path):
     Returns:
     None
     """
+    import pandas as pd
+
     try:
         # Create a pandas DataFrame from the data
         # Specify column names explicitly for clarity
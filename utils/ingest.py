@@ -0,0 +1,75 @@
+import time
+from utils.config import get_ocr_options, get_chunk_options, get_vector_index_options
+from utils.document_processing import open_document_store, store_documents
+from utils.embedding import open_vector_store, index_documents
+from utils import metrics
+
+def ingest_documents(documents_path, config, embedding_model=None):
+    """
+    Bring the document store and the vector store up to date with documents_path in one pass.
+
+    New and changed PDFs stream straight from extraction into indexing: a document is
+    chunked, embedded and upserted while the next ones are still being OCRed, and is never
+    read back from the document store. Memory is bounded by the extraction window and the
+    indexing queues rather than by the size of the corpus. Stored documents the index does
+    not hold yet (e.g. after an interrupted run) are indexed first. The embedding model is
+    only loaded if there is something to index.
+
+    Args:
+    documents_path (str): Path to the directory containing PDF files.
+    config (dict): A dictionary containing configuration settings.
+    embedding_model: A SentenceTransformer model for creating embeddings. Loaded on demand if None.
+
+    Returns:
+    tuple: The DocumentStore and the vector store, or None as the vector store if indexing failed.
+    """
+    start_time = time.time()
+    chunk_options = get_chunk_options(config)
+    persist_path = config.get('vector_store_path', './vector_store')
+    store, pending, hits, evicted = open_document_store(
+        documents_path, config.get('document_store_path', './processed_documents.sqlite'),
+        legacy_cache_file=config.get('processed_documents_path', './processed_documents.json'))
+    try:
+        manifest = store.manifest()
+        # Stored entries of pending files describe their previous content
+        current_files = {}
+        for file_name, entry in manifest.items():
+            if file_name not in pending:
+                current_files.setdefault(entry['hash'], set()).add(file_name)
+        for file_name, info in pending.items():
+            current_files.setdefault(info['hash'], set()).add(file_name)
+        vector_store, complete = open_vector_store(persist_path, current_files, chunk_options,
+                                                   get_vector_index_options(config))
+
+        # Identical content under several file names is only indexed once
+        unindexed = {}
+        for file_name in sorted(manifest):
+            if file_name not in pending and manifest[file_name]['hash'] not in complete:
+                unindexed.setdefault(manifest[file_name]['hash'], file_name)
+        indexed = set(complete)
+        print(f"Vector store: {len(indexed)} documents up to date, {len(unindexed)} stored and "
+              f"{len(pending)} new or changed documents to index.")
+
+        def documents():
+            seen = set(unindexed)
+            yield from store.iter_documents(unindexed.values())
+            for document in store_documents(store, pending, documents_path, get_ocr_options(config),
+                                            config.get('ocr_pages_per_unit', 4)):
+                if document['file_hash'] not in indexed and document['file_hash'] not in seen:
+                    seen.add(document['file_hash'])
+                    yield document
+
+        if unindexed or pending:
+            index_documents(vector_store, documents(), persist_path, complete, embedding_model,
+                            config.get('embedding_batch_size', 128), chunk_options,
+                            config.get('ingest_queue_size', 4), config.get('index_checkpoint_seconds', 60),
+                            set(unindexed) | {info['hash'] for info in pending.values()})
+    except Exception as e:
+        print(f"Error creating vector store: {e}")
+        vector_store = None
+
+    elapsed_time = time.time() - start_time
+    print(f"Ingestion completed in {elapsed_time:.2f} seconds.")
+    print(f"Document cache: {hits} hits, {len(pending)} misses, {evicted} evictions.")
+    metrics.record_latency('ingest.documents', elapsed_time)
+    return store, vector_store
@@ -0,0 +1,132 @@
+import time
+import random
+import asyncio
+from utils import metrics
+
+# Client settings from configure_openai, applied when the openai package is first used
+_client_settings = {}
+
+# Retry settings, overridden from the config by configure_openai
+_retry_settings = {'max_retries': 5, 'initial_backoff': 1.0, 'max_backoff': 30.0}
+
+def configure_openai(config):
+    """
+    Configure the OpenAI client and the retry policy from the configuration.
+
+    Setting 'openai_api_base' points the client at another OpenAI-compatible endpoint,
+    for example a local stub server used in tests and benchmarks.
+
+    Args:
+    config (dict): A dictionary containing configuration settings.
+    """
+    _client_settings['api_key'] = config.get('openai_api_key')
+    if config.get('openai_api_base'):
+        _client_settings['api_base'] = config['openai_api_base']
+    for key in _retry_settings:
+        if key in config:
+            _retry_settings[key] = config[key]
+
+def _openai():
+    """Import the openai package on first use and apply the configured client settings."""
+    import openai
+    for name, value in _client_settings.items():
+        setattr(openai, name, value)
+    return openai
+
+def _retry_delay(error, attempt):
+    """
+    Compute how long to wait before retrying a failed request.
+
+    The server's Retry-After header is honoured when present, otherwise an exponential
+    backoff with jitter is used.
+
+    Args:
+    error (Exception): The error raised by the failed request.
+    attempt (int): The zero-based number of the failed attempt.
+
+    Returns:
+    float: The delay in seconds.
+    """
+    headers = getattr(error, 'headers', None) or {}
+    retry_after = headers.get('retry-after') or headers.get('Retry-After')
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    backoff = min(_retry_settings['max_backoff'], _retry_settings['initial_backoff'] * 2 ** attempt)
+    return backoff * random.uniform(0.5, 1.0)
+
+def _is_retryable(error):
+    """Return True for rate limits, timeouts and transient server or connection errors."""
+    openai = _openai()
+    retryable = (openai.error.RateLimitError, openai.error.APIError, openai.error.Timeout,
+                 openai.error.ServiceUnavailableError, openai.error.APIConnectionError)
+    return isinstance(error, retryable)
+
+def response_usage(response):
+    """Return the token usage reported with an API response, or None if the server sent none."""
+    return getattr(response, 'usage', None) or (response.get('usage') if isinstance(response, dict) else None)
+
+def _record_usage(response):
+    """Add the token usage reported by the API to the metrics."""
+    usage = response_usage(response)
+    if usage:
+        metrics.increment('openai.prompt_tokens', usage.get('prompt_tokens', 0))
+        metrics.increment('openai.completion_tokens', usage.get('completion_tokens', 0))
+
+def chat_completion(messages, model, max_tokens, **kwargs):
+    """
+    Call the OpenAI chat completion API, retrying rate-limited and transient failures.
+
+    Args:
+    messages (list): The chat messages.
+    model (str): The name of the GPT model to use.
+    max_tokens (int): Maximum number of tokens in the completion.
+    **kwargs: Extra arguments passed to openai.ChatCompletion.create.
+
+    Returns:
+    The OpenAI response object.
+    """
+    attempt = 0
+    while True:
+        try:
+            with metrics.timed('openai.chat'):
+                response = _openai().ChatCompletion.create(model=model, messages=messages, max_tokens=max_tokens, **kwargs)
+            _record_usage(response)
+            return response
+        except Exception as e:
+            if not _is_retryable(e) or attempt >= _retry_settings['max_retries']:
+                metrics.increment('openai.errors')
+                raise
+            metrics.increment('openai.retries')
+            time.sleep(_retry_delay(e, attempt))
+            attempt += 1
+
+async def achat_completion(messages, model, max_tokens, **kwargs):
+    """
+    Asynchronous version of chat_completion.
+
+    Args:
+    messages (list): The chat messages.
+    model (str): The name of the GPT model to use.
+    max_tokens (int): Maximum number of tokens in the completion.
+    **kwargs: Extra arguments passed to openai.ChatCompletion.acreate.
+
+    Returns:
+    The OpenAI response object.
+    """
+    attempt = 0
+    while True:
+        try:
+            with metrics.timed('openai.chat'):
+                response = await _openai().ChatCompletion.acreate(model=model, messages=messages, max_tokens=max_tokens, **kwargs)
+            _record_usage(response)
+            return response
+        except Exception as e:
+            if not _is_retryable(e) or attempt >= _retry_settings['max_retries']:
+                metrics.increment('openai.errors')
+                raise
+            metrics.increment('openai.retries')
+            await asyncio.sleep(_retry_delay(e, attempt))
+            attempt += 1
@@ -0,0 +1,182 @@
+import json
+import time
+import threading
+from bisect import bisect_left
+
+# Upper bounds (milliseconds) of the latency histogram buckets; the last bucket is unbounded
+LATENCY_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000, 60000]
+
+_enabled = False
+_lock = threading.Lock()
+_latencies = {}
+_counters = {}
+
+class _NullTimer:
+    """Context manager that does nothing; returned by timed() while metrics are disabled."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+class _Timer:
+    """Context manager recording the wall-clock duration of its block under a stage name."""
+
+    __slots__ = ('stage', 'start')
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record_latency(self.stage, time.perf_counter() - self.start)
+        return False
+
+def enable_metrics(enabled=True):
+    """
+    Turn metric collection on or off for this process.
+
+    While disabled, timed() returns a shared no-op context manager and the recording
+    functions return immediately, so instrumentation costs a function call per stage.
+
+    Args:
+    enabled (bool): Whether to collect metrics. Defaults to True.
+    """
+    global _enabled
+    _enabled = enabled
+
+def metrics_enabled():
+    """Return True if metrics are being collected."""
+    return _enabled
+
+def timed(stage):
+    """
+    Time a block of code as one sample of the given stage.
+
+    Usage: `with timed('ocr.page'): ...`
+
+    Args:
+    stage (str): The stage name.
+
+    Returns:
+    A context manager.
+    """
+    if not _enabled:
+        return _NULL_TIMER
+    return _Timer(stage)
+
+def record_latency(stage, seconds):
+    """
+    Add one latency sample to a stage's histogram.
+
+    Args:
+    stage (str): The stage name.
+    seconds (float): The measured duration.
+    """
+    if not _enabled:
+        return
+    milliseconds = seconds * 1000
+    with _lock:
+        histogram = _latencies.get(stage)
+        if histogram is None:
+            histogram = _latencies[stage] = {'count': 0, 'sum_ms': 0.0, 'min_ms': milliseconds,
+                                             'max_ms': milliseconds, 'buckets': [0] * (len(LATENCY_BUCKETS_MS) + 1)}
+        histogram['count'] += 1
+        histogram['sum_ms'] += milliseconds
+        histogram['min_ms'] = min(histogram['min_ms'], milliseconds)
+        histogram['max_ms'] = max(histogram['max_ms'], milliseconds)
+        histogram['buckets'][bisect_left(LATENCY_BUCKETS_MS, milliseconds)] += 1
+
+def increment(counter, value=1):
+    """
+    Add to a counter, e.g. token counts or cache hits.
+
+    Args:
+    counter (str): The counter name.
+    value (int): The amount to add. Defaults to 1.
+    """
+    if not _enabled:
+        return
+    with _lock:
+        _counters[counter] = _counters.get(counter, 0) + value
+
+def snapshot():
+    """
+    Return a copy of the collected metrics.
+
+    Returns:
+    dict: 'latencies' (stage -> count, sum/mean/min/max in ms and bucket counts) and 'counters'.
+    """
+    with _lock:
+        latencies = {}
+        for stage, histogram in _latencies.items():
+            latencies[stage] = dict(histogram, buckets=list(histogram['buckets']),
+                                    mean_ms=histogram['sum_ms'] / histogram['count'])
+        return {'latencies': latencies, 'counters': dict(_counters), 'bucket_bounds_ms': LATENCY_BUCKETS_MS}
+
+def merge(other):
+    """
+    Merge a snapshot taken in another process (e.g. an OCR worker) into this process.
+
+    Args:
+    other (dict): A snapshot returned by snapshot().
+    """
+    if not _enabled or not other:
+        return
+    with _lock:
+        for stage, incoming in other['latencies'].items():
+            histogram = _latencies.get(stage)
+            if histogram is None:
+                _latencies[stage] = {key: incoming[key] for key in ('count', 'sum_ms', 'min_ms', 'max_ms')}
+                _latencies[stage]['buckets'] = list(incoming['buckets'])
+                continue
+            histogram['count'] += incoming['count']
+            histogram['sum_ms'] += incoming['sum_ms']
+            histogram['min_ms'] = min(histogram['min_ms'], incoming['min_ms'])
+            histogram['max_ms'] = max(histogram['max_ms'], incoming['max_ms'])
+            histogram['buckets'] = [a + b for a, b in zip(histogram['buckets'], incoming['buckets'])]
+        for counter, value in other['counters'].items():
+            _counters[counter] = _counters.get(counter, 0) + value
+
+def reset():
+    """Discard all collected metrics."""
+    with _lock:
+        _latencies.clear()
+        _counters.clear()
+
+def export_metrics(path):
+    """
+    Write the collected metrics to a JSON file.
+
+    Args:
+    path (str): Path to the output JSON file.
+    """
+    try:
+        with open(path, 'w') as f:
+            json.dump(snapshot(), f, indent=2)
+        print(f"Metrics have been saved to {path}")
+    except Exception as e:
+        print(f"Error saving metrics to '{path}': {e}")
+
+def run_with_metrics(func, *args):
+    """
+    Call func in a worker process and return its result with the metrics it recorded.
+
+    Args:
+    func (callable): The function to run.
+    *args: Its arguments.
+
+    Returns:
+    tuple: The function's result and a metrics snapshot, or None if metrics are disabled.
+    """
+    if not _enabled:
+        return func(*args), None
+    reset()
+    result = func(*args)
+    return result, snapshot()
@@ -1,69 +1,281 @@
-import cv2
-import numpy as np
-import pytesseract
+import os
+from utils import metrics
+
+# Adaptive threshold neighbourhood (pixels, odd) and the offset below the local mean
+ADAPTIVE_BLOCK_SIZE = 31
+ADAPTIVE_OFFSET = 15
+# Ink components smaller than this are noise, blocks with less ink are specks
+MIN_COMPONENT_AREA = 4
+MIN_REGION_INK = 20
+# Figures with fewer character-sized components hold no text worth OCRing
+MIN_FIGURE_CHARS = 3
+# Downscaling factor of the ink map that text blocks and figures are found on
+BLOCK_SCALE = 4
+# Character height (pixels) that crops are rescaled to before OCR
+TARGET_CHAR_HEIGHT = 24
+
+# Tesseract executable set by set_tesseract_cmd, applied when pytesseract is first imported
+_tesseract_cmd = None
+
+def _pytesseract():
+    """Import pytesseract on first use and point it at the configured Tesseract executable."""
+    import pytesseract
+    if _tesseract_cmd:
+        pytesseract.pytesseract.tesseract_cmd = _tesseract_cmd
+    return pytesseract
 
 def preprocess_image(image):
     """
     Preprocess an image for OCR (Optical Character Recognition).
 
-    This function applies several image processing techniques to enhance
-    the image for better text recognition.
+    A 3x3 median filter removes scanner speckle, then an adaptive (local Gaussian)
+    threshold binarizes the image. Unlike a single global threshold it copes with uneven
+    lighting, grey backgrounds and faint print.
 
     Args:
-    image (numpy.ndarray): The input image in BGR color format.
+    image (numpy.ndarray): The input image, grayscale or in BGR color format.
 
     Returns:
-    numpy.ndarray: The preprocessed image ready for OCR.
+    numpy.ndarray: The binarized image, black text on a white background.
     """
+    import cv2
+
     # Convert the image to grayscale
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    
-    # Apply Gaussian blur to reduce noise
-    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
-    
-    # Apply binary thresholding
-    # This creates a black and white image where text is white and background is black
-    _, thresh = cv2.threshold(blurred, 150, 255, cv2.THRESH_BINARY_INV)
-    
-    return thresh
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
 
-def extract_text_from_images_in_pdf(pdf_path):
+    # Remove isolated noise pixels while keeping character edges sharp
+    denoised = cv2.medianBlur(gray, 3)
+
+    # Threshold every pixel against the weighted mean of its neighbourhood
+    return cv2.adaptiveThreshold(denoised, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY,
+                                 ADAPTIVE_BLOCK_SIZE, ADAPTIVE_OFFSET)
+
+def detect_regions(binary):
     """
-    Extract text from images in a PDF file.
+    Find the text blocks and figures of a binarized page with connected components.
 
-    This function converts each page of a PDF to an image,
-    preprocesses the image, and then applies OCR to extract text.
+    Ink components are classified by size: components about the size of a character
+    are glyphs, much larger ones are drawings, photos or rules. Glyphs and drawings are
+    merged into blocks by dilating a downscaled ink map by about one character height,
+    so block boxes are accurate to BLOCK_SCALE pixels. A block whose ink is mostly in
+    large components, or which is mostly ink (a photo), is a figure; blocks enclosed by a
+    figure, such as its labels, are part of it.
+
+    Args:
+    binary (numpy.ndarray): The binarized page, black text on a white background.
+
+    Returns:
+    tuple: A list of regions, each a dictionary with the 'box' (x, y, width, height),
+           its 'kind' ('text' or 'figure') and the number of character-sized components
+           it contains ('chars'), and the median character height in pixels (0 if no
+           characters were found).
+    """
+    import cv2
+    import numpy as np
+
+    ink = (binary < 128).astype(np.uint8)
+    count, labels, stats, _ = cv2.connectedComponentsWithStats(ink, connectivity=8)
+    widths, heights, areas = (stats[:, index] for index in (cv2.CC_STAT_WIDTH, cv2.CC_STAT_HEIGHT, cv2.CC_STAT_AREA))
+    page_height, page_width = binary.shape
+    is_char = (areas >= MIN_COMPONENT_AREA) & (heights >= 4) & (heights <= page_height // 20) & (widths <= 4 * heights)
+    is_char[0] = False
+    char_height = int(np.median(heights[is_char])) if is_char.any() else 0
+    unit = char_height or max(page_width // 100, 4)
+    is_large = (heights > 3 * unit) | (widths > 15 * unit)
+    is_large[0] = False
+
+    # Merge neighbouring components into blocks, wider than tall so lines join up first.
+    # Blocks only need coarse outlines, so this runs on an ink map downscaled BLOCK_SCALE
+    # times, where every cell holds the ink pixel count of the area it covers.
+    rows, columns = page_height // BLOCK_SCALE, page_width // BLOCK_SCALE
+    cell_area = BLOCK_SCALE * BLOCK_SCALE
+    ink_cells = cv2.resize(ink.astype(np.float32), (columns, rows), interpolation=cv2.INTER_AREA) * cell_area
+    large_ink = (ink.astype(bool) & is_large[labels]).astype(np.float32)
+    large_cells = cv2.resize(large_ink, (columns, rows), interpolation=cv2.INTER_AREA) * cell_area
+    cell_unit = max(unit // BLOCK_SCALE, 1)
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (max(3, 3 * cell_unit // 2), max(2, cell_unit)))
+    block_count, block_labels, block_stats, _ = cv2.connectedComponentsWithStats(
+        cv2.dilate((ink_cells > 0).astype(np.uint8), kernel), connectivity=8)
+    ink_per_block = np.bincount(block_labels.ravel(), weights=ink_cells.ravel(), minlength=block_count)
+    large_per_block = np.bincount(block_labels.ravel(), weights=large_cells.ravel(), minlength=block_count)
+    # Count characters at their bounding-box centres, which fall inside their dilated block
+    centres_y = np.minimum((stats[is_char, cv2.CC_STAT_TOP] + heights[is_char] // 2) // BLOCK_SCALE, rows - 1)
+    centres_x = np.minimum((stats[is_char, cv2.CC_STAT_LEFT] + widths[is_char] // 2) // BLOCK_SCALE, columns - 1)
+    chars_per_block = np.bincount(block_labels[centres_y, centres_x], minlength=block_count)
+
+    regions = []
+    for block in range(1, block_count):
+        if ink_per_block[block] < MIN_REGION_INK:
+            continue
+        x, y, width, height = (int(value) * BLOCK_SCALE for value in block_stats[block, :4])
+        density = ink_per_block[block] / float(width * height)
+        figure = large_per_block[block] > ink_per_block[block] / 2 or density > 0.5
+        regions.append({'box': (x, y, width, height), 'kind': 'figure' if figure else 'text',
+                        'chars': int(chars_per_block[block])})
+
+    # Labels and parts inside a framed figure are separate blocks; fold them into the figure
+    figures = sorted((region for region in regions if region['kind'] == 'figure'),
+                     key=lambda region: region['box'][2] * region['box'][3], reverse=True)
+    for figure in figures:
+        if 'inside' in figure:
+            continue
+        fx, fy, fwidth, fheight = figure['box']
+        for region in regions:
+            x, y, width, height = region['box']
+            if (region is not figure and 'inside' not in region and x >= fx and y >= fy
+                    and x + width <= fx + fwidth and y + height <= fy + fheight):
+                region['inside'] = True
+                figure['chars'] += region['chars']
+    return [region for region in regions if region.pop('inside', None) is None], char_height
+
+def _ocr_region(binary, box, char_height, psm):
+    """
+    OCR one rectangle of a binarized page.
+
+    The crop is rescaled so that characters are about TARGET_CHAR_HEIGHT pixels tall:
+    large print is downscaled (fewer pixels for Tesseract to process) and small print is
+    upscaled (more accurate recognition).
+    """
+    import cv2
+
+    x, y, width, height = box
+    padding = max(char_height // 2, 4)
+    page_height, page_width = binary.shape
+    crop = binary[max(y - padding, 0):min(y + height + padding, page_height),
+                  max(x - padding, 0):min(x + width + padding, page_width)]
+    scale = min(max(TARGET_CHAR_HEIGHT / char_height, 0.25), 2.0) if char_height else 1.0
+    if not 0.8 <= scale <= 1.25:
+        interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC
+        crop = cv2.resize(crop, None, fx=scale, fy=scale, interpolation=interpolation)
+        _, crop = cv2.threshold(crop, 127, 255, cv2.THRESH_BINARY)
+    metrics.increment('ocr.pixels', int(crop.size))
+    return _pytesseract().image_to_string(crop, config=f'--oem 1 --psm {psm}').strip()
+
+def ocr_page_image(image, figures_only=False):
+    """
+    Run OCR on a single rendered page.
+
+    Only the part of the page that holds ink is sent to Tesseract, so blank margins and
+    blank pages cost nothing. With figures_only, used for pages whose text is already in
+    the PDF text layer, only the figures that contain characters (labels, callouts,
+    scanned inserts) are OCRed, each as sparse text.
+
+    Args:
+    image (PIL.Image.Image): The rendered page.
+    figures_only (bool): OCR only the figure regions. Defaults to False.
+
+    Returns:
+    str: The text recognized on the page.
+    """
+    import numpy as np
+
+    # PIL converts to grayscale in one pass, without an intermediate color copy
+    gray = np.asarray(image.convert('L'))
+    binary = preprocess_image(gray)
+    with metrics.timed('ocr.regions'):
+        regions, char_height = detect_regions(binary)
+
+    if figures_only:
+        figures = [region for region in regions if region['kind'] == 'figure' and region['chars'] >= MIN_FIGURE_CHARS]
+        metrics.increment('ocr.figures', len(figures))
+        texts = [_ocr_region(binary, region['box'], char_height, psm=11) for region in figures]
+        return "\n".join(text for text in texts if text)
+
+    if not regions:
+        metrics.increment('ocr.blank_pages')
+        return ""
+    # One Tesseract call over the bounding box of all content, without the margins
+    left = min(region['box'][0] for region in regions)
+    top = min(region['box'][1] for region in regions)
+    right = max(region['box'][0] + region['box'][2] for region in regions)
+    bottom = max(region['box'][1] + region['box'][3] for region in regions)
+    return _ocr_region(binary, (left, top, right - left, bottom - top), char_height, psm=6)
+
+def init_ocr_worker(tesseract_cmd=None, metrics_enabled=False):
+    """
+    Prepare a worker process for OCR.
+
+    Tesseract is limited to a single OpenMP thread so that one OCR process per core does
+    not oversubscribe the CPU, and the Tesseract path configured in the parent process is
+    applied (it is not inherited by spawned workers).
+
+    Args:
+    tesseract_cmd (str): Path to the Tesseract executable. Optional.
+    metrics_enabled (bool): Whether the worker records metrics for the parent. Defaults to False.
+    """
+    os.environ['OMP_THREAD_LIMIT'] = '1'
+    metrics.enable_metrics(metrics_enabled)
+    if tesseract_cmd:
+        set_tesseract_cmd(tesseract_cmd)
+
+def set_tesseract_cmd(tesseract_cmd):
+    """Use the given Tesseract executable instead of 'tesseract' on the PATH."""
+    global _tesseract_cmd
+    _tesseract_cmd = tesseract_cmd
+
+def get_tesseract_cmd():
+    """Return the Tesseract executable configured in this process, or None for the default."""
+    return _tesseract_cmd
+
+def pages_needing_ocr(page_texts, page_count, min_text_chars=200):
+    """
+    List the pages whose text layer is too short to skip OCR.
+
+    Args:
+    page_texts (list): (page_number, text) tuples from the PDF text layer.
+    page_count (int): Number of pages in the PDF.
+    min_text_chars (int): Pages with at least this many text-layer characters are not OCRed.
+
+    Returns:
+    list: The 1-based page numbers to OCR, in order.
+    """
+    text_layer_lengths = {page_number: len(text.strip()) for page_number, text in (page_texts or [])}
+    return [page_number for page_number in range(1, page_count + 1)
+            if text_layer_lengths.get(page_number, 0) < min_text_chars]
+
+def ocr_pages(pdf_path, page_numbers, dpi=200, figure_pages=()):
+    """
+    Rasterize and OCR the given pages of a PDF, one page at a time.
 
     Args:
     pdf_path (str): The path to the PDF file.
+    page_numbers (list): The 1-based page numbers to OCR.
+    dpi (int): Rasterization resolution. Defaults to 200.
+    figure_pages (iterable): Pages among page_numbers whose text layer is complete, so
+                             that only their figures are OCRed. Optional.
 
     Returns:
-    str: The extracted text from all images in the PDF, or an empty string if an error occurs.
+    list: (page_number, text) tuples in the order of page_numbers. Pages that fail are skipped.
     """
     from pdf2image import convert_from_path
-    try:
-        # Convert PDF pages to images
-        images = convert_from_path(pdf_path)
-        images_text = []
-        
-        for image in images:
-            # Convert PIL Image to OpenCV format
-            image_cv = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
-            
-            # Preprocess the image
-            preprocessed_image = preprocess_image(image_cv)
-            
-            # Configure Tesseract OCR
-            custom_config = r'--oem 1 --psm 6'
-            
-            # Perform OCR on the preprocessed image
-            image_text = pytesseract.image_to_string(preprocessed_image, config=custom_config)
-            
-            # Add the extracted text to the list
-            images_text.append(image_text.strip())
-        
-        # Join all extracted text into a single string
-        return " ".join(images_text)
-    except Exception as e:
-        print(f"Error extracting text from images in PDF '{pdf_path}': {e}")
-        return ""
+    figure_pages = set(figure_pages)
+    results = []
+    for page_number in page_numbers:
+        try:
+            # Rasterize only the current page, directly in grayscale
+            with metrics.timed('ocr.rasterize'):
+                images = convert_from_path(pdf_path, dpi=dpi, first_page=page_number, last_page=page_number,
+                                           grayscale=True)
+            figures_only = page_number in figure_pages
+            for image in images:
+                with metrics.timed('ocr.figure_page' if figures_only else 'ocr.page'):
+                    results.append((page_number, ocr_page_image(image, figures_only)))
+                image.close()
+            metrics.increment('ocr.figure_pages' if figures_only else 'ocr.pages')
+        except Exception as e:
+            print(f"Error running OCR on page {page_number} of '{pdf_path}': {e}")
+    return results
+
+def figure_pages_to_ocr(image_pages, ocr_page_numbers):
+    """
+    List the pages with embedded images that are not OCRed in full already.
+
+    Args:
+    image_pages (list): Pages that embed an image, from find_image_pages.
+    ocr_page_numbers (list): Pages that are OCRed in full, from pages_needing_ocr.
+
+    Returns:
+    list: The page numbers whose figures should be OCRed, in order.
+    """
+    ocr_page_numbers = set(ocr_page_numbers)
+    return [page_number for page_number in image_pages if page_number not in ocr_page_numbers]
@@ -1,50 +1,96 @@
-from PyPDF2 import PdfReader
-from utils.ocr import extract_text_from_images_in_pdf
+from utils import metrics
 
-def extract_text_from_pdf(pdf_path):
+def extract_text_layer(pdf_path):
     """
-    Extract text from a PDF file, including text from images.
-
-    This function reads a PDF file, extracts text from each page,
-    and also extracts text from images within the PDF.
+    Extract the embedded text layer of a PDF file, without OCR.
 
     Args:
     pdf_path (str): The path to the PDF file.
 
     Returns:
-    tuple: A tuple containing three elements:
-        - str: The extracted text from all pages combined.
-        - str: The extracted text from images in the PDF.
+    tuple: A tuple containing two elements:
         - list: A list of tuples, each containing a page number and its text.
-    
-    If an error occurs, it returns empty strings for text and image text,
-    and an empty list for page texts.
+        - int: The number of pages in the PDF.
+    """
+    from PyPDF2 import PdfReader
+
+    with metrics.timed('pdf.extract_text'), open(pdf_path, 'rb') as file:
+        # Create a PdfReader object
+        pdf_reader = PdfReader(file)
+
+        page_texts = []  # To store text from each page separately
+
+        # Iterate through each page in the PDF
+        for page_num in range(len(pdf_reader.pages)):
+            page = pdf_reader.pages[page_num]
+            page_text = page.extract_text()
+
+            if page_text:
+                # Store page number and text
+                page_texts.append((page_num + 1, page_text))
+
+        return page_texts, len(pdf_reader.pages)
+
+def _has_image(resources, min_side, depth=0):
+    """Return True if a resource dictionary draws an image at least min_side pixels on both sides."""
+    if resources is None or depth > 3:
+        return False
+    xobjects = resources.get_object().get('/XObject')
+    if not xobjects:
+        return False
+    for xobject in xobjects.get_object().values():
+        xobject = xobject.get_object()
+        subtype = xobject.get('/Subtype')
+        if subtype == '/Image' and min(xobject.get('/Width', 0), xobject.get('/Height', 0)) >= min_side:
+            return True
+        # Form XObjects can wrap images in their own resources
+        if subtype == '/Form' and _has_image(xobject.get('/Resources'), min_side, depth + 1):
+            return True
+    return False
+
+def find_image_pages(pdf_path, min_side=100):
+    """
+    List the pages of a PDF that embed an image, such as a figure or a scanned insert.
+
+    Only the page resources are inspected; no page is rendered.
+
+    Args:
+    pdf_path (str): The path to the PDF file.
+    min_side (int): Images smaller than this many pixels on either side (icons, logos,
+                    rules) are ignored. Defaults to 100.
+
+    Returns:
+    list: The 1-based numbers of the pages with images, in order.
+    """
+    from PyPDF2 import PdfReader
+
+    with metrics.timed('pdf.find_images'), open(pdf_path, 'rb') as file:
+        pdf_reader = PdfReader(file)
+        return [page_number for page_number, page in enumerate(pdf_reader.pages, start=1)
+                if _has_image(page.get('/Resources'), min_side)]
+
+def build_page_records(page_texts, ocr_results, page_count):
+    """
+    Merge the text layer and the OCR output of a PDF into one record per page.
+
+    Args:
+    page_texts (list): (page_number, text) tuples from the PDF text layer.
+    ocr_results (list): (page_number, text) tuples from OCR.
+    page_count (int): Number of pages in the PDF.
+
+    Returns:
+    list: One dictionary per non-empty page with its 'page_number', text layer 'text'
+          and 'ocr_text', in page order.
     """
-    try:
-        with open(pdf_path, 'rb') as file:
-            # Create a PdfReader object
-            pdf_reader = PdfReader(file)
-            
-            text = ""  # To store all extracted text
-            page_texts = []  # To store text from each page separately
-            
-            # Iterate through each page in the PDF
-            for page_num in range(len(pdf_reader.pages)):
-                page = pdf_reader.pages[page_num]
-                page_text = page.extract_text()
-                
-                if page_text:
-                    # Add page text to the overall text
-                    text += page_text + "\n"
-                    # Store page number and text
-                    page_texts.append((page_num + 1, page_text))
-            
-            # Extract text from images in the PDF
-            images_text = extract_text_from_images_in_pdf(pdf_path)
-            
-            return text, images_text, page_texts
-    
-    except Exception as e:
-        # If an error occurs, print it and return empty results
-        print(f"Error extracting text from PDF '{pdf_path}': {e}")
-        return "", "", []
+    text_layer = dict(page_texts)
+    ocr_text = dict(ocr_results)
+    pages = []
+    for page_number in range(1, page_count + 1):
+        page = {
+            'page_number': page_number,
+            'text': text_layer.get(page_number, ''),
+            'ocr_text': ocr_text.get(page_number, '')
+        }
+        if page['text'].strip() or page['ocr_text'].strip():
+            pages.append(page)
+    return pages
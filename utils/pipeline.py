@@ -0,0 +1,74 @@
+import queue
+import threading
+
+# Marks the end of the stream on a queue between two stages
+_END = object()
+
+def run_pipeline(source, stages, queue_size=4):
+    """
+    Stream items through a chain of stages, each running in its own thread.
+
+    Every stage is a generator function that takes an iterator of input items and yields
+    output items, like the chunking, embedding and upserting stages of index_documents. Stages
+    are connected by queues holding at most queue_size items: a slow stage blocks the
+    stage feeding it (backpressure), so memory stays bounded however long the source is.
+    The source is consumed in the calling thread and the outputs of the last stage are
+    discarded.
+
+    If the source or a stage fails, the remaining items are drained without being
+    processed, and the first error is raised once every stage has finished.
+
+    Args:
+    source (iterable): The input items.
+    stages (list): Generator functions, applied in order.
+    queue_size (int): Capacity of the queue in front of each stage. Defaults to 4.
+    """
+    queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+    errors = []
+    failed = threading.Event()
+
+    def read(input_queue, ended):
+        while True:
+            item = input_queue.get()
+            if item is _END:
+                ended.set()
+                return
+            # After a failure items are only drained, so no stage blocks on a full queue
+            if not failed.is_set():
+                yield item
+
+    def run_stage(stage, input_queue, output_queue):
+        ended = threading.Event()
+        try:
+            for item in stage(read(input_queue, ended)):
+                if output_queue is not None:
+                    output_queue.put(item)
+        except BaseException as e:
+            errors.append(e)
+            failed.set()
+            if not ended.is_set():
+                for _ in read(input_queue, ended):
+                    pass
+        finally:
+            if output_queue is not None:
+                output_queue.put(_END)
+
+    threads = [threading.Thread(target=run_stage, daemon=True,
+                                args=(stage, queues[i], queues[i + 1] if i + 1 < len(queues) else None))
+               for i, stage in enumerate(stages)]
+    for thread in threads:
+        thread.start()
+    try:
+        for item in source:
+            if failed.is_set():
+                break
+            queues[0].put(item)
+    except BaseException as e:
+        errors.append(e)
+        failed.set()
+    finally:
+        queues[0].put(_END)
+        for thread in threads:
+            thread.join()
+    if errors:
+        raise errors[0]
@@ -1,9 +1,40 @@
-import openai
-from nltk.tokenize import word_tokenize
-from sentence_transformers import SentenceTransformer, util
-import torch
+from utils.llm import chat_completion, achat_completion, response_usage
+from utils.context import count_message_tokens, count_tokens
+from utils import metrics
 
-def get_answer_from_documents(query, document, gpt_model):
+# Returned when the answer cannot be generated; never cached
+ERROR_ANSWER = "Unable to generate an answer due to an error."
+
+def _answer_messages(query, document):
+    """Build the chat messages asking the GPT model to answer query from document."""
+    # Construct the prompt for the GPT model
+    prompt = f"Please provide a concise and specific answer to the following question based on the provided document:\nQuestion: {query}\nDocument: {document}\nAnswer:"
+    return [
+        {"role": "system", "content": "You are a helpful assistant."},
+        {"role": "user", "content": prompt}
+    ]
+
+def _fill_usage(usage, messages, response, answer, gpt_model):
+    """
+    Store the prompt and completion token counts of an answer in usage.
+
+    The counts reported by the API are used; servers that report none are measured
+    with the model's tokenizer instead. A failed call counts as zero tokens.
+    """
+    if usage is None:
+        return
+    if response is None:
+        usage.update(prompt_tokens=0, completion_tokens=0)
+        return
+    reported = response_usage(response)
+    if reported:
+        usage['prompt_tokens'] = reported.get('prompt_tokens', 0)
+        usage['completion_tokens'] = reported.get('completion_tokens', 0)
+    else:
+        usage['prompt_tokens'] = count_message_tokens(messages, gpt_model)
+        usage['completion_tokens'] = count_tokens(answer, gpt_model)
+
+def get_answer_from_documents(query, document, gpt_model, max_tokens=150, usage=None):
     """
     Get an answer to a query based on the provided document using GPT model.
 
@@ -11,62 +42,62 @@ def get_answer_from_documents(query, document, gpt_model):
     query (str): The question to be answered.
     document (str): The document content to be used as context.
     gpt_model (str): The name of the GPT model to use.
+    max_tokens (int): Maximum length of the answer in tokens. Defaults to 150.
+    usage (dict): If given, receives the 'prompt_tokens' and 'completion_tokens' of the call.
 
     Returns:
     str: The generated answer or an error message if generation fails.
     """
+    messages = _answer_messages(query, document)
+    response = None
     try:
-        # Construct the prompt for the GPT model
-        prompt = f"Please provide a concise and specific answer to the following question based on the provided document:\nQuestion: {query}\nDocument: {document}\nAnswer:"
-        
-        # Make an API call to OpenAI
-        response = openai.ChatCompletion.create(
-            model=gpt_model,
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=150  # Limit the response length
-        )
-        
+        # Make an API call to OpenAI (limit the response length)
+        response = chat_completion(messages, gpt_model, max_tokens=max_tokens)
+
         # Extract and return the generated answer
-        return response.choices[0].message['content'].strip()
+        answer = response.choices[0].message['content'].strip()
     except Exception as e:
         print(f"Error getting answer from documents: {e}")
-        return "Unable to generate an answer due to an error."
+        answer = ERROR_ANSWER
+    _fill_usage(usage, messages, response, answer, gpt_model)
+    return answer
 
-def find_page_number(query, page_texts):
+async def aget_answer_from_documents(query, document, gpt_model, max_tokens=150, usage=None):
     """
-    Find the page number of the best matching page for the given query.
+    Asynchronous version of get_answer_from_documents.
 
     Args:
-    query (str): The query to match against page texts.
-    page_texts (list): A list of tuples containing (page_number, page_text).
+    query (str): The question to be answered.
+    document (str): The document content to be used as context.
+    gpt_model (str): The name of the GPT model to use.
+    max_tokens (int): Maximum length of the answer in tokens. Defaults to 150.
+    usage (dict): If given, receives the 'prompt_tokens' and 'completion_tokens' of the call.
 
     Returns:
-    int: The page number of the best matching page, or None if an error occurs.
+    str: The generated answer or an error message if generation fails.
     """
+    messages = _answer_messages(query, document)
+    response = None
     try:
-        # Tokenize the query and remove common question words
-        query_tokens = word_tokenize(query)
-        query_tokens = [token for token in query_tokens if token.lower() not in ['what', 'where', 'when', 'who', 'why', 'how']]
-        query = ' '.join(query_tokens)
-        
-        # Load the sentence transformer model
-        model = SentenceTransformer('all-MiniLM-L6-v2')
-        
-        # Encode the query and page texts
-        query_embedding = model.encode(query)
-        page_embeddings = model.encode([page_text for page_num, page_text in page_texts])
-        
-        # Calculate cosine similarity between query and page embeddings
-        cos_scores = util.cos_sim(query_embedding, page_embeddings)
-        
-        # Find the index of the highest similarity score
-        max_index = torch.argmax(cos_scores)
-        
-        # Return the page number of the best matching page
-        return page_texts[max_index][0]
+        response = await achat_completion(messages, gpt_model, max_tokens=max_tokens)
+        answer = response.choices[0].message['content'].strip()
     except Exception as e:
-        print(f"Error finding page number: {e}")
-        return None
+        print(f"Error getting answer from documents: {e}")
+        answer = ERROR_ANSWER
+    _fill_usage(usage, messages, response, answer, gpt_model)
+    return answer
+
+def find_page_number(chunk_metadata):
+    """
+    Find the page number of the chunk an answer was drawn from.
+
+    Chunks never straddle pages, so the page is read straight from the chunk metadata.
+
+    Args:
+    chunk_metadata (dict): Metadata of the most relevant chunk.
+
+    Returns:
+    int: The page number of the chunk, or None if it is unknown.
+    """
+    with metrics.timed('qa.page_lookup'):
+        return chunk_metadata.get('page_number')
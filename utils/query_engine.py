@@ -0,0 +1,205 @@
+import asyncio
+from utils import metrics
+from utils.search import batch_hybrid_search, encode_queries, re_rank_documents, are_rank_documents
+from utils.qa import get_answer_from_documents, aget_answer_from_documents, find_page_number, ERROR_ANSWER
+from utils.context import build_context
+
+# Answers containing one of these phrases are reported without a source
+NO_ANSWER_PHRASES = ["the document does not provide information", "no information found", "not available"]
+
+# Token usage reported for answers served from the answer cache
+NO_USAGE = {'context_tokens': 0, 'prompt_tokens': 0, 'completion_tokens': 0}
+
+def _attribute(answer, ranked_chunks, combined_metadatas):
+    """Return the (source file, page number) of the best ranked chunk, or ("None", "None")."""
+    if not ranked_chunks or any(phrase.lower() in answer.lower() for phrase in NO_ANSWER_PHRASES):
+        return "None", "None"
+    top_metadata = combined_metadatas[ranked_chunks[0]['index']]
+    return top_metadata['file_name'], find_page_number(top_metadata)
+
+def _build_context(ranked_chunks, combined_metadatas, config):
+    """Assemble the answer context from the ranked chunks within config['context_max_tokens'] (default 2000)."""
+    chunks = [dict(chunk, metadata=combined_metadatas[chunk['index']]) for chunk in ranked_chunks]
+    return build_context(chunks, config.get('gpt_model', 'gpt-4'), config.get('context_max_tokens', 2000))
+
+def _retrieve(query, vector_store, embedding_model, answer_cache):
+    """
+    Embed the query, run the hybrid search and consult the answer cache.
+
+    Returns:
+    tuple: The query embedding, the search results, metadatas and ids, and the cached
+           result or None.
+    """
+    return retrieve_queries([query], vector_store, embedding_model, answer_cache)[0]
+
+def retrieve_queries(queries, vector_store, embedding_model, answer_cache=None):
+    """
+    Embed many queries at once, run the batched hybrid search and consult the answer cache.
+
+    Args:
+    queries (list): The questions.
+    vector_store (dict): The vector store returned by ingest_documents.
+    embedding_model: The model used to create embeddings.
+    answer_cache (AnswerCache): Cache of previous answers. Optional.
+
+    Returns:
+    list: One tuple per query, as returned by _retrieve.
+    """
+    if not queries:
+        return []
+    query_embeddings = encode_queries(queries, embedding_model)
+    searches = batch_hybrid_search(queries, vector_store, embedding_model, query_embeddings)
+    retrieved = []
+    for query, query_embedding, (combined_results, combined_metadatas, combined_ids, _) in zip(
+            queries, query_embeddings.tolist(), searches):
+        cached = None
+        if answer_cache is not None and combined_ids:
+            cached = answer_cache.lookup(query, query_embedding, combined_ids)
+        retrieved.append((query_embedding, combined_results, combined_metadatas, combined_ids, cached))
+    return retrieved
+
+def _remember(answer_cache, query, query_embedding, combined_ids, result):
+    """Store a freshly generated result in the answer cache, unless generation failed."""
+    if answer_cache is not None and combined_ids and result['answer'] != ERROR_ANSWER:
+        answer_cache.store(query, query_embedding, combined_ids,
+                           {key: result[key] for key in ('answer', 'source_file', 'page_number')})
+
+def answer_query(query, vector_store, embedding_model, config, answer_cache=None):
+    """
+    Answer a single query: hybrid search, re-rank, answer generation and page lookup.
+
+    Args:
+    query (str): The question to answer.
+    vector_store (dict): The vector store returned by ingest_documents.
+    embedding_model: The model used to create embeddings.
+    config (dict): A dictionary containing configuration settings.
+    answer_cache (AnswerCache): Cache of previous answers. Optional.
+
+    Returns:
+    dict: The 'query', its 'answer', the 'source_file', the 'page_number', and the
+          'context_tokens', 'prompt_tokens' and 'completion_tokens' the answer cost
+          (0 for answers from the cache).
+    """
+    gpt_model = config.get('gpt_model', 'gpt-4')
+    with metrics.timed('query.retrieve'):
+        query_embedding, combined_results, combined_metadatas, combined_ids, cached = _retrieve(
+            query, vector_store, embedding_model, answer_cache)
+    if cached is not None:
+        return dict(cached, query=query, **NO_USAGE)
+    with metrics.timed('query.rerank'):
+        ranked_chunks = re_rank_documents(query, combined_results, gpt_model, combined_ids,
+                                          top_k=config.get('rerank_top_k', 3), mode=config.get('rerank_mode', 'llm'))
+    context = _build_context(ranked_chunks, combined_metadatas, config)
+    usage = {}
+    with metrics.timed('query.answer'):
+        answer = get_answer_from_documents(query, context['text'], gpt_model, config.get('answer_max_tokens', 150), usage)
+    source_file, page_number = _attribute(answer, ranked_chunks, combined_metadatas)
+    result = {'query': query, 'answer': answer, 'source_file': source_file, 'page_number': page_number,
+              'context_tokens': context['tokens'], **usage}
+    _remember(answer_cache, query, query_embedding, combined_ids, result)
+    return result
+
+async def answer_query_async(query, vector_store, embedding_model, config, semaphore, answer_cache=None, retrieved=None):
+    """
+    Asynchronous version of answer_query.
+
+    Retrieval runs in the default thread pool, the OpenAI calls run on the event loop.
+    The semaphore bounds how many queries are in flight at once.
+
+    Args:
+    query (str): The question to answer.
+    vector_store (dict): The vector store returned by ingest_documents.
+    embedding_model: The model used to create embeddings.
+    config (dict): A dictionary containing configuration settings.
+    semaphore (asyncio.Semaphore): Limits the number of concurrent queries.
+    answer_cache (AnswerCache): Cache of previous answers. Optional.
+    retrieved (tuple): The query's entry from retrieve_queries, if it was retrieved in a
+                       batch already. Optional.
+
+    Returns:
+    dict: The 'query', its 'answer', the 'source_file', the 'page_number', and the
+          'context_tokens', 'prompt_tokens' and 'completion_tokens' the answer cost
+          (0 for answers from the cache).
+    """
+    gpt_model = config.get('gpt_model', 'gpt-4')
+    loop = asyncio.get_running_loop()
+    async with semaphore:
+        if retrieved is None:
+            with metrics.timed('query.retrieve'):
+                retrieved = await loop.run_in_executor(None, _retrieve, query, vector_store, embedding_model, answer_cache)
+        query_embedding, combined_results, combined_metadatas, combined_ids, cached = retrieved
+        if cached is not None:
+            return dict(cached, query=query, **NO_USAGE)
+        with metrics.timed('query.rerank'):
+            ranked_chunks = await are_rank_documents(query, combined_results, gpt_model, combined_ids,
+                                                     top_k=config.get('rerank_top_k', 3), mode=config.get('rerank_mode', 'llm'))
+        context = _build_context(ranked_chunks, combined_metadatas, config)
+        usage = {}
+        with metrics.timed('query.answer'):
+            answer = await aget_answer_from_documents(query, context['text'], gpt_model,
+                                                      config.get('answer_max_tokens', 150), usage)
+        source_file, page_number = _attribute(answer, ranked_chunks, combined_metadatas)
+    result = {'query': query, 'answer': answer, 'source_file': source_file, 'page_number': page_number,
+              'context_tokens': context['tokens'], **usage}
+    _remember(answer_cache, query, query_embedding, combined_ids, result)
+    return result
+
+async def answer_queries_async(queries, vector_store, embedding_model, config, on_result=None, answer_cache=None):
+    """
+    Answer many queries concurrently.
+
+    Queries are retrieved in blocks of config['retrieval_batch_size'] (default 64), each
+    with one encode() call and one vector index query; the answers of a block are being
+    generated while the next block is retrieved. At most config['max_concurrency']
+    queries (default 8) are reranked and answered at the same time. Rate-limited OpenAI
+    calls are retried with backoff by utils.llm.
+
+    Args:
+    queries (list): The questions to answer.
+    vector_store (dict): The vector store returned by ingest_documents.
+    embedding_model: The model used to create embeddings.
+    config (dict): A dictionary containing configuration settings.
+    on_result (callable): Optional callback invoked as on_result(index, result) as soon as
+                          each query finishes, in completion order.
+    answer_cache (AnswerCache): Cache of previous answers. Optional.
+
+    Returns:
+    list: One result dictionary per query, in the same order as queries.
+    """
+    semaphore = asyncio.Semaphore(config.get('max_concurrency', 8))
+    retrieval_batch_size = max(config.get('retrieval_batch_size', 64), 1)
+    loop = asyncio.get_running_loop()
+
+    async def run(index, query, retrieved):
+        result = await answer_query_async(query, vector_store, embedding_model, config, semaphore, answer_cache,
+                                          retrieved)
+        if on_result is not None:
+            on_result(index, result)
+        return result
+
+    tasks = []
+    for start in range(0, len(queries), retrieval_batch_size):
+        block = queries[start:start + retrieval_batch_size]
+        with metrics.timed('query.retrieve_batch'):
+            retrieved = await loop.run_in_executor(None, retrieve_queries, block, vector_store, embedding_model,
+                                                   answer_cache)
+        tasks.extend(asyncio.ensure_future(run(start + i, query, entry))
+                     for i, (query, entry) in enumerate(zip(block, retrieved)))
+    return await asyncio.gather(*tasks)
+
+def answer_queries(queries, vector_store, embedding_model, config, on_result=None, answer_cache=None):
+    """
+    Answer many queries concurrently from synchronous code.
+
+    Args:
+    queries (list): The questions to answer.
+    vector_store (dict): The vector store returned by ingest_documents.
+    embedding_model: The model used to create embeddings.
+    config (dict): A dictionary containing configuration settings.
+    on_result (callable): Optional callback invoked as on_result(index, result) as each query finishes.
+    answer_cache (AnswerCache): Cache of previous answers. Optional.
+
+    Returns:
+    list: One result dictionary per query, in the same order as queries.
+    """
+    return asyncio.run(answer_queries_async(queries, vector_store, embedding_model, config, on_result, answer_cache))
@@ -1,78 +1,327 @@
-from sentence_transformers import util
-import torch
+import re
+import asyncio
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from utils.bm25 import bm25_search
+from utils.dedup import collapse_duplicates
+from utils.llm import chat_completion, achat_completion
+from utils import metrics
 
-def hybrid_search(query, collection, embedding_model):
+DEFAULT_CROSS_ENCODER = 'cross-encoder/ms-marco-MiniLM-L-6-v2'
+CROSS_ENCODER_CACHE_SIZE = 50000
+
+# (query, chunk id) -> cross-encoder score, least recently used first
+_cross_encoder_cache = OrderedDict()
+_cross_encoder_cache_lock = threading.Lock()
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """
+    Fuse several ranked lists of ids with reciprocal-rank fusion.
+
+    Args:
+    rankings (list): Lists of ids, each ordered from most to least relevant.
+    k (int): Smoothing constant; larger values flatten the influence of top ranks. Defaults to 60.
+
+    Returns:
+    list: (id, score) tuples sorted by descending fused score, each id appearing once.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking):
+            scores[item_id] = scores.get(item_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+def hybrid_search(query, vector_store, embedding_model, query_embedding=None, n_results=10):
     """
     Perform a hybrid search combining dense and sparse retrieval methods.
 
+    Dense results come from the chunk embeddings in ChromaDB and sparse results from the
+    BM25 index over the same chunks. Both rankings are fused with reciprocal-rank fusion
+    and deduplicated by chunk id; chunks that nearly duplicate a better ranked one are
+    dropped so boilerplate does not crowd out the other candidates.
+
     Args:
     query (str): The search query.
-    collection: The ChromaDB collection to search in.
+    vector_store (dict): The vector store returned by ingest_documents.
     embedding_model: The model used to create embeddings.
+    query_embedding (list): A precomputed embedding of the query. Computed with embedding_model if None.
+    n_results (int): Number of results to return. Defaults to 10.
 
     Returns:
-    tuple: Three lists containing combined results, metadatas, and ids.
+    tuple: Three lists containing the fused results, metadatas, and ids, best match first.
+           When the vector store has a duplicate-chunk index, each metadata also lists the
+           'sources' ([file name, page number]) of every copy of the chunk.
            Returns empty lists if an error occurs.
     """
+    query_embeddings = None if query_embedding is None else [query_embedding]
+    combined_results, combined_metadatas, combined_ids, _ = batch_hybrid_search(
+        [query], vector_store, embedding_model, query_embeddings, n_results)[0]
+    return combined_results, combined_metadatas, combined_ids
+
+def encode_queries(queries, embedding_model, batch_size=64):
+    """
+    Embed many queries with a single encode() call.
+
+    Args:
+    queries (list): The search queries.
+    embedding_model: The model used to create embeddings.
+    batch_size (int): Queries per forward pass of the model. Defaults to 64.
+
+    Returns:
+    numpy.ndarray: One embedding per query.
+    """
+    with metrics.timed('embed.queries'):
+        embeddings = embedding_model.encode(list(queries), batch_size=batch_size, convert_to_numpy=True)
+    metrics.increment('embed.query_count', len(queries))
+    return embeddings
+
+def batch_hybrid_search(queries, vector_store, embedding_model, query_embeddings=None, n_results=10):
+    """
+    Run hybrid_search for many queries at once.
+
+    All queries are embedded in one encode() call and the vector index is queried once
+    with the whole embedding matrix; chunks that are only found by BM25 are fetched with
+    a single get() for all queries. Ranking, fusion and deduplication are the same as in
+    hybrid_search.
+
+    Args:
+    queries (list): The search queries.
+    vector_store (dict): The vector store returned by ingest_documents.
+    embedding_model: The model used to create embeddings.
+    query_embeddings: Precomputed embeddings, one per query, as a NumPy array or lists.
+                      Computed with embedding_model if None.
+    n_results (int): Number of results to return per query. Defaults to 10.
+
+    Returns:
+    list: One tuple per query, in the order of queries, with the fused results,
+          metadatas, ids and reciprocal-rank fusion scores, best match first. Every
+          tuple holds empty lists if an error occurs.
+    """
+    queries = list(queries)
+    if not queries:
+        return []
     try:
-        # Create an embedding for the query
-        query_embedding = embedding_model.encode(query).tolist()  # Convert numpy array to list
-        
-        # Perform dense retrieval (using embeddings)
-        dense_results = collection.query(query_embeddings=[query_embedding], n_results=10)
-        
-        # Perform sparse retrieval (using text)
-        sparse_results = collection.query(query_texts=[query], n_results=10)
-        
-        # Combine results from both methods
-        combined_results = dense_results['documents'] + sparse_results['documents']
-        combined_metadatas = dense_results['metadatas'] + sparse_results['metadatas']
-        combined_ids = dense_results['ids'] + sparse_results['ids']
-        
-        return combined_results, combined_metadatas, combined_ids
+        collection = vector_store['chunks']
+        if query_embeddings is None:
+            query_embeddings = encode_queries(queries, embedding_model)
+        # ChromaDB wants lists, the NumPy backend takes the array as it is
+        if not getattr(collection, 'accepts_arrays', False) and hasattr(query_embeddings, 'tolist'):
+            query_embeddings = query_embeddings.tolist()
+
+        # Perform dense retrieval (using embeddings) for all queries in one call
+        with metrics.timed('chroma.query'):
+            dense_results = collection.query(query_embeddings=query_embeddings, n_results=n_results)
+        chunks = {}
+        for ids, documents, metadatas in zip(dense_results['ids'], dense_results['documents'], dense_results['metadatas']):
+            chunks.update((chunk_id, (document, metadata)) for chunk_id, document, metadata in zip(ids, documents, metadatas))
+
+        # Perform sparse retrieval (using the BM25 inverted index)
+        with metrics.timed('bm25.search'):
+            sparse_ids = [[chunk_id for chunk_id, _ in bm25_search(vector_store['bm25'], query, n_results)]
+                          for query in queries]
+
+        # Combine results from both methods, collapsing near-duplicate chunks into the best ranked copy
+        dedup_index = vector_store.get('dedup')
+        rankings = []
+        for dense_ids, query_sparse_ids in zip(dense_results['ids'], sparse_ids):
+            fused = reciprocal_rank_fusion([dense_ids, query_sparse_ids])
+            fused_ids = [chunk_id for chunk_id, _ in fused]
+            collapsed = collapse_duplicates(dedup_index, fused_ids) if dedup_index else {chunk_id: [] for chunk_id in fused_ids}
+            kept_ids = list(collapsed)[:n_results]
+            rankings.append((kept_ids, collapsed, dict(fused)))
+
+        missing_ids = sorted({chunk_id for kept_ids, _, _ in rankings for chunk_id in kept_ids if chunk_id not in chunks})
+        if missing_ids:
+            with metrics.timed('chroma.get'):
+                fetched = collection.get(ids=missing_ids, include=['documents', 'metadatas'])
+            for chunk_id, document, metadata in zip(fetched['ids'], fetched['documents'], fetched['metadatas']):
+                chunks[chunk_id] = (document, metadata)
+
+        results = []
+        for kept_ids, collapsed, scores in rankings:
+            combined_ids = [chunk_id for chunk_id in kept_ids if chunk_id in chunks]
+            combined_results = [chunks[chunk_id][0] for chunk_id in combined_ids]
+            combined_metadatas = [chunks[chunk_id][1] for chunk_id in combined_ids]
+            if dedup_index:
+                combined_metadatas = [dict(metadata, sources=_chunk_sources(dedup_index, [chunk_id] + collapsed[chunk_id], chunks))
+                                      for chunk_id, metadata in zip(combined_ids, combined_metadatas)]
+            results.append((combined_results, combined_metadatas, combined_ids,
+                            [scores[chunk_id] for chunk_id in combined_ids]))
+        return results
     except Exception as e:
         print(f"Error performing hybrid search: {e}")
-        return [], [], []
+        return [([], [], [], []) for _ in queries]
+
+def _chunk_sources(dedup_index, chunk_ids, chunks):
+    """List the distinct [file name, page number] pairs of a chunk and of its duplicates."""
+    sources = []
+    for chunk_id in chunk_ids:
+        if chunk_id in chunks:
+            metadata = chunks[chunk_id][1]
+            sources.append([metadata['file_name'], metadata.get('page_number')])
+        sources.extend([file_name, page_number] for _, file_name, page_number in dedup_index['sources'].get(chunk_id, []))
+    return [source for i, source in enumerate(sources) if source not in sources[:i]]
+
+@lru_cache(maxsize=None)
+def get_cross_encoder(model_name=DEFAULT_CROSS_ENCODER):
+    """
+    Load a cross-encoder on CPU once and reuse it for the rest of the process.
+
+    Args:
+    model_name (str): Name of the cross-encoder model. Defaults to 'cross-encoder/ms-marco-MiniLM-L-6-v2'.
 
-def re_rank_documents(query, documents, gpt_model):
+    Returns:
+    CrossEncoder: The loaded cross-encoder.
+    """
+    from sentence_transformers import CrossEncoder
+    return CrossEncoder(model_name, device='cpu')
+
+def _rerank_messages(query, documents):
+    """Build the chat messages asking the GPT model to score every candidate at once."""
+    candidates = "\n\n".join(f"[{i + 1}] {doc}" for i, doc in enumerate(documents))
+    prompt = (f"Rate the relevance of each numbered document to the query on a scale from 0 to 10.\n"
+              f"Query: {query}\n\nDocuments:\n{candidates}\n\n"
+              f"Reply with exactly {len(documents)} integers separated by commas, one per document, in order.")
+    return [
+        {"role": "system", "content": "You are a helpful assistant."},
+        {"role": "user", "content": prompt}
+    ]
+
+def _parse_scores(response, count):
+    """Extract one relevance score per candidate from the response; missing scores count as 0."""
+    scores = [int(value) for value in re.findall(r"\d+", response.choices[0].message['content'])]
+    scores = scores[:count]
+    return scores + [0] * (count - len(scores))
+
+def _score_with_llm(query, documents, gpt_model):
     """
-    Re-rank documents based on their relevance to the query using GPT model.
+    Score all candidates against the query with a single GPT call.
 
     Args:
     query (str): The search query.
-    documents (list): List of documents to re-rank.
+    documents (list): Candidate chunk texts.
     gpt_model (str): The name of the GPT model to use.
 
     Returns:
-    str: The most relevant document after re-ranking.
-         Returns the first document or an empty string if an error occurs.
+    list: One relevance score (0-10) per candidate, in input order.
+    """
+    response = chat_completion(_rerank_messages(query, documents), gpt_model,
+                               max_tokens=4 * len(documents) + 10, temperature=0)
+    return _parse_scores(response, len(documents))
+
+async def _ascore_with_llm(query, documents, gpt_model):
+    """Asynchronous version of _score_with_llm."""
+    response = await achat_completion(_rerank_messages(query, documents), gpt_model,
+                                      max_tokens=4 * len(documents) + 10, temperature=0)
+    return _parse_scores(response, len(documents))
+
+def _score_with_cross_encoder(query, documents, ids):
+    """
+    Score candidates with a local cross-encoder, reusing cached (query, chunk id) scores.
+
+    Args:
+    query (str): The search query.
+    documents (list): Candidate chunk texts.
+    ids (list): Chunk ids of the candidates, used as cache keys.
+
+    Returns:
+    list: One relevance score per candidate, in input order.
+    """
+    keys = [(query, chunk_id) for chunk_id in ids]
+    scores = {}
+    with _cross_encoder_cache_lock:
+        for key in keys:
+            if key in _cross_encoder_cache:
+                _cross_encoder_cache.move_to_end(key)
+                scores[key] = _cross_encoder_cache[key]
+    missing = [i for i, key in enumerate(keys) if key not in scores]
+    metrics.increment('cross_encoder_cache.hits', len(keys) - len(missing))
+    metrics.increment('cross_encoder_cache.misses', len(missing))
+    if missing:
+        model = get_cross_encoder()
+        with metrics.timed('rerank.cross_encoder'):
+            new_scores = model.predict([(query, documents[i]) for i in missing])
+        with _cross_encoder_cache_lock:
+            for i, score in zip(missing, new_scores):
+                scores[keys[i]] = _cross_encoder_cache[keys[i]] = float(score)
+                if len(_cross_encoder_cache) > CROSS_ENCODER_CACHE_SIZE:
+                    _cross_encoder_cache.popitem(last=False)
+    return [scores[key] for key in keys]
+
+def _rank(documents, ids, scores, top_k):
+    """Sort candidates by relevance score; ties keep their retrieval order."""
+    order = sorted(range(len(documents)), key=lambda i: scores[i], reverse=True)
+    return [{'index': i, 'id': ids[i], 'document': documents[i], 'score': scores[i]} for i in order[:top_k]]
+
+def _unranked(documents, ids, top_k):
+    """Return the first top_k candidates in retrieval order, used when scoring fails."""
+    return [{'index': i, 'id': ids[i], 'document': documents[i], 'score': None}
+            for i in range(min(top_k, len(documents)))]
+
+def re_rank_documents(query, documents, gpt_model, ids=None, top_k=3, mode='llm'):
+    """
+    Re-rank candidate chunks based on their relevance to the query.
+
+    In 'llm' mode all candidates are scored by the GPT model in a single request.
+    In 'cross-encoder' mode a local cross-encoder scores them on CPU without any API
+    call, and scores are cached per (query, chunk id).
+
+    Args:
+    query (str): The search query.
+    documents (list): Candidate chunk texts, as returned by hybrid_search.
+    gpt_model (str): The name of the GPT model to use in 'llm' mode.
+    ids (list): Chunk ids of the candidates. Defaults to the candidate positions.
+    top_k (int): Number of chunks to return. Defaults to 3.
+    mode (str): Either 'llm' or 'cross-encoder'. Defaults to 'llm'.
+
+    Returns:
+    list: Up to top_k dictionaries with the candidate's 'index' in documents, its 'id',
+          'document' and relevance 'score', most relevant first. If scoring fails the
+          first top_k candidates are returned in retrieval order with a score of None.
+    """
+    if ids is None:
+        ids = [str(i) for i in range(len(documents))]
+    try:
+        if not documents:
+            return []
+        if mode == 'cross-encoder':
+            scores = _score_with_cross_encoder(query, documents, ids)
+        else:
+            scores = _score_with_llm(query, documents, gpt_model)
+        return _rank(documents, ids, scores, top_k)
+    except Exception as e:
+        print(f"Error re-ranking documents: {e}")
+        return _unranked(documents, ids, top_k)
+
+async def are_rank_documents(query, documents, gpt_model, ids=None, top_k=3, mode='llm'):
+    """
+    Asynchronous version of re_rank_documents.
+
+    The cross-encoder runs in the default thread pool so it does not block the event loop.
+
+    Args:
+    query (str): The search query.
+    documents (list): Candidate chunk texts, as returned by hybrid_search.
+    gpt_model (str): The name of the GPT model to use in 'llm' mode.
+    ids (list): Chunk ids of the candidates. Defaults to the candidate positions.
+    top_k (int): Number of chunks to return. Defaults to 3.
+    mode (str): Either 'llm' or 'cross-encoder'. Defaults to 'llm'.
+
+    Returns:
+    list: The same ranked dictionaries as re_rank_documents.
     """
-    import openai
+    if ids is None:
+        ids = [str(i) for i in range(len(documents))]
     try:
-        ranked_documents = []
-        for doc in documents:
-            # Create a prompt for the GPT model to rank document relevance
-            prompt = f"Rank the relevance of the following document to the query:\nQuery: {query}\nDocument: {doc}\nRelevance (0-10):"
-            
-            # Make an API call to OpenAI
-            response = openai.ChatCompletion.create(
-                model=gpt_model,
-                messages=[
-                    {"role": "system", "content": "You are a helpful assistant."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=1  # We only need a single number as response
-            )
-            
-            # Extract the relevance score from the response
-            relevance_score = int(response.choices[0].message['content'].strip())
-            ranked_documents.append((doc, relevance_score))
-        
-        # Sort documents based on relevance score in descending order
-        ranked_documents.sort(key=lambda x: x[1], reverse=True)
-        
-        # Return the most relevant document
-        return ranked_documents[0][0]
+        if not documents:
+            return []
+        if mode == 'cross-encoder':
+            loop = asyncio.get_running_loop()
+            scores = await loop.run_in_executor(None, _score_with_cross_encoder, query, documents, ids)
+        else:
+            scores = await _ascore_with_llm(query, documents, gpt_model)
+        return _rank(documents, ids, scores, top_k)
     except Exception as e:
         print(f"Error re-ranking documents: {e}")
-        return documents[0] if documents else ""
+        return _unranked(documents, ids, top_k)
@@ -0,0 +1,232 @@
+import os
+import json
+import time
+import shutil
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from utils.ingest import ingest_documents
+from utils.embedding import get_embedding_model, close_vector_store
+from utils.search import get_cross_encoder
+from utils.query_engine import answer_query, answer_queries
+from utils.answer_cache import open_answer_cache
+from utils import metrics
+
+class QueryService:
+    """
+    Resident query service holding the embedding model, the index and the answer cache.
+
+    Queries always run against the current vector store. A reload copies the index to a
+    new directory, ingests new or changed PDFs into the copy in a background thread and
+    swaps it in when it is ready, so queries are never blocked by ingestion and never see
+    a half-updated index. The replaced store is closed once its last query has finished,
+    and its directory removed unless it is vector_store_path itself. The directory in use
+    is recorded next to vector_store_path, so a restart picks it up.
+    """
+
+    def __init__(self, config, documents_path):
+        self.config = config
+        self.documents_path = documents_path
+        self.answer_cache = open_answer_cache(config)
+        self._lock = threading.Lock()
+        # Signalled whenever a query stops using a vector store
+        self._released = threading.Condition(self._lock)
+        self._readers = {}
+        self._reload_thread = None
+        self.last_reload_error = None
+        self.index_path = self._active_index_path()
+        self.vector_store = self._build_vector_store(self.index_path)
+        if self.vector_store is None:
+            raise RuntimeError("Could not build the vector store.")
+        # Load the models once, before the first request arrives
+        self.embedding_model = get_embedding_model()
+        if config.get('rerank_mode', 'llm') == 'cross-encoder':
+            get_cross_encoder()
+
+    def _index_paths(self):
+        """Return vector_store_path and the file naming the index directory in use."""
+        base = self.config.get('vector_store_path', './vector_store')
+        return base, base + '.active'
+
+    def _active_index_path(self):
+        """Return the index directory the last reload switched to, or vector_store_path."""
+        base, active_file = self._index_paths()
+        if os.path.exists(active_file):
+            with open(active_file, 'r') as f:
+                path = f.read().strip()
+            if path.startswith(base + '.') and os.path.isdir(path):
+                return path
+        return base
+
+    def _build_vector_store(self, index_path):
+        """Bring the document store and the vector store in index_path up to date with documents_path."""
+        document_store, vector_store = ingest_documents(self.documents_path,
+                                                        dict(self.config, vector_store_path=index_path))
+        document_store.close()
+        return vector_store
+
+    def _acquire(self):
+        """Return the current vector store, registered as read until _release is called."""
+        with self._lock:
+            vector_store = self.vector_store
+            self._readers[id(vector_store)] = self._readers.get(id(vector_store), 0) + 1
+        return vector_store
+
+    def _release(self, vector_store):
+        """Stop reading a vector store returned by _acquire."""
+        with self._lock:
+            self._readers[id(vector_store)] -= 1
+            if not self._readers[id(vector_store)]:
+                del self._readers[id(vector_store)]
+            self._released.notify_all()
+
+    def query(self, query):
+        """Answer one query against the current vector store."""
+        vector_store = self._acquire()
+        try:
+            return answer_query(query, vector_store, self.embedding_model, self.config, self.answer_cache)
+        finally:
+            self._release(vector_store)
+
+    def query_batch(self, queries):
+        """Answer many queries concurrently against the current vector store, in input order."""
+        vector_store = self._acquire()
+        try:
+            return answer_queries(queries, vector_store, self.embedding_model, self.config,
+                                  answer_cache=self.answer_cache)
+        finally:
+            self._release(vector_store)
+
+    def reloading(self):
+        """Return True while a background reload is running."""
+        return self._reload_thread is not None and self._reload_thread.is_alive()
+
+    def reload(self):
+        """
+        Start ingesting new or changed PDFs in the background.
+
+        Returns:
+        bool: False if a reload is already running, True otherwise.
+        """
+        with self._lock:
+            if self.reloading():
+                return False
+            self._reload_thread = threading.Thread(target=self._run_reload, daemon=True)
+            self._reload_thread.start()
+            return True
+
+    def _run_reload(self):
+        """Update a copy of the index and swap it in; queries keep using the old one meanwhile."""
+        try:
+            base, active_file = self._index_paths()
+            # A fresh directory every time: ChromaDB keeps clients of closed paths cached
+            target = f"{base}.{time.time_ns()}"
+            # Only queries read the live index while it is copied
+            with metrics.timed('server.copy_index'):
+                if os.path.exists(self.index_path):
+                    shutil.copytree(self.index_path, target)
+            vector_store = self._build_vector_store(target)
+            if vector_store is None:
+                shutil.rmtree(target, ignore_errors=True)
+                raise RuntimeError("Could not build the vector store.")
+            with self._lock:
+                replaced, replaced_path = self.vector_store, self.index_path
+                self.vector_store, self.index_path = vector_store, target
+                self.last_reload_error = None
+            with open(active_file + '.tmp', 'w') as f:
+                f.write(target)
+            os.replace(active_file + '.tmp', active_file)
+            with self._lock:
+                self._released.wait_for(lambda: id(replaced) not in self._readers)
+            close_vector_store(replaced)
+            if replaced_path != base:
+                shutil.rmtree(replaced_path, ignore_errors=True)
+        except Exception as e:
+            print(f"Error reloading documents: {e}")
+            self.last_reload_error = str(e)
+
+    def status(self):
+        """Return the service status, including the answer cache counters."""
+        return {
+            'status': 'ok',
+            'reloading': self.reloading(),
+            'last_reload_error': self.last_reload_error,
+            'answer_cache': self.answer_cache.stats() if self.answer_cache is not None else None
+        }
+
+class QueryRequestHandler(BaseHTTPRequestHandler):
+    """
+    JSON HTTP API around a QueryService.
+
+    GET  /health  service status and cache counters
+    GET  /metrics per-stage latency histograms and counters
+    POST /query   {"query": "..."} or {"queries": ["...", ...]}
+    POST /reload  ingest new or changed PDFs in the background
+    """
+
+    service = None
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length', 0))
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._send_json(200, self.service.status())
+        elif self.path == '/metrics':
+            self._send_json(200, metrics.snapshot())
+        else:
+            self._send_json(404, {'error': 'Not found'})
+
+    def do_POST(self):
+        try:
+            if self.path == '/query':
+                request = self._read_json()
+                if 'queries' in request:
+                    self._send_json(200, {'results': self.service.query_batch(request['queries'])})
+                elif 'query' in request:
+                    self._send_json(200, self.service.query(request['query']))
+                else:
+                    self._send_json(400, {'error': "Expected 'query' or 'queries'."})
+            elif self.path == '/reload':
+                started = self.service.reload()
+                self._send_json(202 if started else 409, {'reloading': True, 'started': started})
+            else:
+                self._send_json(404, {'error': 'Not found'})
+        except json.JSONDecodeError:
+            self._send_json(400, {'error': 'Invalid JSON.'})
+        except Exception as e:
+            print(f"Error handling request {self.path}: {e}")
+            self._send_json(500, {'error': str(e)})
+
+def serve(config, documents_path, host='127.0.0.1', port=8000):
+    """
+    Run the query server until interrupted.
+
+    The embedding model and index are loaded once at startup; each request is handled in
+    its own thread.
+
+    Args:
+    config (dict): A dictionary containing configuration settings.
+    documents_path (str): Path to the directory containing PDF files.
+    host (str): Interface to listen on. Defaults to '127.0.0.1'.
+    port (int): Port to listen on. Defaults to 8000.
+    """
+    QueryRequestHandler.service = QueryService(config, documents_path)
+    server = ThreadingHTTPServer((host, port), QueryRequestHandler)
+    print(f"DocQA server listening on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if QueryRequestHandler.service.answer_cache is not None:
+            QueryRequestHandler.service.answer_cache.close()
@@ -0,0 +1,311 @@
+import os
+import json
+import sqlite3
+import threading
+
+VECTOR_BACKENDS = ('chroma', 'numpy')
+QUANTIZATIONS = ('float32', 'float16', 'int8')
+
+# Rows scored per matrix product; small enough for the float32 working copy of a
+# quantized block to stay in the CPU cache
+BLOCK_ROWS = 16384
+# SQLite limits the number of parameters of a single statement
+_SQL_BATCH = 500
+
+class NumpyVectorIndex:
+    """
+    Local chunk index with the embeddings in a memory-mapped NumPy matrix.
+
+    Implements the part of the ChromaDB collection API this project uses (upsert, update,
+    get, delete, query, count and metadata), so it can be used wherever a collection is.
+    Embeddings are L2-normalized and stored as float32, float16 or int8 with one scale
+    per row, which cuts the index to a half or a quarter of its float32 size. Queries
+    score all rows with blocked matrix products, any number of queries at once, and
+    return cosine distances like a ChromaDB collection with "hnsw:space" set to cosine.
+
+    The chunk ids, texts and metadata are kept in a SQLite table next to the matrix;
+    rows of deleted chunks are reused by later upserts.
+    """
+
+    # Embeddings can be passed as a NumPy array instead of nested lists
+    accepts_arrays = True
+
+    def __init__(self, path, metadata=None):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(os.path.join(path, 'chunks.sqlite'), check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "row INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, doc_hash TEXT, document TEXT, metadata TEXT)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS chunks_doc_hash ON chunks (doc_hash)")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT)")
+        self._connection.commit()
+        stored = self._connection.execute("SELECT value FROM settings WHERE key = 'metadata'").fetchone()
+        if stored is None:
+            self._set_metadata(metadata or {})
+        else:
+            self.metadata = json.loads(stored[0])
+        if self.quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown vector quantization '{self.quantization}', expected one of {QUANTIZATIONS}.")
+        self._load_vectors()
+
+    @property
+    def quantization(self):
+        """The storage type of the embeddings: 'float32', 'float16' or 'int8'."""
+        return self.metadata.get('quantization', 'float32')
+
+    def _set_metadata(self, metadata):
+        """Store the collection metadata."""
+        self.metadata = dict(metadata)
+        with self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO settings (key, value) VALUES ('metadata', ?)",
+                                     (json.dumps(self.metadata),))
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _load_vectors(self):
+        """Memory-map the embedding matrix and mark the rows that hold a chunk."""
+        import numpy as np
+
+        self._vectors = self._scales = None
+        if os.path.exists(self._file('vectors.npy')):
+            self._vectors = np.load(self._file('vectors.npy'), mmap_mode='r+')
+            if self.quantization == 'int8':
+                self._scales = np.load(self._file('scales.npy'), mmap_mode='r+')
+        self._live = np.zeros(0 if self._vectors is None else len(self._vectors), dtype=bool)
+        rows = [row for (row,) in self._connection.execute("SELECT row FROM chunks")]
+        self._live[rows] = True
+
+    def _ensure_capacity(self, row_count, dimension):
+        """Grow the matrix (by doubling) so that it has at least row_count rows."""
+        import numpy as np
+
+        capacity = len(self._live)
+        if row_count <= capacity:
+            return
+        capacity = max(row_count, 2 * capacity, 1024)
+        dtype = np.int8 if self.quantization == 'int8' else np.dtype(self.quantization)
+        files = [('vectors.npy', dtype, (capacity, dimension), self._vectors)]
+        if self.quantization == 'int8':
+            files.append(('scales.npy', np.float32, (capacity,), self._scales))
+        grown = []
+        for name, file_dtype, shape, current in files:
+            array = np.lib.format.open_memmap(self._file(name + '.tmp'), mode='w+', dtype=file_dtype, shape=shape)
+            if current is not None:
+                array[:len(current)] = current
+            array.flush()
+            os.replace(self._file(name + '.tmp'), self._file(name))
+            grown.append(array)
+        self._vectors = grown[0]
+        self._scales = grown[1] if len(grown) > 1 else None
+        self._live = np.concatenate([self._live, np.zeros(capacity - len(self._live), dtype=bool)])
+
+    def _quantize(self, embeddings):
+        """Normalize embeddings and convert them to the storage type, with per-row scales for int8."""
+        import numpy as np
+
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        if self.quantization == 'int8':
+            scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127.0
+            return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+        return vectors.astype(self.quantization), None
+
+    def _rows(self, ids=None, where=None):
+        """Return (row, id, document, metadata) tuples matching the ids and/or where filter."""
+        where = dict(where or {})
+        doc_hash = where.pop('doc_hash', None)
+        clauses, params = [], []
+        if doc_hash is not None:
+            clauses.append("doc_hash = ?")
+            params.append(doc_hash)
+        query = "SELECT row, id, document, metadata FROM chunks"
+        if ids is None:
+            batches = [None]
+        else:
+            ids = list(ids)
+            batches = [ids[start:start + _SQL_BATCH] for start in range(0, len(ids), _SQL_BATCH)]
+        rows = []
+        for batch in batches:
+            batch_clauses = list(clauses)
+            batch_params = list(params)
+            if batch is not None:
+                if not batch:
+                    continue
+                batch_clauses.append(f"id IN ({','.join('?' * len(batch))})")
+                batch_params.extend(batch)
+            sql = query + (" WHERE " + " AND ".join(batch_clauses) if batch_clauses else "")
+            rows.extend(self._connection.execute(sql, batch_params).fetchall())
+        if where:
+            # Filters on other metadata fields are applied after loading the rows
+            rows = [row for row in rows if all(json.loads(row[3]).get(key) == value for key, value in where.items())]
+        return rows
+
+    def count(self):
+        """Return the number of chunks in the index."""
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        """
+        Insert chunks, or replace the chunks that already have these ids.
+
+        Args:
+        ids (list): Chunk ids.
+        embeddings: One embedding per chunk, as a NumPy array or nested lists.
+        documents (list): Chunk texts.
+        metadatas (list): Chunk metadata dictionaries.
+        """
+        import numpy as np
+
+        vectors, scales = self._quantize(embeddings)
+        with self._lock:
+            existing = {chunk_id: row for row, chunk_id, _, _ in self._rows(ids)}
+            new_count = sum(1 for chunk_id in set(ids) if chunk_id not in existing)
+            self._ensure_capacity(int(self._live.sum()) + new_count, vectors.shape[1])
+            free_rows = iter(np.flatnonzero(~self._live).tolist())
+            rows = []
+            for chunk_id in ids:
+                if chunk_id not in existing:
+                    existing[chunk_id] = next(free_rows)
+                rows.append(existing[chunk_id])
+            # Vectors are written before the rows that point at them are committed
+            self._vectors[rows] = vectors
+            if scales is not None:
+                self._scales[rows] = scales
+            self._vectors.flush()
+            if scales is not None:
+                self._scales.flush()
+            with self._connection:
+                self._connection.executemany(
+                    "INSERT OR REPLACE INTO chunks (row, id, doc_hash, document, metadata) VALUES (?, ?, ?, ?, ?)",
+                    [(row, chunk_id, (metadata or {}).get('doc_hash'), document, json.dumps(metadata or {}))
+                     for row, chunk_id, document, metadata in zip(rows, ids, documents, metadatas)])
+            self._live[rows] = True
+
+    def update(self, ids, metadatas):
+        """
+        Replace the metadata of existing chunks; their embeddings and texts are kept.
+
+        Args:
+        ids (list): Chunk ids.
+        metadatas (list): The new metadata dictionaries.
+        """
+        with self._lock:
+            with self._connection:
+                self._connection.executemany(
+                    "UPDATE chunks SET doc_hash = ?, metadata = ? WHERE id = ?",
+                    [((metadata or {}).get('doc_hash'), json.dumps(metadata or {}), chunk_id)
+                     for chunk_id, metadata in zip(ids, metadatas)])
+
+    def get(self, ids=None, where=None, include=('documents', 'metadatas')):
+        """
+        Load chunks by id and/or metadata filter.
+
+        Args:
+        ids (list): Chunk ids. All chunks if None.
+        where (dict): Metadata fields the chunks must have, e.g. {'doc_hash': ...}.
+        include (list): Which of 'documents' and 'metadatas' to return.
+
+        Returns:
+        dict: 'ids', 'documents' and 'metadatas' lists (None when not included).
+        """
+        with self._lock:
+            rows = self._rows(ids, where)
+        return {
+            'ids': [chunk_id for _, chunk_id, _, _ in rows],
+            'documents': [document for _, _, document, _ in rows] if 'documents' in include else None,
+            'metadatas': [json.loads(metadata) for _, _, _, metadata in rows] if 'metadatas' in include else None
+        }
+
+    def delete(self, ids=None, where=None):
+        """Remove chunks by id and/or metadata filter; their rows are reused by later upserts."""
+        with self._lock:
+            rows = [row for row, _, _, _ in self._rows(ids, where)]
+            with self._connection:
+                self._connection.executemany("DELETE FROM chunks WHERE row = ?", [(row,) for row in rows])
+            self._live[rows] = False
+
+    def query(self, query_embeddings, n_results=10, include=('documents', 'metadatas', 'distances')):
+        """
+        Find the nearest chunks of one or more query embeddings.
+
+        Args:
+        query_embeddings: One embedding per query, as a NumPy array or nested lists.
+        n_results (int): Number of chunks to return per query. Defaults to 10.
+        include (list): Which of 'documents', 'metadatas' and 'distances' to return.
+
+        Returns:
+        dict: 'ids', 'documents', 'metadatas' and 'distances', each a list with one list
+              per query, nearest chunk first. Distances are cosine distances.
+        """
+        import numpy as np
+
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        with self._lock:
+            best_scores = np.empty((len(queries), 0), dtype=np.float32)
+            best_rows = np.empty((len(queries), 0), dtype=np.int64)
+            live_rows = np.flatnonzero(self._live)
+            # Rows past the last chunk have never been written
+            used = int(live_rows[-1]) + 1 if len(live_rows) else 0
+            for start in range(0, used, BLOCK_ROWS):
+                end = min(start + BLOCK_ROWS, used)
+                live = self._live[start:end]
+                if not live.any():
+                    continue
+                # float32 rows are used in place, quantized rows are widened block by block
+                scores = queries @ np.asarray(self._vectors[start:end], dtype=np.float32).T
+                if self._scales is not None:
+                    scores *= self._scales[start:end]
+                scores[:, ~live] = -np.inf
+                best_scores = np.concatenate([best_scores, scores], axis=1)
+                best_rows = np.concatenate([best_rows, np.broadcast_to(np.arange(start, end), scores.shape)], axis=1)
+                # Keep only the running top n_results of every query
+                if best_scores.shape[1] > n_results:
+                    top = np.argpartition(-best_scores, n_results - 1, axis=1)[:, :n_results]
+                    best_scores = np.take_along_axis(best_scores, top, axis=1)
+                    best_rows = np.take_along_axis(best_rows, top, axis=1)
+            order = np.argsort(-best_scores, axis=1)
+            best_scores = np.take_along_axis(best_scores, order, axis=1)
+            best_rows = np.take_along_axis(best_rows, order, axis=1)
+
+            wanted = sorted({int(row) for row, score in zip(best_rows.ravel(), best_scores.ravel()) if score > -np.inf})
+            chunks = {}
+            for start in range(0, len(wanted), _SQL_BATCH):
+                batch = wanted[start:start + _SQL_BATCH]
+                for row, chunk_id, document, metadata in self._connection.execute(
+                        f"SELECT row, id, document, metadata FROM chunks WHERE row IN ({','.join('?' * len(batch))})",
+                        batch):
+                    chunks[row] = (chunk_id, document, metadata)
+
+        results = {'ids': [], 'documents': [], 'metadatas': [], 'distances': []}
+        for query_rows, query_scores in zip(best_rows.tolist(), best_scores.tolist()):
+            hits = [(chunks[row], score) for row, score in zip(query_rows, query_scores) if row in chunks]
+            results['ids'].append([chunk[0] for chunk, _ in hits])
+            results['documents'].append([chunk[1] for chunk, _ in hits])
+            results['metadatas'].append([json.loads(chunk[2]) for chunk, _ in hits])
+            results['distances'].append([1.0 - score for _, score in hits])
+        return {key: (value if key == 'ids' or key in include else None) for key, value in results.items()}
+
+    def reset(self, metadata):
+        """Remove every chunk and the embedding matrix, and store new collection metadata."""
+        with self._lock:
+            with self._connection:
+                self._connection.execute("DELETE FROM chunks")
+            self._vectors = self._scales = None
+            for name in ('vectors.npy', 'scales.npy'):
+                if os.path.exists(self._file(name)):
+                    os.remove(self._file(name))
+            self._set_metadata(metadata)
+            self._load_vectors()
+
+    def close(self):
+        """Flush the matrix and close the database connection."""
+        with self._lock:
+            if self._vectors is not None:
+                self._vectors.flush()
+            self._connection.close()